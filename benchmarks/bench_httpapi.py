@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Compare the async server against gunicorn sync workers (httpapi
+# --server async|gunicorn) under many concurrent keep-alive clients.
+#
+# The app mimics an applet GET: a blocking call (D-Bus, SQLite) of
+# --latency ms and a small JSON response. With --async it mimics an async
+# applet instead, awaited on the loop by the async server (see
+# hkserver.Deferred). Reports throughput, latency percentiles and total
+# RSS of the server processes.
+#
+# Usage: PYTHONPATH=. python3 benchmarks/bench_httpapi.py \
+#            [--clients N] [--requests N] [--latency MS] [--workers N] \
+#            [--async]
+
+
+from housekeeper.lib import (
+    hkrunstats,
+    hkserver
+)
+
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+LATENCY = float(os.environ.get('HK_BENCH_LATENCY', '10')) / 1000
+ASYNC = os.environ.get('HK_BENCH_ASYNC') == '1'
+
+
+def app(environ, start_response):
+    data = json.dumps({'result': {'state': 'playing', 'volume': 5}})
+    data = data.encode('utf-8')
+    headers = [('Content-Type', 'application/json'),
+               ('Content-Length', str(len(data)))]
+
+    if ASYNC and environ.get('hkserver.defer'):
+        async def respond():
+            await asyncio.sleep(LATENCY)
+            return ('200 OK', headers, [data])
+
+        start_response('200 OK', [])
+        return hkserver.Deferred(respond())
+
+    # Other servers (and sync applets) block a worker
+    time.sleep(LATENCY)
+    start_response('200 OK', headers)
+    return [data]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(pid):
+    """
+    RSS in bytes of pid and its children.
+    """
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open('/proc/{}/statm'.format(pid)) as fh:
+                total += int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+            with open('/proc/{}/task/{}/children'.format(pid, pid)) as fh:
+                pids.extend(int(x) for x in fh.read().split())
+
+        except (OSError, ValueError):
+            pass
+
+    return total
+
+
+def start_server(mode, port, args):
+    env = dict(os.environ,
+               PYTHONPATH=ROOT,
+               HK_BENCH_LATENCY=str(args.latency),
+               HK_BENCH_ASYNC='1' if args.use_async else '0')
+
+    if mode == 'async':
+        argv = [sys.executable, os.path.realpath(__file__),
+                '--serve', str(port), '--threads', str(args.threads)]
+    else:
+        argv = [sys.executable, '-m', 'gunicorn',
+                '--bind', '127.0.0.1:{}'.format(port),
+                '--workers', str(args.workers),
+                '--timeout', '0',
+                '--log-level', 'warning',
+                '--chdir', ROOT,
+                'benchmarks.bench_httpapi:app']
+
+    proc = subprocess.Popen(argv, env=env)
+    for dummy in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+
+    proc.kill()
+    raise RuntimeError("Server didn't start: " + ' '.join(argv))
+
+
+async def client(port, n_requests, latencies):
+    request = (b'GET /music/ HTTP/1.1\r\n'
+               b'Host: localhost\r\n'
+               b'Accept: application/json\r\n\r\n')
+    reader = writer = None
+
+    for dummy in range(n_requests):
+        if writer is None:
+            (reader, writer) = await asyncio.open_connection('127.0.0.1',
+                                                             port)
+
+        t0 = time.perf_counter()
+        writer.write(request)
+        head = await reader.readuntil(b'\r\n\r\n')
+        headers = head.decode('latin-1').lower()
+
+        length = 0
+        for line in headers.split('\r\n'):
+            if line.startswith('content-length:'):
+                length = int(line.split(':')[1])
+
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - t0)
+
+        # gunicorn sync workers don't do keep-alive
+        if 'connection: close' in headers:
+            writer.close()
+            reader = writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, n_clients, n_requests, pid):
+    latencies = []
+    rss = []
+
+    async def sample():
+        while True:
+            rss.append(process_tree_rss(pid))
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.ensure_future(sample())
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(port, n_requests, latencies)
+                           for dummy in range(n_clients)])
+    elapsed = time.perf_counter() - t0
+    sampler.cancel()
+
+    return (elapsed, latencies, max(rss))
+
+
+def bench(mode, args):
+    port = free_port()
+    proc = start_server(mode, port, args)
+    try:
+        (elapsed, latencies, rss) = asyncio.run(
+            load(port, args.clients, args.requests, proc.pid))
+
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print("{mode:<10} {rps:>10.1f} {p50:>10.1f} {p99:>10.1f} "
+          "{rss:>10.1f}".format(
+              mode=mode,
+              rps=len(latencies) / elapsed,
+              p50=hkrunstats.percentile(latencies, 50) * 1000,
+              p99=hkrunstats.percentile(latencies, 99) * 1000,
+              rss=rss / 1024 / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20,
+                        help='Requests per client')
+    parser.add_argument('--latency', type=float, default=10,
+                        help='Blocking time of each request in ms')
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count() * 2 + 1)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Async applet instead of a blocking one')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        hkserver.Server(app, port=args.serve,
+                        threads=args.threads).serve_forever()
+        return
+
+    print("{} clients x {} requests, {}ms {} per request".format(
+        args.clients, args.requests, args.latency,
+        'awaiting' if args.use_async else 'blocking'))
+    print("{:<10} {:>10} {:>10} {:>10} {:>10}".format(
+        'server', 'req/s', 'p50 ms', 'p99 ms', 'RSS MiB'))
+
+    bench('async', args)
+    try:
+        import gunicorn  # noqa
+    except ImportError:
+        print("gunicorn     not installed, skipped")
+    else:
+        bench('gunicorn', args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Compare cold (YAML parsing) and warm (snapshot) settings load.
+#
+# Usage: PYTHONPATH=. python3 benchmarks/bench_settings.py \
+#            [--entries N] [--rounds N]
+
+
+from housekeeper import kit
+
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+import yaml
+
+
+def build_config(n_entries):
+    return {
+        'log-level': 'WARNING',
+        'plugin': {
+            name: {'enabled': True}
+            for name in ('httpapi', 'music', 'mpris2', 'sync', 'archiver')
+        },
+        'archive': [
+            {
+                'source': '~/Sync/Source {}'.format(i),
+                'destination': '~/Sync/Source {} (Archive)'.format(i),
+                'delta': '{}w'.format(1 + i % 8),
+                'dry_run': bool(i % 2)
+            }
+            for i in range(n_entries)
+        ],
+        'syncs': {
+            'sync-{}'.format(i): {
+                'generator': {'name': 'banshee', 'playlist': 'P{}'.format(i)},
+                'source': '~/Music/',
+                'destination': '/media/player-{}/'.format(i),
+                'hardlink': False,
+                'exclude': ['*.tmp', '.sync']
+            }
+            for i in range(n_entries)
+        },
+        'plugins': {
+            'sync': {
+                'exclude': ['.sync', '.git']
+            }
+        }
+    }
+
+
+def measure(fn, rounds):
+    timings = []
+    for dummy in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='hk-bench-settings-')
+    try:
+        configfile = os.path.join(tmpdir, 'housekeeper.yml')
+        snapshot_dir = os.path.join(tmpdir, 'snapshots')
+
+        with open(configfile, 'w') as fh:
+            yaml.dump(build_config(args.entries), fh)
+
+        def cold():
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            kit.YAMLStore().load_file(configfile, snapshot_dir=snapshot_dir)
+
+        def warm():
+            kit.YAMLStore().load_file(configfile, snapshot_dir=snapshot_dir)
+
+        def plain():
+            kit.YAMLStore().load_file(configfile)
+
+        warm()  # Ensure snapshot exists
+        results = [
+            ('plain (no snapshot)', measure(plain, args.rounds)),
+            ('cold (parse + write snapshot)', measure(cold, args.rounds)),
+            ('warm (snapshot)', measure(warm, args.rounds)),
+        ]
+
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("config: {} bytes, {} archive + {} sync entries".format(
+        len(yaml.dump(build_config(args.entries))),
+        args.entries, args.entries))
+    for (name, t) in results:
+        print("{name:<32} {ms:>10.3f} ms".format(name=name, ms=t * 1000))
+
+    print("speedup: {:.1f}x".format(results[0][1] / results[2][1]))
+
+
+if __name__ == '__main__':
+    main()
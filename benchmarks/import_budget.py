@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Import time and memory budget for entry points and plugins.
+#
+# Each module is imported in a fresh interpreter and its import time and
+# RSS growth are compared against the budget recorded in
+# benchmarks/import_budget.json. Exit status is non-zero if some module
+# exceeds its budget by more than the allowed margin or has no budget
+# recorded (new modules must be added with --update).
+#
+# Modules whose third-party dependencies (appkit, falcon, dbus...) aren't
+# installed are skipped, unless --require-all is given. Budgets must be
+# recorded where all of them are.
+#
+# Entry points must not import the heavy helper modules in DEFERRED
+# (asyncio, sqlite3, ctypes, urllib.request...), these are imported by
+# the functions using them.
+#
+# Usage:
+#   python3 benchmarks/import_budget.py              # check
+#   python3 benchmarks/import_budget.py --update     # record new baseline
+#   python3 benchmarks/import_budget.py --margin 0.5 housekeeper.core
+
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'import_budget.json')
+ENTRY_POINTS = [
+    'housekeeper.daemon',
+    'housekeeper.kit',
+    'housekeeper.core',
+]
+DEFERRED = [
+    'housekeeper.lib.hkasync',
+    'housekeeper.lib.hkexecutor',
+    'housekeeper.lib.hkfingerprint',
+    'housekeeper.lib.hkhttp',
+    'housekeeper.lib.hkpriority',
+    'housekeeper.lib.hkserver',
+    'housekeeper.lib.hkstate',
+]
+
+_PROBE = '''
+import importlib, json, resource, sys, time
+
+def rss_kb():
+    with open('/proc/self/status') as fh:
+        for line in fh:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+rss0 = rss_kb()
+t0 = time.perf_counter_ns()
+error = missing = None
+try:
+    importlib.import_module(sys.argv[1])
+except Exception as e:
+    error = '{}: {}'.format(e.__class__.__name__, e)
+    if (isinstance(e, ModuleNotFoundError) and e.name and
+            e.name.split('.')[0] != 'housekeeper'):
+        missing = e.name
+t1 = time.perf_counter_ns()
+
+print(json.dumps({
+    'import_ms': (t1 - t0) / 1e6,
+    'rss_kb': rss_kb() - rss0,
+    'error': error,
+    'missing': missing,
+    'deferred': [x for x in sys.argv[2:] if x in sys.modules]
+}))
+'''
+
+
+def discover_modules():
+    pluginpath = os.path.join(ROOT, 'housekeeper', 'plugins')
+    plugins = []
+    for entry in sorted(os.listdir(pluginpath)):
+        if entry.startswith(('_', '.')):
+            continue
+
+        if entry.endswith('.py'):
+            plugins.append(entry[:-3])
+
+        elif os.path.isfile(os.path.join(pluginpath, entry, '__init__.py')):
+            plugins.append(entry)
+
+    libpath = os.path.join(ROOT, 'housekeeper', 'lib')
+    libs = sorted(x[:-3] for x in os.listdir(libpath)
+                  if x.endswith('.py') and not x.startswith('_'))
+
+    return (ENTRY_POINTS +
+            ['housekeeper.lib.' + x for x in libs] +
+            ['housekeeper.plugins.' + x for x in plugins])
+
+
+def measure(module, rounds):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [x for x in env.get('PYTHONPATH', '').split(os.pathsep)
+                  if x])
+
+    samples = []
+    for dummy in range(rounds):
+        # -S is not used, site imports are part of any real invocation
+        deferred = DEFERRED if module in ENTRY_POINTS else []
+        output = subprocess.check_output(
+            [sys.executable, '-c', _PROBE, module] + deferred,
+            env=env, cwd=ROOT)
+        samples.append(json.loads(output.decode('utf-8')))
+
+    samples.sort(key=lambda x: x['import_ms'])
+    ret = samples[len(samples) // 2]
+    ret['rss_kb'] = max(x['rss_kb'] for x in samples)
+
+    return ret
+
+
+def load_baseline(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+
+    except FileNotFoundError:
+        return {}
+
+
+def check(module, result, budget, margin, slack_ms, slack_kb):
+    problems = []
+
+    max_ms = budget['import_ms'] * (1 + margin) + slack_ms
+    if result['import_ms'] > max_ms:
+        problems.append('import {:.1f} ms > {:.1f} ms'.format(
+            result['import_ms'], max_ms))
+
+    max_kb = budget['rss_kb'] * (1 + margin) + slack_kb
+    if result['rss_kb'] > max_kb:
+        problems.append('rss +{} KiB > {:.0f} KiB'.format(
+            result['rss_kb'], max_kb))
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update', action='store_true',
+                        help='Record measurements as new budgets')
+    parser.add_argument('--margin', type=float, default=0.25,
+                        help='Allowed relative excess over budget')
+    parser.add_argument('--slack-ms', type=float, default=5.0,
+                        help='Allowed absolute excess in ms (noise)')
+    parser.add_argument('--slack-kb', type=int, default=512,
+                        help='Allowed absolute excess in KiB (noise)')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--allow-errors', action='store_true',
+                        help="Don't fail on modules that can't be imported")
+    parser.add_argument('--allow-missing', action='store_true',
+                        help="Don't fail on modules without budget")
+    parser.add_argument('--require-all', action='store_true',
+                        help="Fail on modules with dependencies not "
+                             "installed")
+    args = parser.parse_args()
+
+    modules = args.modules or discover_modules()
+    baseline = load_baseline(args.baseline)
+
+    failed = False
+    results = {}
+
+    print('{:<48} {:>10} {:>10}  {}'.format(
+        'module', 'ms', 'rss KiB', 'status'))
+
+    for module in modules:
+        result = measure(module, args.rounds)
+        results[module] = result
+
+        if result['missing'] and not args.require_all:
+            status = 'SKIPPED: {} not installed'.format(result['missing'])
+
+        elif result['error']:
+            status = 'ERROR ' + result['error']
+            failed = failed or not args.allow_errors
+
+        elif result['deferred']:
+            status = 'EAGER: ' + ', '.join(result['deferred'])
+            failed = True
+
+        elif args.update:
+            status = 'recorded'
+
+        elif module not in baseline:
+            status = 'NO BUDGET'
+            failed = failed or not args.allow_missing
+
+        else:
+            problems = check(module, result, baseline[module],
+                             args.margin, args.slack_ms, args.slack_kb)
+            status = 'OVER: ' + ', '.join(problems) if problems else 'ok'
+            failed = failed or bool(problems)
+
+        print('{:<48} {:>10.1f} {:>10}  {}'.format(
+            module, result['import_ms'], result['rss_kb'], status))
+
+    if args.update:
+        for (module, result) in results.items():
+            if result['error']:
+                continue
+
+            baseline[module] = {
+                'import_ms': round(result['import_ms'], 3),
+                'rss_kb': result['rss_kb']
+            }
+
+        with open(args.baseline, 'w') as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+
+        return 0
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,8 +19,50 @@
 # USA.
 
 
-from housekeeper import core
+import sys
+
+
+from housekeeper import daemon
+from housekeeper.lib import hkprofile
+
+
+def profiler_from_argv(argv):
+    enabled = '--profile-startup' in argv
+    format = 'table'
+
+    for (idx, arg) in enumerate(argv):
+        if arg == '--profile-format' and idx + 1 < len(argv):
+            format = argv[idx + 1]
+        elif arg.startswith('--profile-format='):
+            format = arg.split('=', 1)[1]
+
+    return hkprofile.StartupProfiler(enabled=enabled), format
+
+
+def main():
+    # Profiler must be ready before importing core to account its imports
+    profiler, format = profiler_from_argv(sys.argv[1:])
+
+    # Forward to a running daemon if any
+    if not profiler.enabled:
+        ret = daemon.run_client(sys.argv[1:])
+        if ret is not None:
+            sys.exit(ret)
+
+    profiler.install_import_hook()
+
+    with profiler.phase('import:housekeeper.core'):
+        from housekeeper import core
+
+    try:
+        app = core.Core(profiler=profiler)
+        return app.execute_from_command_line()
+
+    finally:
+        profiler.uninstall_import_hook()
+        if profiler.enabled:
+            print(profiler.report(format=format), file=sys.stderr)
+
 
 if __name__ == '__main__':
-    core = core.Core()
-    core.execute_from_command_line()
+    main()
@@ -19,18 +19,28 @@
 
 
 from housekeeper import kit
+from housekeeper.lib import (
+    hkbatch,
+    hkcache,
+    hkjson,
+    hkprofile,
+    hksettings
+)
 
 
 from os import path
 
 
 import collections
+import concurrent.futures
+import inspect
 import logging
 import json
 import mimetypes
 import os
 import re
 import sys
+import time
 
 
 import falcon
@@ -51,6 +61,15 @@ def user_path(*args, **kwargs):
     return utils.user_path(*args, **kwargs)
 
 
+def _stat_key(filename):
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+
+    return (st.st_mtime_ns, st.st_size)
+
+
 CoreServices = collections.namedtuple('CoreServices', [
     'extension_manager',
     'logger',
@@ -59,12 +78,22 @@ CoreServices = collections.namedtuple('CoreServices', [
 
 
 class Core(services.ApplicationMixin, application.BaseApplication):
-    def __init__(self):
+    def __init__(self, profiler=None):
+        if profiler is None:
+            profiler = hkprofile.StartupProfiler(enabled=False)
+
+        self.profiler = profiler
+
+        with self.profiler.phase('core'):
+            self._init()
+
+    def _init(self):
         # Initialize external modules
         loggertools.setLevel(loggertools.Level.WARNING)
 
         pluginpath = os.path.dirname(os.path.realpath(__file__)) + "/plugins"
-        super().__init__('housekeeper', pluginpath=pluginpath)
+        with self.profiler.phase('application'):
+            super().__init__('housekeeper', pluginpath=pluginpath)
 
         self.commands = kit.CommandManager(self)
         self.cron = kit.CronManager(
@@ -74,54 +103,192 @@ class Core(services.ApplicationMixin, application.BaseApplication):
         self.register_extension_point(kit.AppBridge)
         self.register_extension_point(kit.APIEndpoint)
         self.register_extension_class(kit.CronCommand)
+        self.register_extension_class(kit.DaemonCommand)
+        self.register_extension_class(kit.SchedulerCommand)
+        self.register_extension_class(kit.TasksCommand)
 
         # Read command line
-        app_parser = self.commands.build_base_argument_parser()
-        app_args, dummy = app_parser.parse_known_args(sys.argv[1:])
+        with self.profiler.phase('argparse'):
+            app_parser = self.commands.build_base_argument_parser()
+            app_args, dummy = app_parser.parse_known_args(sys.argv[1:])
+
+        self.app_args = app_args
 
         # Read config files
-        self.settings = kit.YAMLStore()
-        configfiles = [user_path(utils.UserPathType.CONFIG, 'housekeeper.yml')]
-        configfiles.extend(getattr(app_args, 'config-files', []))
-        for cf in configfiles:
+        self.configfiles = [
+            user_path(utils.UserPathType.CONFIG, 'housekeeper.yml')
+        ]
+        self.configfiles.extend(getattr(app_args, 'config-files', []))
+        self._reload_hooks = []
+        self.settings = self.load_settings()
+
+        # Apply command line arguments: debug level
+        with self.profiler.phase('logger'):
+            cf_log_level = self.settings.get('log-level', None)
+            if cf_log_level:
+                try:
+                    level = getattr(logging.Level, cf_log_level, None)
+                    logging.setLevel(level)
+                except AttributeError:
+                    msg = "Invalid «log-level={level}» key in settings"
+                    msg = msg.format(level=cf_log_level)
+                    self.logger.error(msg)
+
+            level = loggertools.getLevel()
+            diff = app_args.verbose - app_args.quiet
+            loggertools.setLevel(loggertools.Level.incr(level, n=diff))
+
+        # Initialize cache
+        with self.profiler.phase('cache'):
+            self.cache = cache.DiskCache(
+                basedir=user_path(utils.UserPathType.CACHE))
+
+        # Load plugins.
+        # Use the plugin manifest to load only the plugin owning the
+        # requested command. Other plugins will be loaded on demand.
+        self.loaded_plugins = set()
+        self.enabled_plugins = self.get_enabled_plugins()
+
+        self.manifest = kit.PluginManifest(
+            pluginpath,
+            cache_file=user_path(utils.UserPathType.CACHE,
+                                 'plugin-manifest.json'),
+            extension_points=[
+                kit.Command, kit.Task, kit.APIEndpoint, kit.AppBridge
+            ],
+            logger=self.logger.getChild('manifest'))
+        with self.profiler.phase('manifest'):
+            self.manifest.load(plugins=self.enabled_plugins)
+
+        command = next((x for x in dummy if not x.startswith('-')), None)
+        owner = (self.manifest.get_owner(kit.Command, command)
+                 if command else None)
+
+        if owner and owner in self.enabled_plugins:
+            self.load_plugin(owner)
+        else:
+            self.load_enabled_plugins()
+
+    def load_settings(self):
+        settings = kit.YAMLStore()
+        snapshot_dir = user_path(utils.UserPathType.CACHE, 'settings')
+
+        self._configfiles_stat = {}
+        for cf in self.configfiles:
+            self._configfiles_stat[cf] = _stat_key(cf)
             try:
-                with open(cf) as fh:
-                    self.settings.load(fh)
+                with self.profiler.phase('config:' + cf):
+                    settings.load_file(cf, snapshot_dir=snapshot_dir)
 
             except FileNotFoundError:
                 msg = "Config file «{path}» not found"
                 msg = msg.format(path=cf)
                 self.logger.warning(msg)
 
-        # Apply command line arguments: debug level
-        cf_log_level = self.settings.get('log-level', None)
-        if cf_log_level:
-            try:
-                level = getattr(logging.Level, cf_log_level, None)
-                logging.setLevel(level)
-            except AttributeError:
-                msg = "Invalid «log-level={level}» key in settings"
-                msg = msg.format(level=cf_log_level)
-                self.logger.error(msg)
+        return settings
 
-        level = loggertools.getLevel()
-        diff = app_args.verbose - app_args.quiet
-        loggertools.setLevel(loggertools.Level.incr(level, n=diff))
+    def settings_changed(self):
+        return any(
+            _stat_key(cf) != stat
+            for (cf, stat) in self._configfiles_stat.items()
+        )
 
-        # Initialize cache
-        self.cache = cache.DiskCache(
-            basedir=user_path(utils.UserPathType.CACHE))
+    def reload_settings(self):
+        """
+        Reload config files applying only differences to current settings.
 
-        # Load plugins
-        for plugin in app_args.plugins:
-            self.load_plugin(plugin)
+        Settings views are notified by the store, extensions that need
+        re-initialization are handled by reload hooks.
+        Returns the set of changed keys.
+        """
+        changed = self.settings.replace(self.load_settings())
+        if not changed:
+            return changed
 
+        msg = "Settings reloaded, changed keys: {keys}"
+        msg = msg.format(keys=', '.join(sorted(changed)))
+        self.logger.info(msg)
+
+        self.enabled_plugins = self.get_enabled_plugins()
+        self.load_enabled_plugins()
+
+        for fn in self._reload_hooks:
+            fn(changed)
+
+        return changed
+
+    def add_reload_hook(self, fn):
+        self._reload_hooks.append(fn)
+
+    def get_enabled_plugins(self):
+        ret = list(self.app_args.plugins)
         for plugin in self.settings.get('plugin', {}):
             key = 'plugin.{}.enabled'.format(plugin)
-            if self.settings.get(key, False):
-                self.load_plugin(plugin)
+            if self.settings.get(key, False) and plugin not in ret:
+                ret.append(plugin)
+
+        return ret
+
+    def extension_affected_by(self, ext, keys):
+        """
+        Check if some of keys affects extension ext.
+
+        Extensions are affected by keys under its SETTINGS_NS or under
+        the plugin.<plugin-name> namespace.
+        """
+        namespaces = []
+
+        ns = getattr(ext, 'SETTINGS_NS', None)
+        if ns:
+            namespaces.append(ns.strip('.'))
+
+        module = ext.__module__.split('.')
+        if module[:2] == ['housekeeper', 'plugins'] and len(module) > 2:
+            namespaces.append('plugin.' + module[2])
+
+        return any(
+            hksettings.key_in_namespace(key, ns)
+            for key in keys
+            for ns in namespaces
+        )
+
+    def load_plugin(self, plugin, *args, **kwargs):
+        if plugin in self.loaded_plugins:
+            return
+
+        with self.profiler.phase('plugin:' + plugin):
+            super().load_plugin(plugin, *args, **kwargs)
+
+        self.loaded_plugins.add(plugin)
+
+    def load_enabled_plugins(self):
+        for plugin in self.enabled_plugins:
+            self.load_plugin(plugin)
+
+    def can_handle_argv(self, argv):
+        """
+        Check if argv can be executed by this (already initialized) core.
+
+        Config files and plugins can't change after initialization.
+        """
+        parser = self.commands.build_base_argument_parser()
+        try:
+            args, dummy = parser.parse_known_args(argv)
+        except SystemExit:
+            return False
+
+        return (
+            getattr(args, 'config-files', []) ==
+            getattr(self.app_args, 'config-files', []) and
+            set(args.plugins) <= set(self.enabled_plugins)
+        )
 
     def get_extension(self, extension_point, name, *args, **kwargs):
+        # Extension may live in a plugin not loaded yet
+        owner = self.manifest.get_owner(extension_point, name)
+        if owner and owner in self.enabled_plugins:
+            self.load_plugin(owner)
+
         msg = "Calling extension «{}.{}::{}» (args={}, kwargs={})"
         msg = msg.format(
             extension_point.__module__,
@@ -141,7 +308,10 @@ class Core(services.ApplicationMixin, application.BaseApplication):
             )
             args = (services,) + tuple(args)
 
-        return super().get_extension(extension_point, name, *args, **kwargs)
+        phase = 'extension:{}::{}'.format(extension_point.__name__, name)
+        with self.profiler.phase(phase):
+            return super().get_extension(extension_point, name, *args,
+                                         **kwargs)
 
     def notify(self, summary, body=None, asset=None, actions=None):
         print("*{}*".format(summary))
@@ -159,22 +329,34 @@ class Core(services.ApplicationMixin, application.BaseApplication):
 
 
 class APIServer(falcon.API):
-    def __init__(self, core, *args, static_folder=None, **kwargs):
+    def __init__(self, core, *args, static_folder=None, watch_config=None,
+                 **kwargs):
         cors = falcon_cors.CORS(
             allow_all_origins=True,
             allow_all_headers=True,
             allow_all_methods=True
         )
         middleware = [cors.middleware, RequireJSON(), JSONTranslator()]   # , cors.middleware]
+        if watch_config:
+            middleware.insert(0, SettingsWatcher(core, watch_config))
+
         super().__init__(*args, middleware=middleware, **kwargs)
 
+        self.core = core
         self.registry = {}
+        self.resources = {}
 
+        core.load_enabled_plugins()
         for (name, ext) in core.get_extensions_for(kit.APIEndpoint):
             self.setup_extension(name, ext)
 
+        core.add_reload_hook(self.reload_extensions)
+
         self.add_route('/', MainResource())
         self.add_route('/_/', IntrospectionResource(self.registry))
+        self.add_route('/_/tasks/', TaskStatsResource(core))
+        self.add_route('/_/cache/', CacheStatsResource(self.registry))
+        self.add_route('/_/batch/', BatchResource(self.registry))
 
         if static_folder:
             sink = StaticSink(static_folder, prefix='/static').on_get
@@ -182,13 +364,109 @@ class APIServer(falcon.API):
 
     def setup_extension(self, name, ext):
         path = '/' + name + '/'
-        self.add_route(path, ext)
         self.registry[name] = ext
+
+        # Routes point to a proxy so extension can be replaced on reload
+        if name in self.resources:
+            self.resources[name].target = ext
+        else:
+            self.resources[name] = ExtensionResource(ext)
+            self.add_route(path, self.resources[name])
+
         print("+ {} {}".format(path, ext))
 
         for (name_, child) in ext.children.items():
             self.setup_extension(name + '/' + name_, child)
 
+    def teardown_extension(self, name):
+        for x in list(self.registry):
+            if x == name or x.startswith(name + '/'):
+                del self.registry[x]
+                self.resources[x].target = None
+
+    def reload_extensions(self, changed):
+        roots = [x for x in self.registry if '/' not in x]
+
+        for name in roots:
+            if not self.core.extension_affected_by(self.registry[name],
+                                                   changed):
+                continue
+
+            msg = "Re-initializing «{name}» endpoint"
+            msg = msg.format(name=name)
+            self.core.logger.info(msg)
+
+            self.teardown_extension(name)
+            try:
+                ext = self.core.get_extension(kit.APIEndpoint, name)
+            except Exception as e:
+                msg = "Unable to re-initialize «{name}»: {e}"
+                msg = msg.format(name=name, e=e)
+                self.core.logger.error(msg)
+                continue
+
+            self.setup_extension(name, ext)
+
+        # Plugins may have been enabled
+        if any(x.startswith('plugin.') and x.endswith('.enabled')
+               for x in changed):
+            for (name, ext) in self.core.get_extensions_for(kit.APIEndpoint):
+                if name not in self.registry:
+                    self.setup_extension(name, ext)
+
+
+class ExtensionResource:
+    """
+    Route target forwarding requests to a replaceable extension.
+    """
+    def __init__(self, target):
+        self.target = target
+
+    def _forward(self, method, req, resp):
+        if self.target is None:
+            resp.status = falcon.HTTP_NOT_FOUND
+            return
+
+        responder = getattr(self.target, 'on_' + method, None)
+        if responder is None:
+            resp.status = falcon.HTTP_METHOD_NOT_ALLOWED
+            return
+
+        responder(req, resp)
+
+    def on_get(self, req, resp):
+        self._forward('get', req, resp)
+
+    def on_post(self, req, resp):
+        self._forward('post', req, resp)
+
+    def on_put(self, req, resp):
+        self._forward('put', req, resp)
+
+    def on_delete(self, req, resp):
+        self._forward('delete', req, resp)
+
+
+class SettingsWatcher:
+    """
+    Middleware reloading settings when config files change.
+
+    Config files are checked at most once every interval seconds.
+    """
+    def __init__(self, core, interval):
+        self.core = core
+        self.interval = interval
+        self.next_check = time.monotonic() + interval
+
+    def process_request(self, req, resp):
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+
+        self.next_check = now + self.interval
+        if self.core.settings_changed():
+            self.core.reload_settings()
+
 
 class MainResource:
     def on_get(self, req, resp):
@@ -208,8 +486,58 @@ class IntrospectionResource:
             in self.reg.items()
         }
 
+
+class TaskStatsResource:
+    def __init__(self, core, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.core = core
+
+    def on_get(self, req, resp):
+        resp.context['result'] = self.core.cron.get_stats()
+
+
+class CacheStatsResource:
+    def __init__(self, reg, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reg = reg
+
+    def on_get(self, req, resp):
+        resp.context['result'] = {
+            name: ext.response_cache.stats()
+            for (name, ext) in self.reg.items()
+            if getattr(ext, 'response_cache', None) is not None
+        }
+
+
+class BatchResource:
+    """
+    Run many API calls in one request (see hkbatch.run).
+
+    Body is a list of {path, method, params}, result is a list (in the
+    same order) of {status, result|error}.
+    """
+    def __init__(self, reg, *args, max_workers=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reg = reg
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='hk-batch')
+
+    def on_post(self, req, resp):
+        try:
+            resp.context['result'] = hkbatch.run(
+                req.context.get('doc'), self.reg.get, self.pool)
+
+        except hkbatch.InvalidBatch as e:
+            raise falcon.HTTPBadRequest('Invalid batch', str(e))
+
+
 class StaticSink:
+    # Seconds file and sidecar stats are trusted for
+    STAT_TTL = 1
+
     def __init__(self, root, *args, prefix='/', **kwargs):
+        from housekeeper.lib import hkhttp
+
         super().__init__(*args, **kwargs)
 
         root = re.subn(r'/*$', '', root)[0]
@@ -218,8 +546,35 @@ class StaticSink:
         self.root = path.realpath(root)
         self.prefix = prefix
         self.mime = mimetypes.MimeTypes()
+        self.cache = hkhttp.FileCache()
+        self.stats = hkcache.TTLCache(self.STAT_TTL)
+
+    def stat(self, fullpath):
+        """
+        Stat result and sidecars (see hkhttp.find_sidecars) of fullpath,
+        None if it doesn't exist.
+        """
+        from housekeeper.lib import hkhttp
+
+        try:
+            st = os.stat(fullpath)
+        except OSError:
+            return None
+
+        return (st, hkhttp.find_sidecars(fullpath, st, root=self.root))
+
+    def changed(self, resp):
+        """
+        File changed after its stat was cached: forget stats and have the
+        client retry rather than send a body not matching the headers.
+        """
+        self.stats.invalidate()
+        resp.status = falcon.HTTP_SERVICE_UNAVAILABLE
+        resp.set_header('Retry-After', '1')
 
     def on_get(self, req, resp):
+        from housekeeper.lib import hkhttp
+
         filename = req.path
         if not filename.startswith(self.prefix):
             resp.status = falcon.HTTP_NOT_FOUND
@@ -229,22 +584,139 @@ class StaticSink:
         fullpath = '{}/{}'.format(self.root, filename)
         fullpath = path.realpath(fullpath)
 
-        if not fullpath.startswith(self.root):
+        if not hkhttp.is_contained(fullpath, self.root):
             resp.status = falcon.HTTP_NOT_FOUND
             return
 
-        try:
-            mime = self.mime.guess_type(fullpath)[0] or 'application/octet-stream'
+        # Only existing files are cached, unknown paths can't fill it
+        found = self.stats.get_or_compute(
+            fullpath, lambda: self.stat(fullpath),
+            cacheable=lambda x: x is not None)
+        if found is None:
+            resp.status = falcon.HTTP_NOT_FOUND
+            return
+
+        (st, sidecars) = found
+        mime = self.mime.guess_type(fullpath)[0] or 'application/octet-stream'
+
+        # Precompressed sidecar if client accepts it
+        (servepath, st, encoding) = hkhttp.select_sidecar(
+            fullpath, st, req.get_header('Accept-Encoding'),
+            sidecars=sidecars)
+
+        etag = hkhttp.make_etag(st)
+
+        resp.content_type = mime
+        resp.set_header('ETag', etag)
+        resp.set_header('Last-Modified', hkhttp.http_date(st.st_mtime))
+        resp.set_header('Accept-Ranges', 'bytes')
+        resp.set_header('Vary', 'Accept-Encoding')
+        if encoding:
+            resp.set_header('Content-Encoding', encoding)
+
+        if hkhttp.is_hashed(fullpath):
+            resp.set_header('Cache-Control', hkhttp.IMMUTABLE)
+        else:
+            resp.set_header('Cache-Control', 'no-cache')
+
+        if hkhttp.not_modified(
+                etag, st.st_mtime,
+                if_none_match=req.get_header('If-None-Match'),
+                if_modified_since=req.get_header('If-Modified-Since')):
+            resp.status = falcon.HTTP_NOT_MODIFIED
+            return
+
+        ranges = None
+        if_range = req.get_header('If-Range')
+        if if_range is None or if_range == etag:
+            try:
+                ranges = hkhttp.parse_range(req.get_header('Range'),
+                                            st.st_size)
+
+            except hkhttp.RangeNotSatisfiable:
+                resp.status = falcon.HTTP_RANGE_NOT_SATISFIABLE
+                resp.set_header('Content-Range',
+                                'bytes */{}'.format(st.st_size))
+                return
+
+        # Small files are served from memory
+        if not ranges and self.cache.cacheable(st):
+            key = self.cache.key(servepath, st)
+            data = self.cache.get(key)
+            if data is None:
+                try:
+                    with open(servepath, 'rb') as fh:
+                        data = fh.read()
+                        fst = os.fstat(fh.fileno())
+                except OSError:
+                    resp.status = falcon.HTTP_NOT_FOUND
+                    return
+
+                if not hkhttp.same_file(st, fst):
+                    self.changed(resp)
+                    return
+
+                self.cache.put(key, data)
+
             resp.status = falcon.HTTP_OK
-            resp.content_type = mime
-            with open(fullpath, 'rb') as f:
-                resp.body = f.read()
+            resp.data = data
+            return
+
+        if ranges and len(ranges) > 1:
+            try:
+                fst = os.stat(servepath)
+            except OSError:
+                resp.status = falcon.HTTP_NOT_FOUND
+                return
+
+            if not hkhttp.same_file(st, fst):
+                self.changed(resp)
+                return
+
+            body = hkhttp.Multipart(servepath, ranges, mime, st.st_size)
+
+            resp.status = falcon.HTTP_PARTIAL_CONTENT
+            resp.content_type = body.content_type
+            resp.stream = iter(body)
+            resp.content_length = len(body)
+            return
 
-        except IOError:
+        try:
+            fh = open(servepath, 'rb')
+        except OSError:
             resp.status = falcon.HTTP_NOT_FOUND
+            return
+
+        if not hkhttp.same_file(st, os.fstat(fh.fileno())):
+            fh.close()
+            self.changed(resp)
+            return
+
+        # File objects are passed to the WSGI server as is so it can use
+        # wsgi.file_wrapper (and sendfile) from the current offset up to
+        # Content-Length
+        if not ranges:
+            resp.status = falcon.HTTP_OK
+            resp.stream = fh
+            resp.content_length = st.st_size
+
+        else:
+            (start, end) = ranges[0]
+            fh.seek(start)
+
+            resp.status = falcon.HTTP_PARTIAL_CONTENT
+            resp.set_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, st.st_size))
+            resp.stream = fh
+            resp.content_length = end - start + 1
 
 
 class JSONTranslator(object):
+    NDJSON = 'application/x-ndjson'
+
+    def __init__(self, encoder=None):
+        (self.encoder, self.dumps) = hkjson.get_encoder(encoder)
+
     def process_request(self, req, resp):
         # req.stream corresponds to the WSGI wsgi.input environ variable,
         # and allows you to read bytes from the request body.
@@ -269,16 +741,74 @@ class JSONTranslator(object):
                                    'JSON was incorrect or not encoded as '
                                    'UTF-8.')
 
+    def encode(self, req, result):
+        """
+        Encode result, returns (content_type, data, stream): data for
+        plain documents, stream for ones with iterators. content_type is
+        None for the default (JSON).
+        """
+        if not hkjson.has_stream(result):
+            return (None, self.dumps(result), None)
+
+        # Iterators (ie. generators) are streamed (chunked) so memory stays
+        # flat, as NDJSON if client prefers it
+        if req.client_prefers(['application/json',
+                               self.NDJSON]) == self.NDJSON:
+            items = result
+            if isinstance(result, dict):
+                items = result.get('result')
+
+            if hkjson.is_stream(items):
+                return (self.NDJSON,
+                        None, hkjson.iterencode_ndjson(items, self.dumps))
+
+        return (None, None, hkjson.iterencode(result, self.dumps))
+
+    async def encode_deferred(self, req, pending):
+        """
+        Wait for the (status, result) of an async applet and encode it,
+        returns a response for hkserver.Deferred.
+        """
+        (status, result) = await pending
+        (content_type, data, stream) = self.encode(req, result)
+
+        headers = []
+        if content_type:
+            headers.append(('Content-Type', content_type))
+
+        if data is not None:
+            headers.append(('Content-Length', str(len(data))))
+            return (status, headers, [data])
+
+        return (status, headers, stream)
+
     def process_response(self, req, resp, resource):
         if 'result' not in resp.context:
             return
 
-        resp.body = json.dumps(resp.context['result'])
+        result = resp.context['result']
+
+        # Async applet under hkserver (see APIEndpoint.handle)
+        if inspect.iscoroutine(result):
+            from housekeeper.lib import hkserver
+
+            resp.stream = hkserver.Deferred(self.encode_deferred(req, result))
+            return
+
+        (content_type, data, stream) = self.encode(req, result)
+        if content_type:
+            resp.content_type = content_type
+
+        if data is not None:
+            resp.data = data
+        else:
+            resp.stream = stream
 
 
 class RequireJSON(object):
     def process_request(self, req, resp):
-        if not req.client_accepts_json:
+        if not (req.client_accepts_json or
+                req.client_accepts(JSONTranslator.NDJSON)):
             raise falcon.HTTPNotAcceptable(
                 'This API only supports responses encoded as JSON.',
                 href='http://docs.examples.com/api/json')
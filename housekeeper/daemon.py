@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+# Resident housekeeper: a warm Core listening on a unix socket.
+#
+# The client sends its stdin, stdout and stderr file descriptors along with
+# argv, cwd and environment. For each request the daemon forks a child from
+# the warm Core, so the command writes directly into client's terminal, and
+# the exit code is sent back when it finishes.
+#
+# This module must not import anything heavy: the client runs on every
+# invocation of housekeeper.
+
+
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import traceback
+
+
+DISABLE_ENV = 'HOUSEKEEPER_NO_DAEMON'
+_HEADER = struct.Struct('!I')
+_UCRED = struct.Struct('3i')
+
+
+def socket_path():
+    """
+    Socket path, None if there is no safe place for it.
+
+    The socket lives in XDG_RUNTIME_DIR, a directory private to the user.
+    """
+    rundir = os.environ.get('XDG_RUNTIME_DIR')
+    if not rundir:
+        return None
+
+    return os.path.join(rundir, 'housekeeper', 'housekeeper.sock')
+
+
+def is_private_dir(path):
+    """
+    Check that path is a real directory (not a symlink) owned by us and
+    inaccessible to anyone else.
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return False
+
+    return (stat.S_ISDIR(st.st_mode) and
+            st.st_uid == os.getuid() and
+            not st.st_mode & 0o077)
+
+
+def peer_uid(sock):
+    """
+    uid of the process at the other end of a unix socket, None if it can't
+    be known.
+    """
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                _UCRED.size)
+    except (AttributeError, OSError):
+        return None
+
+    pid, uid, gid = _UCRED.unpack(creds)
+    return uid
+
+
+def send_message(sock, msg, fds=None):
+    body = json.dumps(msg).encode('utf-8')
+    header = _HEADER.pack(len(body))
+
+    if fds:
+        socket.send_fds(sock, [header], fds)
+    else:
+        sock.sendall(header)
+
+    sock.sendall(body)
+
+
+def recv_message(sock, maxfds=0):
+    if maxfds:
+        header, fds, flags, addr = socket.recv_fds(
+            sock, _HEADER.size, maxfds)
+    else:
+        header, fds = _recv_exactly(sock, _HEADER.size), []
+
+    if len(header) != _HEADER.size:
+        raise EOFError()
+
+    size, = _HEADER.unpack(header)
+    body = _recv_exactly(sock, size)
+
+    return json.loads(body.decode('utf-8')), fds
+
+
+def _recv_exactly(sock, size):
+    buff = b''
+    while len(buff) < size:
+        chunk = sock.recv(size - len(buff))
+        if not chunk:
+            raise EOFError()
+
+        buff += chunk
+
+    return buff
+
+
+def run_client(argv, path=None):
+    """
+    Forward argv to a running daemon.
+
+    Returns the command exit code or None if no daemon can handle it, in
+    that case the command should be run locally.
+    """
+    if os.environ.get(DISABLE_ENV):
+        return None
+
+    if argv and argv[0] == 'daemon':
+        return None
+
+    path = path or socket_path()
+    if not path or not is_private_dir(os.path.dirname(path)):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(path)
+
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+
+    with sock:
+        # Environment and terminal are only handed to ourselves
+        if peer_uid(sock) != os.getuid():
+            return None
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        try:
+            send_message(
+                sock,
+                {
+                    'argv': argv,
+                    'cwd': os.getcwd(),
+                    'env': dict(os.environ)
+                },
+                fds=[0, 1, 2])
+
+            reply, dummy = recv_message(sock)
+
+        except (EOFError, OSError):
+            return None
+
+        if reply.get('status') != 'accepted':
+            return None
+
+        while True:
+            try:
+                reply, dummy = recv_message(sock)
+                return reply['exit']
+
+            except KeyboardInterrupt:
+                os.kill(reply['pid'], signal.SIGINT)
+
+            except (EOFError, OSError):
+                return 1
+
+
+class Daemon:
+    def __init__(self, core, path=None, logger=None, watch_config=2):
+        self.core = core
+        self.path = path or socket_path()
+        self.logger = logger or core.logger.getChild('daemon')
+        self.watch_config = watch_config
+        self._reload_requested = False
+
+    def serve(self):
+        if not self.path:
+            raise RuntimeError("XDG_RUNTIME_DIR is not set, no safe place "
+                               "for the socket")
+
+        rundir = os.path.dirname(self.path)
+        try:
+            os.mkdir(rundir, mode=0o700)
+        except FileExistsError:
+            pass
+
+        if not is_private_dir(rundir):
+            msg = "«{path}» is not a private directory owned by us"
+            msg = msg.format(path=rundir)
+            raise RuntimeError(msg)
+
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+        # Children are never waited, let the kernel reap them
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, self._on_sighup)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+
+        sock.listen(16)
+        sock.settimeout(self.watch_config or None)
+
+        msg = "Listening on {path}"
+        msg = msg.format(path=self.path)
+        self.logger.info(msg)
+
+        try:
+            while True:
+                try:
+                    conn, dummy = sock.accept()
+                except socket.timeout:
+                    self.maybe_reload()
+                    continue
+
+                self.maybe_reload()
+                conn.settimeout(None)
+                with conn:
+                    if peer_uid(conn) != os.getuid():
+                        self.logger.warning("Rejected client from another "
+                                            "user")
+                        continue
+
+                    try:
+                        self.handle(conn)
+                    except (EOFError, OSError) as e:
+                        msg = "Broken client connection: {e}"
+                        msg = msg.format(e=e)
+                        self.logger.warning(msg)
+
+        finally:
+            sock.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _on_sighup(self, signum, frame):
+        self._reload_requested = True
+
+    def maybe_reload(self):
+        if not self._reload_requested and \
+                not (self.watch_config and self.core.settings_changed()):
+            return
+
+        self._reload_requested = False
+        try:
+            self.core.reload_settings()
+        except Exception as e:
+            msg = "Unable to reload settings: {e}"
+            msg = msg.format(e=e)
+            self.logger.error(msg)
+
+    def handle(self, conn):
+        request, fds = recv_message(conn, maxfds=3)
+        try:
+            if len(fds) != 3 or not self.core.can_handle_argv(request['argv']):
+                send_message(conn, {'status': 'rejected'})
+                return
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+            pid = os.fork()
+            if pid == 0:
+                self._run_child(conn, request, fds)
+
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def _run_child(self, conn, request, fds):
+        code = 1
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+            for (target, fd) in enumerate(fds):
+                os.dup2(fd, target)
+
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            sys.argv = [sys.argv[0]] + request['argv']
+
+            send_message(conn, {'status': 'accepted', 'pid': os.getpid()})
+            code = self._execute()
+
+        except BaseException:
+            traceback.print_exc()
+
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                send_message(conn, {'exit': code})
+            finally:
+                os._exit(code)
+
+    def _execute(self):
+        try:
+            self.core.execute_from_command_line()
+            return 0
+
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+
+            print(e.code, file=sys.stderr)
+            return 1
+
+        except KeyboardInterrupt:
+            return 130
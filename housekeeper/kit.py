@@ -18,9 +18,30 @@
 # USA.
 
 
+from housekeeper import daemon
+from housekeeper.lib import (
+    hkcache,
+    hkdatetime,
+    hkjson,
+    hkload,
+    hklock,
+    hkrunstats,
+    hkscheduler,
+    hksettings
+)
+
+
 import abc
 import collections
+import hashlib
+import importlib
+import inspect
+import json
 import os
+import pickle
+import threading
+import time
+import urllib.parse
 
 
 import falcon
@@ -40,10 +61,72 @@ Parameter = application.Parameter
 
 
 Command = commands.Command
-CommandManager = commands.Manager
 
-Task = cron.Task
-CronCommand = cron.Command
+
+def parse_timespan(value):
+    """
+    Settings coercion for timespans (ie. «2h», «30m» or seconds).
+
+    Schemas must use module level functions: views are rebuilt when a
+    schema entry isn't the same object (see YAMLStore.view).
+    """
+    return hkdatetime.parse_timespan(str(value))
+
+
+class CommandManager(commands.Manager):
+    def build_base_argument_parser(self, *args, **kwargs):
+        parser = super().build_base_argument_parser(*args, **kwargs)
+        parser.add_argument(
+            '--profile-startup',
+            action='store_true',
+            help='Report time spent in each startup phase and import')
+        parser.add_argument(
+            '--profile-format',
+            choices=['table', 'json'],
+            default='table',
+            help='Format for the startup profile report')
+
+        return parser
+
+
+class Task(cron.Task):
+    """
+    Periodic task.
+
+    Long running tasks can call checkpoint() with their progress (any
+    JSON-serializable value). If a run is interrupted the next one finds
+    it in self.cursor and can resume from there. After a successful run
+    the cursor is cleared.
+
+    execute() can be a coroutine function, it runs on the shared event loop
+    (see hkasync) along with other async tasks.
+
+    DEPENDS lists names of tasks that must succeed before this one runs
+    when they are due at the same time.
+
+    PRIORITY is the CPU/IO priority class: normal, batch or idle (see
+    hkpriority).
+
+    HEAVY tasks are deferred while the system is loaded or on battery.
+    """
+    DEPENDS = ()
+    PRIORITY = 'normal'
+    HEAVY = False
+    cursor = None
+    _checkpointer = None
+
+    def inputs(self, core):
+        """
+        List of hkfingerprint.Input this task reads. If none of them
+        changed since the last successful run, the run is skipped.
+        None (the default) means inputs are unknown, always run.
+        """
+        return None
+
+    def checkpoint(self, cursor):
+        self.cursor = cursor
+        if self._checkpointer:
+            self._checkpointer(cursor)
 
 
 class APIEndpoint(application.Extension):
@@ -88,18 +171,24 @@ class MusicBridge(AppBridge):
 
 class _APIEndpointMixin:
     METHODS = ['GET']
+    CACHE_TTL = None
 
-    def _run_main(self, **params):
+    def _validate(self, params):
         try:
-            params = self.validator(**params)
+            return self.validator(**params)
         except NotImplementedError:
-            pass
+            return params
+
+    def _run_main(self, **params):
+        from housekeeper.lib import hkasync
+
+        params = self._validate(params)
 
         try:
             return (
                 falcon.HTTP_200,
                 {
-                    'result': self.main(**params)
+                    'result': hkasync.resolve(self.main(**params))
                 }
             )
 
@@ -111,25 +200,91 @@ class _APIEndpointMixin:
                 }
             )
 
-    def on_get(self, req, resp):
-        if 'GET' not in self.METHODS:
-            resp.status = falcon.HTTP_METHOD_NOT_ALLOWED
-            return
+    async def _run_main_async(self, **params):
+        """
+        _run_main() for an async main, awaited on the running loop.
+        """
+        params = self._validate(params)
 
-        resp.status, resp.context['result'] = self._run_main()
+        try:
+            return (
+                falcon.HTTP_200,
+                {
+                    'result': await self.main(**params)
+                }
+            )
 
-    def on_post(self, req, resp):
-        if 'POST' not in self.METHODS:
-            resp.status = falcon.HTTP_METHOD_NOT_ALLOWED
-            return
+        except RuntimeError as e:
+            return (
+                falcon.HTTP_500,
+                {
+                    'error': e.args[0]
+                }
+            )
+
+    @staticmethod
+    def _cacheable(ret):
+        return ret[0] == falcon.HTTP_200 and not hkjson.has_stream(ret[1])
+
+    def handle(self, method, params=None, defer=False):
+        """
+        Run an API call, returns (status, body).
+
+        body is None if there is nothing to send. POST calls need params
+        (the request document). With defer an async main isn't waited
+        for: body is a coroutine resolving to the actual (status, body),
+        to be awaited on the shared loop (see hkserver.Deferred).
+        """
+        if method not in self.METHODS:
+            return (falcon.HTTP_METHOD_NOT_ALLOWED, None)
+
+        if method == 'POST' and params is None:
+            return (falcon.HTTP_NOT_ACCEPTABLE, None)
+
+        if defer and inspect.iscoroutinefunction(self.main):
+            return (falcon.HTTP_200, self._handle_async(method, params))
+
+        if method == 'GET':
+            if self.response_cache is None:
+                return self._run_main()
+
+            return self.response_cache.get_or_compute(
+                'GET', self._run_main, cacheable=self._cacheable)
 
         try:
-            params = req.context['doc']
-        except KeyError:
-            resp.status = falcon.HTTP_NOT_ACCEPTABLE
-            return
+            return self._run_main(**(params or {}))
 
-        resp.status, resp.context['result'] = self._run_main(**params)
+        finally:
+            # Anything in the tree may have changed
+            self.root.invalidate_cache()
+
+    async def _handle_async(self, method, params):
+        if method == 'GET':
+            if self.response_cache is None:
+                return await self._run_main_async()
+
+            return await self.response_cache.get_or_compute_async(
+                'GET', self._run_main_async, cacheable=self._cacheable)
+
+        try:
+            return await self._run_main_async(**(params or {}))
+
+        finally:
+            self.root.invalidate_cache()
+
+    def _respond(self, resp, status, body):
+        resp.status = status
+        if body is not None:
+            resp.context['result'] = body
+
+    def on_get(self, req, resp):
+        self._respond(resp, *self.handle(
+            'GET', defer=req.env.get('hkserver.defer', False)))
+
+    def on_post(self, req, resp):
+        self._respond(resp, *self.handle(
+            'POST', req.context.get('doc'),
+            defer=req.env.get('hkserver.defer', False)))
 
 
 class _CommandMixin:
@@ -167,7 +322,11 @@ class _CommandMixin:
         super().setup_argparser(parser)
 
     def execute(self, core, arguments):
-        ret = self.execute_applet(self, core, arguments)
+        from housekeeper.lib import hkasync
+
+        ret = hkasync.resolve(self.execute_applet(self, core, arguments))
+        if hkjson.is_stream(ret):
+            ret = list(ret)
 
         if ret is None:
             pass
@@ -185,6 +344,8 @@ class Applet(_APIEndpointMixin, APIEndpoint, _CommandMixin, Command):
     HELP = ""
     CHILDREN = ()
     PARAMETERS = ()
+    SETTINGS_NS = None
+    SETTINGS_SCHEMA = None
 
     def __init__(self, services, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -192,6 +353,17 @@ class Applet(_APIEndpointMixin, APIEndpoint, _CommandMixin, Command):
         self.children = {}
         self._parent = None
 
+        if self.CACHE_TTL:
+            self.response_cache = hkcache.TTLCache(self.CACHE_TTL)
+        else:
+            self.response_cache = None
+
+        if self.SETTINGS_NS:
+            self.config = services.settings.view(self.SETTINGS_NS,
+                                                 self.SETTINGS_SCHEMA)
+        else:
+            self.config = None
+
         for (name, child_cls) in self.CHILDREN:
             self.children[name] = self.create_child(name, child_cls, services,
                                                     *args, **kwargs)
@@ -216,8 +388,21 @@ class Applet(_APIEndpointMixin, APIEndpoint, _CommandMixin, Command):
 
         return root
 
+    def invalidate_cache(self):
+        """
+        Drop cached responses of this applet and its children.
+        """
+        if self.response_cache is not None:
+            self.response_cache.invalidate()
+
+        for child in self.children.values():
+            child.invalidate_cache()
+
     @abc.abstractmethod
     def main(self, **parameters):
+        """
+        Do the applet's work, can be a coroutine function.
+        """
         raise NotImplementedError()
 
     @abc.abstractmethod
@@ -235,70 +420,1130 @@ class Applet(_APIEndpointMixin, APIEndpoint, _CommandMixin, Command):
 #         raise NotImplementedError()
 
 
+class DaemonCommand(Command):
+    __extension_name__ = 'daemon'
+    HELP = 'Keep a warm housekeeper listening on a unix socket'
+    PARAMETERS = (
+        Parameter('socket', default=None),
+        Parameter('watch-config', default='2'),
+    )
+
+    def execute(self, core, arguments):
+        core.load_enabled_plugins()
+        daemon.Daemon(
+            core,
+            path=arguments.socket,
+            watch_config=float(arguments.watch_config or 0)
+        ).serve()
+
+
+class CronCommand(cron.Command):
+    __extension_name__ = 'cron'
+    HELP = 'Run due tasks'
+    PARAMETERS = (
+        Parameter('force', abbr='f', action='store_true', default=False),
+    )
+
+    def execute(self, core, arguments):
+        core.load_enabled_plugins()
+        core.cron.tick(force=arguments.force)
+
+
+class SchedulerCommand(Command):
+    __extension_name__ = 'scheduler'
+    HELP = 'Keep running and execute tasks when they are due'
+
+    def execute(self, core, arguments):
+        core.load_enabled_plugins()
+        core.cron.serve()
+
+
+class TasksCommand(Command):
+    __extension_name__ = 'tasks'
+    HELP = 'Show run statistics of tasks'
+
+    def execute(self, core, arguments):
+        def _fmt(value, spec='{:9.2f}'):
+            return '{:>9}'.format('-') if value is None else spec.format(value)
+
+        print('{:<30} {:>5} {:>6} {:>7} {:>9} {:>9} {:>9}'.format(
+            'task', 'runs', 'errors', 'skipped', 'p50 s', 'p95 s', 'cpu s'))
+
+        for (name, stats) in sorted(core.cron.get_stats().items()):
+            print('{:<30} {:>5} {:>6} {:>7} {} {} {}'.format(
+                name, stats['runs'], stats['errors'], stats['skipped'],
+                _fmt(stats['p50']), _fmt(stats['p95']), _fmt(stats['cpu'])))
+
+
+class Tasklet:
+    """
+    User defined task: an applet called with fixed parameters.
+
+    Defined in settings as:
+
+      tasks:
+        archive whatsapp:
+          app: archive
+          source: "~/Sync/WhatsApp Media"
+          delta: 4w
+          frequency: 1d
+          depends: [sync]
+
+    Frequency can also be given by a cron entry:
+
+      cron:
+        - task: archive whatsapp
+          frequency: 1d
+    """
+    def __init__(self, name, app, params=None, frequency=None,
+                 depends=None):
+        self.__extension_name__ = name
+        self.app = app
+        self.params = params or {}
+        self.interval = hkdatetime.parse_timespan(frequency or '1d')
+        self.DEPENDS = tuple(depends or ())
+
+    def execute(self, core):
+        applet = core.get_extension(Command, self.app)
+        params = {k.replace('-', '_'): v for (k, v) in self.params.items()}
+
+        try:
+            params = applet.validator(**params)
+        except NotImplementedError:
+            pass
+
+        return applet.main(**params)
+
+    @classmethod
+    def from_settings(cls, settings):
+        defs = settings.get('tasks', None) or {}
+        frequencies = {}
+        for entry in settings.get('cron', None) or []:
+            frequencies[entry['task']] = entry.get('frequency')
+
+        ret = []
+        for (name, params) in defs.items():
+            params = dict(params)
+            try:
+                app = params.pop('app')
+            except KeyError:
+                msg = "Tasklet «{name}» has no app"
+                raise TypeError(msg.format(name=name))
+
+            frequency = params.pop('frequency', None)
+            frequency = frequencies.get(name, frequency)
+            depends = params.pop('depends', None)
+            if isinstance(depends, str):
+                depends = [depends]
+
+            ret.append(cls(name, app, params, frequency, depends))
+
+        return ret
+
+
 class CronManager(cron.Manager):
     COMMAND_EXTENSION_CLASS = Command
+    LOCK_POLICIES = ('skip', 'wait', 'join', 'none')
+    CHECKPOINT_INTERVAL = 5
+    DEFER_RETRY = 300
 
     def __init__(self, core, state_file, *args, **kwargs):
         super().__init__(core, *args, **kwargs)
         os.makedirs(os.path.dirname(state_file), exist_ok=True)
+
+        self.core = core
         self.state_file = state_file
+        self._state = None
+        self._state_lock = threading.Lock()
+        self._history_lock = threading.Lock()
 
-    def load_state(self):
-        state = store.Store()
+    @property
+    def state(self):
+        # Opened on first use, commands not touching tasks don't pay for
+        # sqlite
+        with self._state_lock:
+            if self._state is None:
+                from housekeeper.lib import hkstate
 
-        try:
-            with open(self.state_file) as fh:
-                state.load(fh)
+                state = hkstate.StateStore(
+                    os.path.splitext(self.state_file)[0] + '.db',
+                    logger=self.core.logger.getChild('state'))
+                state.migrate_json(self.state_file)
+                self._state = state
 
-        except FileNotFoundError:
-            pass
+        return self._state
+
+    def load_state(self):
+        state = store.Store()
+        for (k, v) in self.state.get_prefix('').items():
+            state.set(k, v)
 
         return state
 
     def save_state(self, state):
-        with open(self.state_file, 'w+') as fh:
-            state.dump(fh)
+        self.state.set_many(store.flatten_dict(state.get(None) or {}))
 
     def load_checkpoint(self, task):
-        store = self.load_state()
+        key = 'cron.taskstate.{}.'.format(task.__extension_name__)
+        return self.state.get_prefix(key, unflatten_=True)
 
-        key = 'cron.taskstate.{}'.format(task.__extension_name__)
-        ret = store.get(key, default={})
+    def save_checkpoint(self, task, checkpoint):
+        prefix = 'cron.taskstate.{}.'.format(task.__extension_name__)
+        self.state.set_many(
+            {prefix + k: v for (k, v) in checkpoint.items()})
+
+    def get_tasks(self):
+        ret = list(self.core.get_extensions_for(cron.Task,
+                                                self.core.settings))
+
+        try:
+            tasklets = Tasklet.from_settings(self.core.settings)
+        except (TypeError, ValueError) as e:
+            msg = "Invalid tasklets in settings: {e}"
+            self.core.logger.getChild('cron').error(msg.format(e=e))
+            tasklets = []
 
+        ret.extend((x.__extension_name__, x) for x in tasklets)
         return ret
 
-    def save_checkpoint(self, task, checkpoint):
-        store = self.load_state()
+    def is_due(self, task, now=None):
+        if now is None:
+            now = time.time()
+
+        key = 'cron.lastrun.{}'.format(task.__extension_name__)
+        return now - self.state.get(key, 0) >= (task.interval or 0)
+
+    def task_job(self, task, force=False):
+        """
+        Build the executor job for task.
+
+        Timeout, concurrency and lock policy come from
+        scheduler.tasks.<name>.{timeout,concurrency,lock} settings with
+        Task.TIMEOUT, Task.CONCURRENCY and Task.LOCK as defaults.
+        """
+        from housekeeper.lib import hkexecutor
+
+        name = task.__extension_name__
+        config = self.core.settings.view('scheduler.tasks.' + name, {
+            'timeout': float,
+            'concurrency': int,
+            'lock': str
+        })
+
+        timeout = config.get('timeout', getattr(task, 'TIMEOUT', None))
+        policy = config.get('lock', getattr(task, 'LOCK', 'skip'))
+        if policy not in self.LOCK_POLICIES:
+            msg = "Invalid lock policy «{policy}» for task «{name}»"
+            self.core.logger.getChild('cron').error(
+                msg.format(policy=policy, name=name))
+            policy = 'skip'
+
+        return hkexecutor.Job(
+            name, self.execute_locked, args=(task, policy, timeout, force),
+            timeout=timeout,
+            concurrency=config.get('concurrency',
+                                   getattr(task, 'CONCURRENCY', 1)))
+
+    def task_priority(self, task):
+        """
+        Priority class (normal, batch or idle) from
+        scheduler.tasks.<name>.priority or Task.PRIORITY.
+        """
+        from housekeeper.lib import hkpriority
+
+        name = task.__extension_name__
+        config = self.core.settings.view('scheduler.tasks.' + name, {
+            'priority': str
+        })
+
+        priority = config.get('priority', getattr(task, 'PRIORITY', 'normal'))
+        if priority not in hkpriority.CLASSES:
+            msg = "Invalid priority «{priority}» for task «{name}»"
+            self.core.logger.getChild('cron').error(
+                msg.format(priority=priority, name=name))
+            priority = 'normal'
+
+        return priority
+
+    def lock_path(self, name):
+        return os.path.join(os.path.dirname(self.state_file), 'locks',
+                            urllib.parse.quote(name, safe='') + '.lock')
+
+    def execute_locked(self, task, policy, timeout=None, force=False):
+        """
+        Execute task holding its cross-process lock.
+
+        If another process is already running the task, depending on
+        policy: 'skip' this run, 'wait' for it and run afterwards or 'join'
+        it (wait for it and don't run). With policy 'none' no lock is
+        taken.
+        """
+        import multiprocessing
+        from housekeeper.lib import (
+            hkexecutor,
+            hkpriority
+        )
+
+        # Job runs in its own thread (or process), priority won't leak to
+        # other tasks. Processes get a cgroup per task, removed by
+        # task_finished
+        cgroup = None
+        if multiprocessing.parent_process() is not None:
+            cgroup = task.__extension_name__
+
+        hkpriority.apply(
+            self.task_priority(task),
+            logger=self.core.logger.getChild('cron'),
+            cgroup=cgroup)
+
+        if policy == 'none':
+            return self.execute_memoized(task, timeout=timeout, force=force)
+
+        lock = hklock.PidLock(self.lock_path(task.__extension_name__))
+        try:
+            lock.acquire(blocking=False)
+
+        except hklock.LockHeld as e:
+            if policy == 'skip':
+                msg = "Already running in process {pid}"
+                raise hkexecutor.Skip(msg.format(pid=e.pid))
+
+            try:
+                lock.acquire(timeout=timeout)
+            except hklock.LockHeld:
+                msg = "Timeout waiting for process {pid}"
+                raise hkexecutor.Skip(msg.format(pid=e.pid))
+
+            if policy == 'join':
+                lock.release()
+                msg = "Joined run of process {pid}"
+                raise hkexecutor.Skip(msg.format(pid=e.pid))
+
+        try:
+            return self.execute_memoized(task, timeout=timeout, force=force)
+        finally:
+            lock.release()
+
+    def execute_memoized(self, task, timeout=None, force=False):
+        """
+        Execute task unless its inputs (Task.inputs()) didn't change since
+        its last successful run.
+
+        The run may change its own inputs (ie. a sync destination), the
+        fingerprint stored is the one taken after it.
+        """
+        from housekeeper.lib import (
+            hkexecutor,
+            hkfingerprint
+        )
+
+        name = task.__extension_name__
+        key = 'cron.fingerprint.{}'.format(name)
+
+        inputs = getattr(task, 'inputs', lambda core: None)(self.core)
+        fingerprint = None
+        if inputs is not None:
+            fingerprint = hkfingerprint.fingerprint(inputs,
+                                                    self.core.settings)
+
+        # Interrupted runs must be resumed even if nothing changed
+        if (not force and fingerprint is not None and
+                self.load_cursor(name) is None and
+                fingerprint == self.state.get(key, None)):
+            raise hkexecutor.Cached('Inputs unchanged')
+
+        ret = self.execute_resumable(task, timeout=timeout)
+        if fingerprint is not None:
+            fingerprint = hkfingerprint.fingerprint(inputs,
+                                                    self.core.settings)
+
+        if fingerprint is not None:
+            self.state.set(key, fingerprint)
+        else:
+            self.state.delete(key)
+
+        return ret
+
+    def load_cursor(self, name):
+        return self.state.get('cron.cursor.{}'.format(name), None)
 
-        for (k, v) in checkpoint.items():
-            k = 'cron.taskstate.{name}.{key}'.format(
-                name=task.__extension_name__,
-                key=k)
+    def save_cursor(self, name, cursor):
+        key = 'cron.cursor.{}'.format(name)
+        if cursor is None:
+            self.state.delete(key, sync=True)
+        else:
+            self.state.set(key, cursor, sync=True)
+
+    def execute_resumable(self, task, timeout=None):
+        """
+        Execute task with its cursor from the last interrupted run.
+
+        Checkpoints are committed right away (a run may be killed) but at
+        most once every CHECKPOINT_INTERVAL seconds.
+        """
+        from housekeeper.lib import hkasync
+
+        name = task.__extension_name__
+        last_save = time.monotonic()
+        saved = False
+
+        def _checkpointer(cursor):
+            nonlocal last_save, saved
+
+            now = time.monotonic()
+            if now - last_save >= self.CHECKPOINT_INTERVAL:
+                self.save_cursor(name, cursor)
+                last_save = now
+                saved = True
+
+        task.cursor = self.load_cursor(name)
+        task._checkpointer = _checkpointer
+        resumed = task.cursor is not None
+
+        try:
+            ret = hkasync.resolve(task.execute(self.core), timeout=timeout)
+
+        except BaseException:
+            if task.cursor is not None:
+                self.save_cursor(name, task.cursor)
+            raise
+
+        finally:
+            task._checkpointer = None
+
+        if resumed or saved:
+            self.save_cursor(name, None)
+
+        return ret
+
+    def get_executor(self):
+        from housekeeper.lib import hkexecutor
+
+        config = self.core.settings.view('scheduler', {
+            'executor': str,
+            'workers': int
+        })
+
+        return hkexecutor.TaskExecutor(
+            mode=config.get('executor', 'thread'),
+            max_workers=config.get('workers', 4),
+            logger=self.core.logger.getChild('cron'))
+
+    def task_finished(self, result):
+        from housekeeper.lib import (
+            hkexecutor,
+            hkpriority
+        )
+
+        logger = self.core.logger.getChild('cron')
+
+        # Job process is gone (see execute_locked)
+        hkpriority.remove_cgroup(result.name)
+
+        if result.outcome == hkexecutor.Outcome.OK:
+            msg = "Task «{name}» finished in {elapsed:.2f}s"
+            logger.debug(msg.format(name=result.name,
+                                    elapsed=result.ended - result.started))
+
+        elif result.outcome == hkexecutor.Outcome.CACHED:
+            msg = "Task «{name}» skipped: {error}"
+            logger.debug(msg.format(name=result.name, error=result.error))
+
+        elif result.outcome == hkexecutor.Outcome.SKIPPED:
+            msg = "Task «{name}» skipped: {error}"
+            logger.warning(msg.format(name=result.name, error=result.error))
+            self.record_run(result)
+            return
+
+        else:
+            msg = "Task «{name}» failed: {error}"
+            logger.error(msg.format(name=result.name, error=result.error))
+
+        self.record_run(result)
+
+        now = time.time()
+        self.state.set('cron.lastrun.{}'.format(result.name), now)
+        if result.outcome in (hkexecutor.Outcome.OK,
+                              hkexecutor.Outcome.CACHED):
+            self.state.set('cron.lastok.{}'.format(result.name), now)
+
+    def record_run(self, result):
+        """
+        Append result to the task's run history.
+
+        History is a ring buffer of scheduler.history (default 100) records
+        per task.
+        """
+        size = self.core.settings.view('scheduler', {'history': int})
+        size = size.get('history', 100)
+
+        record = {
+            'started': result.started,
+            'ended': result.ended,
+            'duration': result.ended - result.started,
+            'outcome': result.outcome,
+            'error': result.error,
+        }
+        record.update(result.stats or {})
+
+        key = 'cron.history.{}'.format(result.name)
+        with self._history_lock:
+            history = self.state.get(key, [])
+            self.state.set(key, hkrunstats.append_ring(history, record, size))
+
+    def get_history(self, name):
+        return self.state.get('cron.history.{}'.format(name), [])
+
+    def get_stats(self):
+        """
+        Run history and summary (p50/p95 durations, errors...) per task.
+        """
+        ret = {}
+        for (name, history) in self.state.get_prefix('cron.history.').items():
+            ret[name] = hkrunstats.summarize(history)
+            ret[name]['history'] = history
+
+        return ret
+
+    def execute_task(self, task):
+        from housekeeper.lib import hkexecutor
+
+        name = task.__extension_name__
+        logger = self.core.logger.getChild('cron')
+
+        msg = "Executing task «{name}»"
+        msg = msg.format(name=name)
+        logger.debug(msg)
+
+        executor = hkexecutor.TaskExecutor(max_workers=1)
+        (result,) = executor.run([self.task_job(task)])
+        self.task_finished(result)
+
+        return result.outcome == hkexecutor.Outcome.OK
 
-            store.set(k, v)
+    def tick(self, force=False):
+        """
+        Execute due tasks.
 
-        self.save_state(store)
+        Tasks run concurrently on the configured executor
+        (scheduler.executor: thread or process, scheduler.workers), a
+        failing or hung task doesn't affect the others.
+        All state changes (checkpoints, run times...) are committed at once
+        when the tick ends.
+        """
+        now = time.time()
+        logger = self.core.logger.getChild('cron')
+
+        tasks = dict(self.get_tasks())
+        due = {}
+        for (name, task) in tasks.items():
+            if force or self.is_due(task, now):
+                due[name] = task
+
+        if not force:
+            (due, dummy) = self.defer_tasks(due, now)
+            (due, dummy) = self.hold_dependants(due, tasks)
+
+        if not due:
+            return
+
+        for name in due:
+            logger.debug("Executing task «{name}»".format(name=name))
+
+        with self.state.batch():
+            self.run_tasks(self.get_executor(), due, force=force)
+
+    def defer_tasks(self, tasks, now=None):
+        """
+        Filter out heavy tasks (Task.HEAVY or scheduler.tasks.<name>.heavy)
+        while the system is busy or on battery.
+
+        Thresholds are scheduler.defer.{load,io_pressure,battery}, a task
+        is never deferred for more than scheduler.defer.max_delay.
+        Returns the tasks to run and the names of deferred ones.
+        """
+        if now is None:
+            now = time.time()
+
+        heavy = []
+        for (name, task) in tasks.items():
+            config = self.core.settings.view('scheduler.tasks.' + name, {
+                'heavy': bool
+            })
+            if config.get('heavy', getattr(task, 'HEAVY', False)):
+                heavy.append(name)
+
+        if not heavy:
+            return tasks, []
+
+        config = self.core.settings.view('scheduler.defer', {
+            'load': float,
+            'io_pressure': float,
+            'battery': bool,
+            'max_delay': parse_timespan,
+        })
+
+        metrics = hkload.metrics()
+        reasons = hkload.defer_reasons(
+            metrics,
+            load=config.get('load', float(os.cpu_count() or 1)),
+            io_pressure=config.get('io_pressure', 30.0),
+            battery=config.get('battery', True))
+        max_delay = config.get('max_delay', 6 * 60 * 60)
+
+        logger = self.core.logger.getChild('cron')
+        msg_metrics = 'load={load}, io_pressure={io_pressure}, ' \
+                      'battery={battery}'.format(**metrics)
+
+        tasks = dict(tasks)
+        deferred = []
+        for name in heavy:
+            key = 'cron.deferred.{}'.format(name)
+            since = self.state.get(key, None)
+
+            if not reasons:
+                if since is not None:
+                    self.state.delete(key)
+                continue
+
+            if since is None:
+                since = now
+                self.state.set(key, since)
+
+            if now - since >= max_delay:
+                msg = ("Running heavy task «{name}» deferred for "
+                       "{delay:.0f}s ({reasons}; {metrics})")
+                logger.warning(msg.format(
+                    name=name, delay=now - since,
+                    reasons=', '.join(reasons), metrics=msg_metrics))
+                self.state.delete(key)
+                continue
+
+            msg = "Deferring heavy task «{name}» ({reasons}; {metrics})"
+            logger.info(msg.format(name=name, reasons=', '.join(reasons),
+                                   metrics=msg_metrics))
+            del tasks[name]
+            deferred.append(name)
+
+        return tasks, deferred
+
+    def task_depends(self, task):
+        name = task.__extension_name__
+        config = self.core.settings.view('scheduler.tasks.' + name, {
+            'depends': list
+        })
+
+        return config.get('depends', getattr(task, 'DEPENDS', ()))
+
+    def pending_depends(self, name, task, batch, known):
+        """
+        Prerequisites of task (known tasks only) that haven't succeeded
+        since its last run and aren't in batch, the tasks about to run
+        with it.
+        """
+        lastrun = self.state.get('cron.lastrun.{}'.format(name), None)
+
+        ret = []
+        for dep in self.task_depends(task):
+            if dep not in known or dep in batch:
+                continue
+
+            lastok = self.state.get('cron.lastok.{}'.format(dep), None)
+            if lastok is None or (lastrun is not None and lastok < lastrun):
+                ret.append(dep)
+
+        return ret
+
+    def hold_dependants(self, tasks, known):
+        """
+        Filter out tasks that must wait for their prerequisites.
+
+        Schedules of tasks drift apart (each one is relative to its own
+        last run), a task is only run if its prerequisites succeeded
+        since its last run or run along with it.
+        Returns the tasks to run and a dict of held ones with what they
+        are waiting for.
+        """
+        logger = self.core.logger.getChild('cron')
+
+        tasks = dict(tasks)
+        held = {}
+
+        # Holding a task may hold its dependants in the same batch too
+        while True:
+            waiting = {}
+            for (name, task) in tasks.items():
+                deps = self.pending_depends(name, task, tasks, known)
+                if deps:
+                    waiting[name] = deps
+
+            if not waiting:
+                break
+
+            for (name, deps) in waiting.items():
+                msg = "Task «{name}» waits for: {deps}"
+                msg = msg.format(name=name, deps=', '.join(deps))
+                logger.debug(msg)
+
+                held[name] = deps
+                del tasks[name]
+
+        return (tasks, held)
+
+    def run_tasks(self, executor, tasks, force=False):
+        """
+        Run tasks (a name to task dict) and wait for them.
+
+        Tasks start as soon as the tasks they depend on (Task.DEPENDS or
+        scheduler.tasks.<name>.depends) finish, independent ones run in
+        parallel. Dependencies on tasks not being run are ignored. If a
+        task fails its dependants are skipped, tasks in dependency cycles
+        fail.
+        """
+        jobs = [self.task_job(task, force=force) for task in tasks.values()]
+        depends = {name: self.task_depends(task)
+                   for (name, task) in tasks.items()}
+
+        for result in executor.run_graph(jobs, depends):
+            self.task_finished(result)
+
+    def build_schedule(self, scheduler):
+        scheduler.clear()
+        tasks = {}
+
+        for (name, task) in self.get_tasks():
+            lastrun = self.state.get('cron.lastrun.{}'.format(name), None)
+            interval = task.interval or 0
+            deadline = None
+            if lastrun is not None:
+                deadline = lastrun + max(interval, scheduler.MIN_INTERVAL)
+
+            scheduler.add(name, interval, deadline=deadline)
+            tasks[name] = task
+
+        return tasks
+
+    def serve(self):
+        """
+        Run forever executing tasks when they are due.
+
+        Next runs are kept in a heap so the process only wakes up when
+        something is due (or settings change). Runs missed while suspended
+        are coalesced into one. Tasks held for their prerequisites run as
+        soon as these succeed.
+        """
+        logger = self.core.logger.getChild('cron')
+
+        scheduler = hkscheduler.Scheduler()
+        tasks = self.build_schedule(scheduler)
+        executor = self.get_executor()
+        held = set()
+
+        def _run(due):
+            try:
+                self.run_tasks(executor, due)
+            finally:
+                scheduler.wakeup()
+
+        while True:
+            if self.core.settings_changed():
+                self.core.reload_settings()
+                tasks = self.build_schedule(scheduler)
+                executor = self.get_executor()
+
+            # Batches wake us up when they finish, check if that released
+            # some held task
+            due = {name: tasks[name] for name in held if name in tasks}
+            held = set()
+
+            for (name, missed) in scheduler.pop_due():
+                if missed:
+                    msg = "Task «{name}»: {n} missed runs coalesced"
+                    logger.info(msg.format(name=name, n=missed))
+
+                due[name] = tasks[name]
+
+            (due, deferred) = self.defer_tasks(due)
+            for name in deferred:
+                scheduler.postpone(name, time.time() + self.DEFER_RETRY)
+
+            (due, waiting) = self.hold_dependants(due, tasks)
+            held.update(waiting)
+
+            for name in due:
+                logger.debug("Executing task «{name}»".format(name=name))
+
+            if due:
+                threading.Thread(target=_run, args=(due,),
+                                 name='hk-scheduler-batch',
+                                 daemon=True).start()
+
+            scheduler.wait()
 
 
 class YAMLStore(store.Store):
+    SNAPSHOT_VERSION = 1
+    SNAPSHOT_KEYS = {'version', 'mtime', 'size', 'digest', 'data'}
+
     def __init__(self, *args, logger=None, **kwargs):
+        # Must be ready before super().__init__, it may call set()
+        self._views = {}
+        self._subscribers = []
+
         super().__init__(*args, **kwargs)
         if not logger:
             logger = types.NullSingleton()
 
         self.logger = logger
 
+    def set(self, key, value):
+        super().set(key, value)
+        self._notify(key)
+
+    def delete(self, key):
+        super().delete(key)
+        self._notify(key)
+
+    def subscribe(self, fn):
+        self._subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        self._subscribers.remove(fn)
+
+    def _notify(self, key):
+        for view in self._views.values():
+            view.notify(key)
+
+        for fn in self._subscribers:
+            fn(key)
+
+    def replace(self, other):
+        """
+        Make this store equal to other touching only changed keys.
+
+        Returns the set of changed keys.
+        """
+        missing = object()
+
+        old = store.flatten_dict(self.get(None) or {})
+        new = store.flatten_dict(other.get(None) or {})
+
+        changed = set(
+            k for k in set(old) | set(new)
+            if old.get(k, missing) != new.get(k, missing))
+
+        for k in sorted(changed):
+            if k in new:
+                self.set(k, new[k])
+            else:
+                self.delete(k)
+
+        return changed
+
+    def view(self, namespace, schema=None):
+        """
+        Get the (shared) SettingsView for namespace.
+        """
+        namespace = namespace.strip('.')
+        try:
+            view = self._views[namespace]
+
+        except KeyError:
+            view = hksettings.SettingsView(self, namespace)
+            self._views[namespace] = view
+
+        if schema and any(view.schema.get(k) != v
+                          for (k, v) in schema.items()):
+            view.schema.update(schema)
+            view.invalidate()
+
+        return view
+
     def dump(self, stream):
         buff = yaml.dump(self.get(None))
         stream.write(buff)
 
     def load(self, stream):
         buff = stream.read()
+        self._load_flatten(self._parse(buff))
+
+    def load_file(self, filename, snapshot_dir=None):
+        """
+        Load settings from filename.
+
+        If snapshot_dir is given, a binary snapshot of the flattened
+        settings is kept there and reused, skipping YAML parsing, while
+        filename doesn't change.
+        """
+        if not snapshot_dir:
+            with open(filename) as fh:
+                self.load(fh)
+            return
+
+        st = os.stat(filename)
+        snapshot_file = os.path.join(
+            snapshot_dir,
+            hashlib.sha1(
+                os.path.realpath(filename).encode('utf-8')).hexdigest())
+
+        snapshot = self._read_snapshot(snapshot_file)
+        if (snapshot and
+                snapshot['mtime'] == st.st_mtime_ns and
+                snapshot['size'] == st.st_size):
+            self._load_flatten(snapshot['data'])
+            return
+
+        with open(filename, 'rb') as fh:
+            buff = fh.read()
+
+        digest = hashlib.sha1(buff).hexdigest()
+        if snapshot and snapshot['digest'] == digest:
+            # File was touched but its contents are the same
+            data = snapshot['data']
+
+        else:
+            msg = "Settings snapshot for «{filename}» is stale"
+            msg = msg.format(filename=filename)
+            self.logger.debug(msg)
+
+            data = self._parse(buff.decode('utf-8'))
+
+        self._load_flatten(data)
+
+        snapshot = {
+            'version': self.SNAPSHOT_VERSION,
+            'mtime': st.st_mtime_ns,
+            'size': st.st_size,
+            'digest': digest,
+            'data': data
+        }
+
+        try:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            tmp = snapshot_file + '.tmp'
+            with open(tmp, 'wb') as fh:
+                pickle.dump(snapshot, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, snapshot_file)
+
+        except OSError as e:
+            msg = "Unable to save settings snapshot: {e}"
+            msg = msg.format(e=e)
+            self.logger.warning(msg)
+
+    def _read_snapshot(self, snapshot_file):
+        """
+        Read a snapshot, any failure to read or validate it (missing,
+        truncated, foreign or from another version) is a miss.
+        """
+        try:
+            with open(snapshot_file, 'rb') as fh:
+                snapshot = pickle.load(fh)
+
+        except FileNotFoundError:
+            return None
+
+        except Exception as e:
+            msg = "Ignoring unreadable settings snapshot: {e!r}"
+            msg = msg.format(e=e)
+            self.logger.debug(msg)
+            return None
+
+        if (not isinstance(snapshot, dict) or
+                not self.SNAPSHOT_KEYS <= set(snapshot) or
+                snapshot['version'] != self.SNAPSHOT_VERSION or
+                not isinstance(snapshot['data'], dict)):
+            return None
+
+        return snapshot
+
+    def _parse(self, buff):
         data = yaml.load(buff)
-        data = store.flatten_dict(data or {})
+        return store.flatten_dict(data or {})
+
+    def _load_flatten(self, data):
         for (k, v) in data.items():
             self.set(k, v)
 
 
+class PluginManifest:
+    """
+    Cached index of the extensions provided by each plugin.
+
+    It allows to find which plugin owns some extension without importing
+    every plugin. Entries are invalidated when plugin files change.
+    """
+    EXTENSIONS_ATTR = '__housekeeper_extensions__'
+
+    def __init__(self, pluginpath, cache_file, extension_points,
+                 package='housekeeper.plugins', logger=None):
+        if not logger:
+            logger = types.NullSingleton()
+
+        self.pluginpath = pluginpath
+        self.cache_file = cache_file
+        self.extension_points = extension_points
+        self.package = package
+        self.logger = logger
+
+        self.plugins = {}
+        self._index = {}
+
+    def available_plugins(self):
+        try:
+            entries = os.listdir(self.pluginpath)
+        except FileNotFoundError:
+            return []
+
+        ret = []
+        for entry in sorted(entries):
+            if entry.startswith(('_', '.')):
+                continue
+
+            fullpath = os.path.join(self.pluginpath, entry)
+            if entry.endswith('.py'):
+                ret.append(entry[:-3])
+
+            elif os.path.isfile(os.path.join(fullpath, '__init__.py')):
+                ret.append(entry)
+
+        return ret
+
+    def fingerprint(self, plugin):
+        fullpath = os.path.join(self.pluginpath, plugin)
+        if os.path.isdir(fullpath):
+            files = [
+                os.path.join(dirpath, filename)
+                for (dirpath, dirnames, filenames) in os.walk(fullpath)
+                for filename in filenames
+                if filename.endswith('.py')
+            ]
+        else:
+            files = [fullpath + '.py']
+
+        ret = []
+        for filename in sorted(files):
+            st = os.stat(filename)
+            ret.append([
+                os.path.relpath(filename, self.pluginpath),
+                st.st_mtime_ns,
+                st.st_size
+            ])
+
+        return ret
+
+    def load(self, plugins=None):
+        """
+        Load the manifest from cache, re-indexing stale or missing plugins.
+
+        If plugins is given only those plugins are (re)indexed, cached
+        entries for the others are kept untouched.
+        """
+        try:
+            with open(self.cache_file) as fh:
+                cached = json.load(fh)
+
+        except (FileNotFoundError, ValueError):
+            cached = {}
+
+        available = self.available_plugins()
+        if plugins is None:
+            plugins = available
+
+        dirty = False
+        self.plugins = {}
+
+        for name in available:
+            entry = cached.get(name)
+            if name not in plugins:
+                if entry:
+                    self.plugins[name] = entry
+                continue
+
+            fingerprint = self.fingerprint(name)
+            if entry is None or entry['fingerprint'] != fingerprint:
+                entry = self.index_plugin(name, fingerprint)
+                dirty = True
+
+            if entry is not None:
+                self.plugins[name] = entry
+
+        if dirty or set(cached) != set(self.plugins):
+            self.save()
+
+        self._index = {
+            (ext['point'], ext['name']): name
+            for (name, entry) in self.plugins.items()
+            for ext in entry['extensions']
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+
+        tmp = self.cache_file + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(self.plugins, fh)
+
+        os.rename(tmp, self.cache_file)
+
+    def index_plugin(self, name, fingerprint):
+        msg = "Indexing plugin «{name}»"
+        msg = msg.format(name=name)
+        self.logger.debug(msg)
+
+        try:
+            module = importlib.import_module(self.package + '.' + name)
+
+        except Exception as e:
+            # Failed plugins are not cached, maybe some dependency gets
+            # installed later
+            msg = "Unable to index plugin «{name}»: {e}"
+            msg = msg.format(name=name, e=e)
+            self.logger.warning(msg)
+            return None
+
+        extensions = []
+        for cls in getattr(module, self.EXTENSIONS_ATTR, []):
+            extensions.extend(self.describe_extension(cls))
+
+        return {
+            'fingerprint': fingerprint,
+            'extensions': extensions
+        }
+
+    def describe_extension(self, cls):
+        def _describe_parameter(x):
+            return getattr(x, 'name', None) or str(x)
+
+        name = getattr(cls, '__extension_name__', None)
+        if not name:
+            return []
+
+        desc = {
+            'name': name,
+            'help': getattr(cls, 'HELP', ''),
+            'parameters': [
+                _describe_parameter(x)
+                for x in getattr(cls, 'PARAMETERS', ())
+            ],
+            'arguments': [
+                _describe_parameter(x)
+                for x in getattr(cls, 'ARGUMENTS', ())
+            ],
+            'children': [
+                child_name
+                for (child_name, child_cls) in getattr(cls, 'CHILDREN', ())
+            ],
+        }
+
+        return [
+            dict(desc, point=point.__name__)
+            for point in self.extension_points
+            if issubclass(cls, point)
+        ]
+
+    def get_owner(self, extension_point, name):
+        return self._index.get((extension_point.__name__, name))
+
+
 class RuntimeError(Exception):
     pass
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import os
+import threading
+
+
+_lock = threading.Lock()
+_loop = None
+_loop_pid = None
+
+
+def get_loop():
+    """
+    Shared event loop, running forever in a daemon thread.
+
+    Coroutines from every task and applet run here so I/O bound ones
+    overlap. A new loop is started after fork (threads don't survive it).
+    """
+    global _loop, _loop_pid
+
+    with _lock:
+        if _loop is not None and _loop_pid == os.getpid():
+            return _loop
+
+        loop = asyncio.new_event_loop()
+        th = threading.Thread(target=loop.run_forever,
+                              name='hk-event-loop', daemon=True)
+        th.start()
+
+        _loop, _loop_pid = loop, os.getpid()
+        return _loop
+
+
+def resolve(value, timeout=None):
+    """
+    Wait for value if it's awaitable (eg. returned by an async def main or
+    execute) on the shared loop, return it as is otherwise.
+
+    On timeout the coroutine is cancelled and TimeoutError raised.
+    """
+    if not inspect.isawaitable(value):
+        return value
+
+    loop = get_loop()
+    if running_in(loop):
+        raise RuntimeError("Can't block the shared event loop")
+
+    async def _await():
+        return await value
+
+    future = asyncio.run_coroutine_threadsafe(_await(), loop)
+    try:
+        return future.result(timeout)
+
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError('Timeout after {}s'.format(timeout))
+
+
+def running_in(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+async def offload(fn, *args, **kwargs):
+    """
+    Run blocking fn in a thread from async code.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+from housekeeper.lib import hkjson
+
+
+import collections
+
+
+MAX_CALLS = 100
+
+HTTP_BAD_REQUEST = '400 Bad Request'
+HTTP_NOT_FOUND = '404 Not Found'
+HTTP_INTERNAL_SERVER_ERROR = '500 Internal Server Error'
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def parse_call(call):
+    """
+    Get (path, method, params) of a {path, method, params} call, raises
+    ValueError if malformed. params is None if missing.
+    """
+    try:
+        path = call['path'].strip('/')
+        method = call.get('method', 'GET').upper()
+        params = call.get('params')
+
+    except (AttributeError, KeyError, TypeError):
+        raise ValueError('Invalid call')
+
+    if params is not None and not isinstance(params, dict):
+        raise ValueError('Invalid params')
+
+    if method == 'GET' and params:
+        raise ValueError("GET calls don't take params")
+
+    return (path, method, params)
+
+
+def call_root(call):
+    """
+    Root endpoint of a call (music for music/play), None if malformed.
+    """
+    try:
+        return call['path'].strip('/').split('/')[0]
+    except (TypeError, KeyError, AttributeError):
+        return None
+
+
+def run_call(get_endpoint, call):
+    """
+    Run a call, returns (status, body).
+
+    get_endpoint returns the endpoint for a path (or None), endpoints
+    have a handle(method, params) method returning (status, body) (see
+    APIEndpoint). Streamed results are materialized.
+    """
+    try:
+        (path, method, params) = parse_call(call)
+    except ValueError as e:
+        return (HTTP_BAD_REQUEST, {'error': str(e)})
+
+    endpoint = get_endpoint(path)
+    if endpoint is None:
+        return (HTTP_NOT_FOUND, None)
+
+    try:
+        (status, body) = endpoint.handle(method, params)
+        if body and hkjson.is_stream(body.get('result')):
+            body['result'] = list(body['result'])
+
+    except Exception as e:
+        return (HTTP_INTERNAL_SERVER_ERROR, {'error': str(e)})
+
+    return (status, body)
+
+
+def run(calls, get_endpoint, executor, max_calls=MAX_CALLS):
+    """
+    Run a list of calls, returns a list (in the same order) of
+    {status, result|error}.
+
+    Calls to different root endpoints run concurrently in executor, calls
+    under the same one (ie. music/play and music/) run sequentially in
+    order so later ones see the effects of former ones.
+    """
+    if not isinstance(calls, list) or len(calls) > max_calls:
+        msg = 'A list of at most {} calls is required.'
+        raise InvalidBatch(msg.format(max_calls))
+
+    groups = collections.OrderedDict()
+    for (idx, call) in enumerate(calls):
+        groups.setdefault(call_root(call), []).append((idx, call))
+
+    def _run_group(group):
+        return [run_call(get_endpoint, call) for (idx, call) in group]
+
+    futures = [(group, executor.submit(_run_group, group))
+               for group in groups.values()]
+
+    results = [None] * len(calls)
+    for (group, future) in futures:
+        for ((idx, dummy), (status, body)) in zip(group, future.result()):
+            results[idx] = dict(body or {}, status=int(status[:3]))
+
+    return results
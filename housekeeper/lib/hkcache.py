@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import threading
+import time
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Values expire ttl seconds after being stored.
+
+    invalidate() drops everything and bumps a generation: values computed
+    by get_or_compute() before an invalidation aren't stored, so a slow
+    read racing a write can't put stale data back.
+    """
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            (expires, value) = self._data.get(key, (None, _MISSING))
+            if value is not _MISSING and self.clock() < expires:
+                self.hits += 1
+                return value
+
+            self._data.pop(key, None)
+            self.misses += 1
+            return default
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._data[key] = (self.clock() + self.ttl, value)
+
+    def get_or_compute(self, key, fn, cacheable=None):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        generation = self._generation
+        value = fn()
+        if cacheable is None or cacheable(value):
+            self.put(key, value, generation=generation)
+
+        return value
+
+    async def get_or_compute_async(self, key, fn, cacheable=None):
+        """
+        get_or_compute() for a coroutine function fn.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        generation = self._generation
+        value = await fn()
+        if cacheable is None or cacheable(value):
+            self.put(key, value, generation=generation)
+
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
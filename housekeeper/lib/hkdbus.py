@@ -18,18 +18,55 @@
 # USA.
 
 
+import os
+import threading
+
+
 import dbus
 
 
-class HKDbusInterface:
-    def __new__(cls, name, path, iface, bus='session'):
+_lock = threading.Lock()
+_buses = {}
+
+
+def _reset_buses():
+    global _lock
+
+    # Connections inherited from the parent can't be used: the socket is
+    # shared with it. The lock may have been held by another thread.
+    _lock = threading.Lock()
+    _buses.clear()
+
+
+os.register_at_fork(after_in_child=_reset_buses)
+
+
+def get_bus(bus='session'):
+    """
+    Private bus connection of this process, opened on first use (and again
+    after fork).
+    """
+    # Only one connection per bus, losers of a race would leak theirs
+    with _lock:
+        try:
+            return _buses[bus]
+        except KeyError:
+            pass
+
         if bus == 'session':
-            bus = dbus.SessionBus()
+            conn = dbus.SessionBus(private=True)
         elif bus == 'system':
-            bus = dbus.SystemBus()
+            conn = dbus.SystemBus(private=True)
         else:
             raise ValueError(bus)
 
+        _buses[bus] = conn
+        return conn
+
+
+class HKDbusInterface:
+    def __new__(cls, name, path, iface, bus='session'):
+        bus = get_bus(bus)
         proxy = bus.get_object(name, path)
         iface = dbus.Interface(proxy, iface)
 
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+
+from housekeeper.lib import (
+    hkgraph,
+    hkrunstats
+)
+
+
+class Outcome:
+    OK = 'ok'
+    ERROR = 'error'
+    TIMEOUT = 'timeout'
+    SKIPPED = 'skipped'
+    CACHED = 'cached'
+
+
+class Skip(Exception):
+    """
+    Raised by a job to finish as skipped instead of failed.
+    """
+    pass
+
+
+class Cached(Skip):
+    """
+    Raised by a job with nothing to do since its last successful run,
+    it counts as successful.
+    """
+    pass
+
+
+JobResult = collections.namedtuple('JobResult', [
+    'name',
+    'outcome',
+    'error',
+    'started',
+    'ended',
+    'stats',
+])
+
+
+class Job:
+    def __init__(self, name, fn, args=(), kwargs=None, timeout=None,
+                 concurrency=1):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        self.started = None
+
+    @property
+    def deadline(self):
+        if self.started is None or not self.timeout:
+            return None
+
+        return self.started + self.timeout
+
+
+class TaskExecutor:
+    """
+    Run jobs with a global concurrency limit and per-job limits/timeouts.
+
+    In 'thread' mode jobs run in (daemon) threads, a job exceeding its
+    timeout is reported as such but can't be killed. In 'process' mode
+    each job runs in a forked child which is killed on timeout.
+    Job exceptions are always captured into its JobResult.
+    """
+    MODES = ('thread', 'process')
+
+    def __init__(self, mode='thread', max_workers=4, logger=None):
+        if mode not in self.MODES:
+            raise ValueError(mode)
+
+        self.mode = mode
+        self.max_workers = max_workers
+        self.logger = logger
+
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self._running = collections.Counter()
+
+    def submit(self, job):
+        """
+        Submit job, returns a concurrent.futures.Future with its JobResult.
+        """
+        future = concurrent.futures.Future()
+        future.job = job
+
+        with self._lock:
+            if self._running[job.name] >= job.concurrency:
+                now = time.time()
+                future.set_result(JobResult(
+                    job.name, Outcome.SKIPPED,
+                    'Concurrency limit reached', now, now, None))
+                return future
+
+            self._running[job.name] += 1
+
+        th = threading.Thread(target=self._worker, args=(job, future),
+                              name='hk-job-' + job.name, daemon=True)
+        th.start()
+
+        return future
+
+    def _worker(self, job, future):
+        try:
+            with self._slots:
+                job.started = time.time()
+                if self.mode == 'process':
+                    outcome, error, stats = self._run_in_process(job)
+                else:
+                    outcome, error, stats = self._run(job)
+
+            result = JobResult(job.name, outcome, error, job.started,
+                               time.time(), stats)
+
+        except BaseException as e:
+            # Future must be resolved whatever happens or waiters hang
+            result = JobResult(job.name, Outcome.ERROR,
+                               '{}: {}'.format(e.__class__.__name__, e),
+                               job.started, time.time(), None)
+
+        finally:
+            with self._lock:
+                self._running[job.name] -= 1
+
+        if not future.done():
+            future.set_result(result)
+
+    def _run(self, job):
+        outcome, error = Outcome.OK, None
+
+        with hkrunstats.Usage() as usage:
+            try:
+                job.fn(*job.args, **job.kwargs)
+
+            except Cached as e:
+                outcome, error = Outcome.CACHED, str(e)
+
+            except Skip as e:
+                outcome, error = Outcome.SKIPPED, str(e)
+
+            # SystemExit and KeyboardInterrupt too: they only end this job
+            except BaseException as e:
+                if self.logger:
+                    self.logger.debug(traceback.format_exc())
+
+                outcome = Outcome.ERROR
+                error = '{}: {}'.format(e.__class__.__name__, e)
+
+        return outcome, error, usage.stats
+
+    def _run_in_process(self, job):
+        ctx = multiprocessing.get_context('fork')
+        reader, writer = ctx.Pipe(duplex=False)
+
+        def _child():
+            reader.close()
+            ret = (Outcome.ERROR, 'Unknown error', None)
+            try:
+                ret = self._run(job)
+            finally:
+                writer.send(ret)
+                writer.close()
+                os._exit(0)
+
+        proc = ctx.Process(target=_child, name='hk-job-' + job.name)
+        proc.start()
+        writer.close()
+
+        try:
+            if reader.poll(job.timeout):
+                try:
+                    return reader.recv()
+                except EOFError:
+                    pass
+
+            elif proc.is_alive():
+                proc.terminate()
+                proc.join(5)
+                if proc.is_alive():
+                    proc.kill()
+
+                return (Outcome.TIMEOUT,
+                        'Killed after {}s'.format(job.timeout), None)
+
+            proc.join()
+            return (Outcome.ERROR,
+                    'Exited with code {}'.format(proc.exitcode), None)
+
+        finally:
+            proc.join()
+            reader.close()
+
+    def _wait(self, pending):
+        """
+        Wait for some of the pending futures to finish or exceed their
+        timeout, removes them from pending and returns their JobResults.
+        """
+        deadlines = [f.job.deadline for f in pending
+                     if f.job.deadline is not None]
+        wait = None
+        if deadlines:
+            wait = max(0, min(deadlines) - time.time())
+
+        # Jobs waiting for a slot don't have deadline yet, don't sleep
+        # forever
+        if wait is None and any(f.job.started is None and f.job.timeout
+                                for f in pending):
+            wait = 1
+
+        done, dummy = concurrent.futures.wait(
+            pending, timeout=wait,
+            return_when=concurrent.futures.FIRST_COMPLETED)
+
+        ret = []
+        for f in done:
+            pending.remove(f)
+            ret.append(f.result())
+
+        now = time.time()
+        for f in list(pending):
+            deadline = f.job.deadline
+            if deadline is None or now < deadline:
+                continue
+
+            # Thread can't be stopped, give up waiting for it
+            pending.remove(f)
+            ret.append(JobResult(
+                f.job.name, Outcome.TIMEOUT,
+                'Timeout after {}s'.format(f.job.timeout),
+                f.job.started, now, None))
+
+        return ret
+
+    def as_completed(self, futures):
+        """
+        Yield JobResults as jobs finish or exceed their timeout.
+        """
+        pending = set(futures)
+
+        while pending:
+            yield from self._wait(pending)
+
+    def run(self, jobs):
+        return list(self.as_completed([self.submit(x) for x in jobs]))
+
+    def run_graph(self, jobs, depends):
+        """
+        Run jobs respecting dependencies, yield JobResults as they finish.
+
+        depends maps job names to the names they depend on. Jobs are
+        submitted as soon as their dependencies succeed, if one doesn't
+        its dependants are skipped. Jobs in dependency cycles fail (their
+        dependants are skipped), the others run.
+        """
+        jobs = {x.name: x for x in jobs}
+        graph = hkgraph.Graph({name: depends.get(name, ())
+                               for name in jobs})
+        pending = set()
+
+        (cycles, dependants) = graph.drop_cycles()
+        now = time.time()
+        for name in cycles:
+            yield JobResult(
+                name, Outcome.ERROR,
+                'Dependency cycle between: ' + ', '.join(cycles),
+                now, now, None)
+
+        for name in dependants:
+            yield JobResult(
+                name, Outcome.SKIPPED, 'Depends on a dependency cycle',
+                now, now, None)
+
+        while True:
+            pending.update(self.submit(jobs[x]) for x in graph.ready())
+            if not pending:
+                break
+
+            for result in self._wait(pending):
+                yield result
+
+                ok = result.outcome in (Outcome.OK, Outcome.CACHED)
+                for name in graph.done(result.name, ok=ok):
+                    now = time.time()
+                    yield JobResult(
+                        name, Outcome.SKIPPED,
+                        'Dependency «{}» {}'.format(result.name,
+                                                    result.outcome),
+                        now, now, None)
@@ -38,14 +38,59 @@ class Operations:
     UNLINK = 2
 
 
-def archive(src, dst, diff, filter_func=None, dry_run=False):
-    nowts = utils.now_timestamp()
-    ret = []
+def _walk_key(relpath):
+    return [x for x in relpath.split('/') if x and x != '.']
+
+
+def resumable_walk(top, resume_from=None, filter_func=None):
+    """
+    os.walk() in a stable (sorted) order skipping everything up to and
+    including resume_from, a directory relative to top as yielded before.
 
-    for (dirpath, dirnames, filenames) in os.walk(src):
+    Fully processed subtrees are pruned without being listed.
+    """
+    cursor = _walk_key(resume_from) if resume_from is not None else None
+
+    for (dirpath, dirnames, filenames) in os.walk(top):
         if filter_func:
             filter_func(dirpath, dirnames, filenames)
 
+        dirnames.sort()
+        filenames.sort()
+
+        if cursor is None:
+            yield (dirpath, dirnames, filenames)
+            continue
+
+        key = _walk_key(os.path.relpath(dirpath, top))
+
+        # Pre-order with sorted children is the lexicographical order of
+        # the path components: prune subtrees before the cursor unless
+        # the cursor is inside them
+        dirnames[:] = [
+            x for x in dirnames
+            if key + [x] > cursor or cursor[:len(key) + 1] == key + [x]
+        ]
+
+        if key > cursor:
+            yield (dirpath, dirnames, filenames)
+
+
+def archive(src, dst, diff, filter_func=None, dry_run=False,
+            resume_from=None, checkpoint=None):
+    """
+    Move files in src older than diff seconds into dst.
+
+    If checkpoint is given it's called with each directory (relative to
+    src) once processed, pass it back as resume_from to continue an
+    interrupted run.
+    """
+    nowts = utils.now_timestamp()
+    ret = []
+
+    walk = resumable_walk(src, resume_from=resume_from,
+                          filter_func=filter_func)
+    for (dirpath, dirnames, filenames) in walk:
         for filename in filenames:
             oldpath = dirpath + '/' + filename
             st = os.stat(oldpath)
@@ -77,6 +122,9 @@ def archive(src, dst, diff, filter_func=None, dry_run=False):
                     print("rm '{}'".format(oldpath))
                 ret.append((Operations.UNLINK, oldpath))
 
+        if checkpoint:
+            checkpoint(os.path.relpath(dirpath, src))
+
     return ret
 
 
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import hashlib
+import json
+import os
+import urllib.request
+
+
+class Input:
+    """
+    Something a task reads. value() returns a JSON-serializable summary
+    which changes when the input does, or None if it can't be known.
+    """
+    def __init__(self, key):
+        self.key = key
+
+    def value(self, settings):
+        raise NotImplementedError()
+
+
+class File(Input):
+    """
+    File modification time and size.
+    """
+    def value(self, settings):
+        try:
+            st = os.stat(os.path.expanduser(self.key))
+        except FileNotFoundError:
+            return 'missing'
+
+        return [st.st_mtime_ns, st.st_size]
+
+
+def _update(digest, value):
+    digest.update(json.dumps(value).encode('utf-8') + b'\n')
+
+
+class Dir(Input):
+    """
+    Modification times of a directory tree's directories (as a digest).
+
+    Directory mtimes change when entries are added, removed or renamed,
+    not when an existing file is rewritten.
+    """
+    def value(self, settings):
+        top = os.path.expanduser(self.key)
+        if not os.path.isdir(top):
+            return 'missing'
+
+        digest = hashlib.sha1()
+        for (dirpath, dirnames, dummy) in os.walk(top):
+            dirnames.sort()
+            try:
+                _update(digest, [os.path.relpath(dirpath, top),
+                                 os.stat(dirpath).st_mtime_ns])
+            except FileNotFoundError:
+                pass
+
+        return digest.hexdigest()
+
+
+class Tree(Input):
+    """
+    Identity (device, inode) of a directory tree's root plus modification
+    time and size of every entry in it (as a digest, entries are hashed
+    while walking so memory doesn't grow with the tree).
+
+    Unlike Dir it catches rewritten files and a different filesystem
+    mounted at the same path, at the cost of a stat per entry.
+    """
+    def value(self, settings):
+        top = os.path.expanduser(self.key)
+        try:
+            st = os.stat(top)
+        except FileNotFoundError:
+            return 'missing'
+
+        digest = hashlib.sha1()
+        _update(digest, [st.st_dev, st.st_ino])
+        for (dirpath, dirnames, filenames) in os.walk(top):
+            dirnames.sort()
+            for name in sorted(dirnames + filenames):
+                entry = os.path.join(dirpath, name)
+                try:
+                    st = os.lstat(entry)
+                except FileNotFoundError:
+                    continue
+
+                _update(digest, [os.path.relpath(entry, top),
+                                 st.st_mtime_ns, st.st_size])
+
+        return digest.hexdigest()
+
+
+class URL(Input):
+    """
+    HTTP validators (ETag, Last-Modified) of an URL from a HEAD request.
+    """
+    TIMEOUT = 10
+
+    def value(self, settings):
+        req = urllib.request.Request(self.key, method='HEAD')
+        try:
+            with urllib.request.urlopen(req, timeout=self.TIMEOUT) as resp:
+                etag = resp.headers.get('ETag')
+                modified = resp.headers.get('Last-Modified')
+
+        except OSError:
+            return None
+
+        if not etag and not modified:
+            return None
+
+        return [etag, modified]
+
+
+class Settings(Input):
+    """
+    Settings subtree.
+    """
+    def value(self, settings):
+        # Wrapped, None is a valid (known) setting value
+        return [settings.get(self.key, None)]
+
+
+def fingerprint(inputs, settings):
+    """
+    Digest of the inputs values, None if some of them can't be known.
+    """
+    values = []
+    for x in inputs:
+        value = x.value(settings)
+        if value is None:
+            return None
+
+        values.append([x.__class__.__name__, x.key, value])
+
+    buff = json.dumps(values, sort_keys=True, default=repr)
+    return hashlib.sha1(buff.encode('utf-8')).hexdigest()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import collections
+
+
+class CycleError(ValueError):
+    pass
+
+
+class Graph:
+    """
+    Dependency graph: depends maps each node to the nodes it depends on.
+
+    Dependencies on nodes not in the graph are ignored (considered
+    satisfied). Nodes in dependency cycles are never ready, see
+    drop_cycles().
+    """
+    def __init__(self, depends):
+        self.depends = {
+            node: set(deps or ()) & set(depends)
+            for (node, deps) in depends.items()
+        }
+
+        self.dependants = collections.defaultdict(set)
+        for (node, deps) in self.depends.items():
+            for dep in deps:
+                self.dependants[dep].add(node)
+
+        self._waiting = {k: set(v) for (k, v) in self.depends.items()}
+        self._started = set()
+
+    def toposort(self):
+        """
+        Nodes in dependency order, raises CycleError.
+        """
+        ret = self._kahn()
+        if len(ret) != len(self.depends):
+            raise CycleError('Dependency cycle between: ' +
+                             ', '.join(self.cycles()))
+
+        return ret
+
+    def _kahn(self):
+        # Nodes in dependency order, leaving out the ones in cycles and
+        # their descendants
+        indegree = {k: len(v) for (k, v) in self.depends.items()}
+        queue = collections.deque(sorted(k for (k, v) in indegree.items()
+                                         if not v))
+        ret = []
+
+        while queue:
+            node = queue.popleft()
+            ret.append(node)
+            for x in sorted(self.dependants[node]):
+                indegree[x] -= 1
+                if not indegree[x]:
+                    queue.append(x)
+
+        return ret
+
+    def cycles(self):
+        """
+        Get nodes in dependency cycles.
+        """
+        left = set(self.depends) - set(self._kahn())
+        return sorted(x for x in left if x in self.descendants(x))
+
+    def descendants(self, node):
+        ret = set()
+        stack = [node]
+        while stack:
+            for x in self.dependants[stack.pop()]:
+                if x not in ret:
+                    ret.add(x)
+                    stack.append(x)
+
+        return ret
+
+    def ready(self):
+        """
+        Get nodes whose dependencies are done and mark them as started.
+        """
+        ret = sorted(k for (k, v) in self._waiting.items()
+                     if not v and k not in self._started)
+        self._started.update(ret)
+        return ret
+
+    def drop_cycles(self):
+        """
+        Mark nodes in dependency cycles as failed, returns them and their
+        descendants (which won't be ready ever either).
+        """
+        cycles = self.cycles()
+        self._started.update(cycles)
+
+        descendants = set()
+        for node in cycles:
+            descendants.update(self.done(node, ok=False))
+
+        return (cycles, sorted(descendants))
+
+    def done(self, node, ok=True):
+        """
+        Mark node as done. If it failed its descendants won't be ready
+        ever, they are returned.
+        """
+        if ok:
+            for x in self.dependants[node]:
+                self._waiting[x].discard(node)
+
+            return []
+
+        ret = sorted(x for x in self.descendants(node)
+                     if x not in self._started)
+        self._started.update(ret)
+        return ret
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import collections
+import email.utils
+import gzip
+import os
+import re
+import shutil
+import threading
+import uuid
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Sidecar suffix for each content coding, by preference
+ENCODINGS = [
+    ('br', '.br'),
+    ('gzip', '.gz'),
+]
+
+COMPRESSIBLE = (
+    '.css', '.html', '.ico', '.js', '.json', '.map', '.svg', '.txt', '.xml'
+)
+
+# Content-hashed names as produced by bundlers: main.1a2b3c4d.js,
+# 0.5f6e7d8c.chunk.js...
+_HASHED_RE = re.compile(r'\.[0-9a-f]{8,}\.')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def make_etag(st):
+    """
+    Strong ETag from a stat result (inode, mtime and size).
+    """
+    return '"{:x}-{:x}-{:x}"'.format(st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def same_file(st, other):
+    """
+    True if two stat results are of the same, unchanged, file.
+    """
+    return ((st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size) ==
+            (other.st_dev, other.st_ino, other.st_mtime_ns, other.st_size))
+
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def not_modified(etag, mtime, if_none_match=None, if_modified_since=None):
+    """
+    Check conditional request headers, True means 304 Not Modified.
+
+    If-None-Match takes precedence over If-Modified-Since (RFC 7232).
+    """
+    if if_none_match is not None:
+        tags = [x.strip() for x in if_none_match.split(',')]
+        # Weak comparison
+        etags = {etag, 'W/' + etag}
+        return '*' in tags or bool(etags.intersection(tags))
+
+    if if_modified_since is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+
+    return False
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header into a list of (start, end) inclusive byte ranges.
+
+    Returns None if the header must be ignored (missing or malformed),
+    raises RangeNotSatisfiable if no range overlaps the file.
+    """
+    if not header:
+        return None
+
+    (unit, dummy, spec) = header.partition('=')
+    if unit.strip() != 'bytes' or not spec:
+        return None
+
+    ret = []
+    for item in spec.split(','):
+        (start, sep, end) = item.strip().partition('-')
+        if not sep:
+            return None
+
+        try:
+            if not start:
+                # Suffix range: last N bytes
+                n = int(end)
+                if n <= 0:
+                    continue
+                (start, end) = (max(0, size - n), size - 1)
+
+            else:
+                start = int(start)
+                if end:
+                    end = int(end)
+                    if end < start:
+                        return None
+                else:
+                    end = size - 1
+
+                end = min(end, size - 1)
+
+        except ValueError:
+            return None
+
+        if start <= end:
+            ret.append((start, end))
+
+    if not ret:
+        raise RangeNotSatisfiable(header)
+
+    return ret
+
+
+class Multipart:
+    """
+    multipart/byteranges body for several ranges of a file.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, filename, ranges, content_type, size):
+        self.filename = filename
+        self.ranges = ranges
+        self.size = size
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/byteranges; boundary=' + self.boundary
+
+        self._headers = [
+            ('\r\n--{}\r\nContent-Type: {}\r\n'
+             'Content-Range: bytes {}-{}/{}\r\n\r\n').format(
+                self.boundary, content_type, start, end, size
+            ).encode('ascii')
+            for (start, end) in ranges
+        ]
+        self._trailer = '\r\n--{}--\r\n'.format(self.boundary).encode('ascii')
+
+    def __len__(self):
+        return (sum(len(x) for x in self._headers) +
+                sum(end - start + 1 for (start, end) in self.ranges) +
+                len(self._trailer))
+
+    def __iter__(self):
+        with open(self.filename, 'rb') as fh:
+            for (header, (start, end)) in zip(self._headers, self.ranges):
+                yield header
+
+                fh.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    buff = fh.read(min(remaining, self.CHUNK_SIZE))
+                    if not buff:
+                        return
+
+                    remaining -= len(buff)
+                    yield buff
+
+        yield self._trailer
+
+
+def accepted_encodings(header):
+    """
+    Content codings accepted by an Accept-Encoding header (q > 0).
+    """
+    ret = set()
+    for item in (header or '').split(','):
+        (coding, *params) = [x.strip() for x in item.split(';')]
+        q = 1.0
+        for param in params:
+            (key, dummy, value) = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0
+
+        if coding and q > 0:
+            ret.add(coding.lower())
+
+    return ret
+
+
+def is_contained(filename, root):
+    """
+    True if filename, once symlinks are resolved, is root or below it.
+    """
+    root = os.path.realpath(root)
+    filename = os.path.realpath(filename)
+    return filename == root or filename.startswith(root.rstrip('/') + '/')
+
+
+def find_sidecars(filename, st, root=None):
+    """
+    Precompressed sidecars of filename (filename.br, filename.gz) not
+    older than filename, as (encoding, path, stat) by preference.
+
+    With root, sidecars resolving outside of it are ignored.
+    """
+    ret = []
+    for (encoding, suffix) in ENCODINGS:
+        sidecar = filename + suffix
+        try:
+            sidecar_st = os.stat(sidecar)
+        except OSError:
+            continue
+
+        if sidecar_st.st_mtime_ns < st.st_mtime_ns:
+            continue
+
+        if root is not None and not is_contained(sidecar, root):
+            continue
+
+        ret.append((encoding, sidecar, sidecar_st))
+
+    return ret
+
+
+def select_sidecar(filename, st, accept_encoding, sidecars=None,
+                   root=None):
+    """
+    Pick the best sidecar of filename (see find_sidecars) acceptable by
+    the client.
+
+    Returns (path, stat, encoding), encoding is None for filename itself.
+    """
+    if sidecars is None:
+        sidecars = find_sidecars(filename, st, root=root)
+
+    accepted = accepted_encodings(accept_encoding)
+    for (encoding, sidecar, sidecar_st) in sidecars:
+        if encoding in accepted:
+            return (sidecar, sidecar_st, encoding)
+
+    return (filename, st, None)
+
+
+def is_hashed(filename):
+    return bool(_HASHED_RE.search(os.path.basename(filename)))
+
+
+def compress_file(filename, force=False):
+    """
+    Write .gz (and .br if brotli is available) sidecars of filename if
+    missing or outdated. Returns the list of written files.
+    """
+    ret = []
+    mtime_ns = os.stat(filename).st_mtime_ns
+
+    for (encoding, suffix) in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+
+        target = filename + suffix
+        try:
+            if not force and os.stat(target).st_mtime_ns >= mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+
+        tmp = target + '.tmp'
+        with open(filename, 'rb') as src:
+            if encoding == 'br':
+                with open(tmp, 'wb') as dst:
+                    dst.write(brotli.compress(src.read()))
+            else:
+                with gzip.GzipFile(tmp, 'wb', compresslevel=9,
+                                   mtime=0) as dst:
+                    shutil.copyfileobj(src, dst)
+
+        os.rename(tmp, target)
+        ret.append(target)
+
+    return ret
+
+
+class FileCache:
+    """
+    LRU of small file contents keyed by (path, mtime_ns, size), bounded
+    in total size. Changed files get a new key, stale entries are evicted
+    as any other.
+    """
+    def __init__(self, max_size=16 * 1024 * 1024, max_file_size=256 * 1024):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(filename, st):
+        return (filename, st.st_mtime_ns, st.st_size)
+
+    def cacheable(self, st):
+        return st.st_size <= self.max_file_size
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+
+            except KeyError:
+                self.misses += 1
+                return None
+
+    def put(self, key, data):
+        if len(data) > self.max_file_size:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._data[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_size:
+                (dummy, evicted) = self._data.popitem(last=False)
+                self.size -= len(evicted)
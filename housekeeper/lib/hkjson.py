@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import collections.abc
+import json
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def _orjson_dumps():
+    import orjson
+
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # Non-str keys, big ints...
+            return _stdlib_dumps(obj)
+
+    return dumps
+
+
+def _ujson_dumps():
+    import ujson
+
+    def dumps(obj):
+        try:
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(obj)
+
+    return dumps
+
+
+ENCODERS = collections.OrderedDict([
+    ('orjson', _orjson_dumps),
+    ('ujson', _ujson_dumps),
+    ('json', lambda: _stdlib_dumps),
+])
+
+
+def get_encoder(name=None):
+    """
+    Get (name, dumps) for the named JSON encoder or the fastest available
+    one. dumps returns UTF-8 encoded bytes.
+    """
+    if name is not None:
+        return (name, ENCODERS[name]())
+
+    for (name, factory) in ENCODERS.items():
+        try:
+            return (name, factory())
+        except ImportError:
+            continue
+
+
+def is_stream(obj):
+    """
+    Iterators (generators...) are streamed, other iterables (lists,
+    strings, dicts) are encoded at once.
+    """
+    return isinstance(obj, collections.abc.Iterator)
+
+
+def has_stream(obj):
+    return is_stream(obj) or (
+        isinstance(obj, dict) and any(has_stream(x) for x in obj.values()))
+
+
+def iterencode(obj, dumps):
+    """
+    Encode obj as JSON in chunks, iterators are encoded as arrays item by
+    item.
+    """
+    if is_stream(obj):
+        yield b'['
+        for (idx, item) in enumerate(obj):
+            if idx:
+                yield b','
+            yield from iterencode(item, dumps)
+        yield b']'
+
+    elif isinstance(obj, dict) and has_stream(obj):
+        yield b'{'
+        for (idx, (key, value)) in enumerate(obj.items()):
+            if idx:
+                yield b','
+            yield dumps(str(key)) + b':'
+            yield from iterencode(value, dumps)
+        yield b'}'
+
+    else:
+        yield dumps(obj)
+
+
+def iterencode_ndjson(obj, dumps):
+    """
+    Encode the items of an iterator as newline delimited JSON.
+    """
+    for item in obj:
+        yield dumps(item) + b'\n'
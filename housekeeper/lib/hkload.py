@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import glob
+import os
+
+
+def read_file(path):
+    try:
+        with open(path) as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+
+def load_average():
+    try:
+        return os.getloadavg()[0]
+    except OSError:
+        return None
+
+
+def io_pressure(path='/proc/pressure/io'):
+    """
+    Share of time (%) some task was stalled on IO over the last 10s, None
+    if PSI is not available.
+    """
+    buff = read_file(path)
+    if not buff:
+        return None
+
+    for line in buff.splitlines():
+        (kind, *fields) = line.split()
+        if kind != 'some':
+            continue
+
+        for field in fields:
+            (key, dummy, value) = field.partition('=')
+            if key == 'avg10':
+                return float(value)
+
+    return None
+
+
+def on_battery(root='/sys/class/power_supply'):
+    """
+    True if a system battery is discharging, or there are system
+    batteries and no Mains/USB supply online.
+
+    Device scoped supplies (mice, headsets, UPS reported by peripherals)
+    are ignored.
+    """
+    batteries = False
+    online = False
+    for supply in glob.glob(os.path.join(root, '*')):
+        if read_file(os.path.join(supply, 'scope')) == 'Device':
+            continue
+
+        kind = read_file(os.path.join(supply, 'type')) or ''
+        if kind == 'Battery':
+            if read_file(os.path.join(supply, 'status')) == 'Discharging':
+                return True
+
+            batteries = True
+
+        elif (kind == 'Mains' or kind.startswith('USB')) and \
+                read_file(os.path.join(supply, 'online')) == '1':
+            online = True
+
+    return batteries and not online
+
+
+def metrics():
+    return {
+        'load': load_average(),
+        'io_pressure': io_pressure(),
+        'battery': on_battery(),
+    }
+
+
+def defer_reasons(metrics, load=None, io_pressure=None, battery=True):
+    """
+    Why heavy work should be deferred given metrics and thresholds (None
+    disables a check). Returns an empty list if it shouldn't.
+    """
+    ret = []
+
+    if (load is not None and metrics.get('load') is not None and
+            metrics['load'] > load):
+        ret.append('load {:.2f} > {}'.format(metrics['load'], load))
+
+    if (io_pressure is not None and metrics.get('io_pressure') is not None
+            and metrics['io_pressure'] > io_pressure):
+        ret.append('io pressure {:.1f}% > {}%'.format(
+            metrics['io_pressure'], io_pressure))
+
+    if battery and metrics.get('battery'):
+        ret.append('on battery')
+
+    return ret
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import fcntl
+import os
+import time
+
+
+class LockHeld(Exception):
+    def __init__(self, path, pid):
+        super().__init__(path, pid)
+        self.path = path
+        self.pid = pid
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+class PidLock:
+    """
+    Cross-process lock on a file holding the owner's PID.
+
+    flock() is released by the kernel when the holding file descriptor is
+    closed, but a descriptor inherited by a leftover child keeps the lock
+    after the owner dies. If the recorded owner is gone the lock is
+    considered stale: the file is unlinked and a new one is created.
+    """
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    def read_pid(self):
+        try:
+            with open(self.path) as fh:
+                return int(fh.read().strip() or 0) or None
+
+        except (OSError, ValueError):
+            return None
+
+    def _try_acquire(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except BlockingIOError:
+            pid = self.read_pid()
+            stale = bool(pid and pid != os.getpid() and not pid_alive(pid))
+            try:
+                # Stale lock, break it (if nobody did it yet) and retry with
+                # a new inode
+                if stale and os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                    os.unlink(self.path)
+
+            except FileNotFoundError:
+                pass
+
+            finally:
+                os.close(fd)
+
+            if stale:
+                return self._try_acquire()
+
+            raise LockHeld(self.path, pid)
+
+        # Lock file may have been unlinked by a stale lock breaker between
+        # open() and flock()
+        try:
+            same = os.stat(self.path).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            same = False
+
+        if not same:
+            os.close(fd)
+            return self._try_acquire()
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        self._fd = fd
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Acquire the lock, raises LockHeld if not blocking or on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            try:
+                self._try_acquire()
+                return
+
+            except LockHeld:
+                if not blocking or (deadline is not None and
+                                    time.monotonic() >= deadline):
+                    raise
+
+            time.sleep(self.POLL_INTERVAL)
+
+    def release(self):
+        if self._fd is None:
+            return
+
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
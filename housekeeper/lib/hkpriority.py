@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import collections
+import ctypes
+import ctypes.util
+import os
+import platform
+import threading
+
+
+Priority = collections.namedtuple('Priority', [
+    'nice',
+    'ioclass',
+    'iolevel',
+    'weight',  # cgroup v2 cpu.weight / io.weight (1-10000, default 100)
+])
+
+
+IOPRIO_CLASS_NONE = 0
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+
+CLASSES = {
+    'normal': Priority(0, IOPRIO_CLASS_BE, 4, 100),
+    'batch': Priority(10, IOPRIO_CLASS_BE, 7, 25),
+    'idle': Priority(19, IOPRIO_CLASS_IDLE, 0, 1),
+}
+
+_SYS_IOPRIO_SET = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+}
+
+_SYS_IOPRIO_GET = {
+    'x86_64': 252,
+    'i386': 290,
+    'i686': 290,
+    'aarch64': 31,
+    'armv7l': 315,
+    'ppc64le': 274,
+}
+
+
+def get(name):
+    try:
+        return CLASSES[name]
+    except KeyError:
+        raise ValueError('Invalid priority class: {}'.format(name))
+
+
+def set_nice(nice, tid=None):
+    """
+    Set nice value of a thread (Linux nice values are per-thread), the
+    calling one by default. Raising priority needs privileges and is
+    ignored.
+    """
+    if tid is None:
+        tid = threading.get_native_id()
+
+    current = os.getpriority(os.PRIO_PROCESS, tid)
+    if nice > current:
+        os.setpriority(os.PRIO_PROCESS, tid, nice)
+
+
+def _ioprio_syscall(table, *args):
+    nr = table.get(platform.machine())
+    if nr is None:
+        return None
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    ret = libc.syscall(nr, IOPRIO_WHO_PROCESS, *args)
+    if ret < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    return ret
+
+
+def set_ioprio(ioclass, level, tid=None):
+    """
+    Set IO scheduling class and level of a thread with ioprio_set(2).
+    Returns False if not supported.
+    """
+    if tid is None:
+        tid = threading.get_native_id()
+
+    ioprio = (ioclass << IOPRIO_CLASS_SHIFT) | level
+    return _ioprio_syscall(_SYS_IOPRIO_SET, tid, ioprio) is not None
+
+
+def get_ioprio(tid=None):
+    """
+    Effective (class, level) IO priority of a thread with ioprio_get(2),
+    None if not supported.
+
+    Threads without an explicit one get best-effort with a level derived
+    from their nice value.
+    """
+    if tid is None:
+        tid = threading.get_native_id()
+
+    ioprio = _ioprio_syscall(_SYS_IOPRIO_GET, tid)
+    if ioprio is None:
+        return None
+
+    ioclass = ioprio >> IOPRIO_CLASS_SHIFT
+    if ioclass == IOPRIO_CLASS_NONE:
+        nice = os.getpriority(os.PRIO_PROCESS, tid)
+        return (IOPRIO_CLASS_BE, (nice + 20) // 5)
+
+    return (ioclass, ioprio & ((1 << IOPRIO_CLASS_SHIFT) - 1))
+
+
+def _cgroup_path(name):
+    """
+    Path of child cgroup (v2) name of the current one, None if the
+    current one isn't delegated to us.
+    """
+    try:
+        with open('/proc/self/cgroup') as fh:
+            lines = fh.read().splitlines()
+
+    except OSError:
+        return None
+
+    # v2 only: single '0::/path' line
+    paths = [x[3:] for x in lines if x.startswith('0::')]
+    if not paths:
+        return None
+
+    parent = '/sys/fs/cgroup' + paths[0]
+    if not os.access(parent, os.W_OK):
+        return None
+
+    return os.path.join(parent, 'hk-' + name)
+
+
+def set_cgroup_weight(name, weight, pid=None):
+    """
+    Move a process into child cgroup (v2) name of its current one with
+    the given cpu and io weights.
+
+    Only possible if the current cgroup is delegated to us (eg. systemd
+    user services with Delegate=yes), returns False otherwise.
+    """
+    if pid is None:
+        pid = os.getpid()
+
+    group = _cgroup_path(name)
+    if group is None:
+        return False
+
+    try:
+        os.makedirs(group, exist_ok=True)
+        for ctl in ('cpu.weight', 'io.weight'):
+            path = os.path.join(group, ctl)
+            if os.path.exists(path):
+                with open(path, 'w') as fh:
+                    fh.write(str(weight))
+
+        with open(os.path.join(group, 'cgroup.procs'), 'w') as fh:
+            fh.write(str(pid))
+
+    except OSError:
+        return False
+
+    return True
+
+
+def remove_cgroup(name):
+    """
+    Remove child cgroup name of the current one (see set_cgroup_weight)
+    once its processes are gone. Returns False if it doesn't exist or is
+    still in use.
+    """
+    group = _cgroup_path(name)
+    if group is None:
+        return False
+
+    try:
+        os.rmdir(group)
+    except OSError:
+        return False
+
+    return True
+
+
+def apply(name, logger=None, cgroup=None):
+    """
+    Apply priority class name to the calling thread (and, with cgroup, to
+    the whole process, moved into that child cgroup).
+    """
+    prio = get(name)
+
+    for (fn, args) in [(set_nice, (prio.nice,)),
+                       (set_ioprio, (prio.ioclass, prio.iolevel))]:
+        try:
+            fn(*args)
+        except OSError as e:
+            if logger:
+                logger.debug('Unable to set {} priority: {}'.format(name, e))
+
+    if cgroup and not set_cgroup_weight(cgroup, prio.weight) and logger:
+        logger.debug('Unable to set cgroup weights for {}'.format(name))
+
+
+def command_prefix(name):
+    """
+    nice/ionice prefix to run a command with priority class name from the
+    calling thread.
+
+    Commands inherit the thread's priorities (see apply), nice is
+    relative to them and ionice is left out if already in place.
+    """
+    prio = get(name)
+    tid = threading.get_native_id()
+
+    ret = []
+    nice = prio.nice - os.getpriority(os.PRIO_PROCESS, tid)
+    if nice > 0:
+        ret.extend(['nice', '-n', str(nice)])
+
+    try:
+        current = get_ioprio(tid)
+    except OSError:
+        current = None
+
+    # Unknown, assume the default
+    if current is None:
+        current = (IOPRIO_CLASS_BE, 4)
+
+    if prio.ioclass == IOPRIO_CLASS_IDLE:
+        if current[0] != IOPRIO_CLASS_IDLE:
+            ret.extend(['ionice', '-c', '3'])
+
+    elif current != (prio.ioclass, prio.iolevel):
+        ret.extend(['ionice', '-c', '2', '-n', str(prio.iolevel)])
+
+    return ret
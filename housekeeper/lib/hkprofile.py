@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import builtins
+import contextlib
+import importlib.util
+import json
+import sys
+import time
+
+
+class ImportNode:
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.cumulative_ns = 0
+
+    @property
+    def self_ns(self):
+        return self.cumulative_ns - sum(x.cumulative_ns for x in self.children)
+
+    def asdict(self):
+        return {
+            'name': self.name,
+            'cumulative_ns': self.cumulative_ns,
+            'self_ns': self.self_ns,
+            'children': [x.asdict() for x in self.sorted_children()]
+        }
+
+    def sorted_children(self):
+        return sorted(self.children, key=lambda x: x.cumulative_ns,
+                      reverse=True)
+
+
+class StartupProfiler:
+    """
+    Record named phases and the import tree using perf_counter_ns.
+
+    A disabled profiler can be used everywhere, phase() does nothing
+    in that case.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.start_ns = time.perf_counter_ns()
+        self.phases = []
+        self.imports = ImportNode(None)
+
+        self._depth = 0
+        self._current_import = self.imports
+        self._orig_import = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        record = {
+            'name': name,
+            'depth': self._depth,
+            'start_ns': time.perf_counter_ns() - self.start_ns,
+            'duration_ns': None
+        }
+        self.phases.append(record)
+
+        self._depth += 1
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+
+        finally:
+            record['duration_ns'] = time.perf_counter_ns() - t0
+            self._depth -= 1
+
+    def install_import_hook(self):
+        if not self.enabled or self._orig_import is not None:
+            return
+
+        self._orig_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall_import_hook(self):
+        if self._orig_import is None:
+            return
+
+        builtins.__import__ = self._orig_import
+        self._orig_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(),
+                level=0):
+        if level:
+            try:
+                package = (globals or {}).get('__package__')
+                fullname = importlib.util.resolve_name(
+                    '.' * level + name, package)
+            except (ImportError, ValueError):
+                fullname = name
+        else:
+            fullname = name
+
+        # Submodules imported through fromlist don't go through
+        # builtins.__import__, account them here.
+        missing = [
+            x for x in (fromlist or ())
+            if x != '*' and fullname + '.' + x not in sys.modules
+        ]
+
+        # Only account real imports, not sys.modules lookups
+        if fullname in sys.modules:
+            if not missing:
+                return self._orig_import(name, globals, locals, fromlist,
+                                         level)
+
+            fullname = fullname + '.' + (
+                missing[0] if len(missing) == 1
+                else '{' + ','.join(missing) + '}')
+
+        parent = self._current_import
+        node = ImportNode(fullname, parent=parent)
+        parent.children.append(node)
+        self._current_import = node
+
+        n_modules = len(sys.modules)
+        t0 = time.perf_counter_ns()
+        try:
+            return self._orig_import(name, globals, locals, fromlist, level)
+
+        finally:
+            node.cumulative_ns = time.perf_counter_ns() - t0
+            self._current_import = parent
+
+            # fromlist items were plain attributes, nothing was imported
+            if len(sys.modules) == n_modules:
+                parent.children.remove(node)
+
+    @property
+    def total_ns(self):
+        return time.perf_counter_ns() - self.start_ns
+
+    def asdict(self):
+        return {
+            'total_ns': self.total_ns,
+            'phases': [
+                dict(x) for x in sorted(
+                    self.phases,
+                    key=lambda x: x['duration_ns'] or 0,
+                    reverse=True)
+            ],
+            'imports': [x.asdict() for x in self.imports.sorted_children()]
+        }
+
+    def report(self, format='table', min_import_ns=100000):
+        if format == 'json':
+            return json.dumps(self.asdict(), indent=2)
+
+        elif format != 'table':
+            raise ValueError(format)
+
+        total_ns = self.total_ns
+
+        def _ms(ns):
+            return '{:10.3f}'.format((ns or 0) / 1e6)
+
+        def _pct(ns):
+            return '{:6.1f}%'.format(100 * (ns or 0) / total_ns)
+
+        lines = ['Phases (total {} ms)'.format(_ms(total_ns).strip())]
+        lines.append('{:>10}  {:>7}  {}'.format('ms', '%', 'phase'))
+        for x in self.asdict()['phases']:
+            lines.append('{}  {}  {}'.format(
+                _ms(x['duration_ns']),
+                _pct(x['duration_ns']),
+                x['name']))
+
+        lines.append('')
+        lines.append('Imports (cumulative)')
+        lines.append('{:>10}  {:>10}  {}'.format('cum ms', 'self ms',
+                                                 'module'))
+
+        def _walk(node, depth):
+            for child in node.sorted_children():
+                if child.cumulative_ns < min_import_ns:
+                    continue
+
+                lines.append('{}  {}  {}{}'.format(
+                    _ms(child.cumulative_ns),
+                    _ms(child.self_ns),
+                    '  ' * depth,
+                    child.name))
+                _walk(child, depth + 1)
+
+        _walk(self.imports, 0)
+
+        return '\n'.join(lines)
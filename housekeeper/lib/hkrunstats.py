@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import math
+import os
+import resource
+import time
+
+
+def read_io():
+    """
+    Read and written bytes (storage layer) of the calling thread, or the
+    whole process if per-thread accounting is not available.
+    """
+    ret = {'read_bytes': 0, 'write_bytes': 0}
+
+    for path in ('/proc/thread-self/io', '/proc/self/io'):
+        try:
+            with open(path) as fh:
+                for line in fh:
+                    (key, dummy, value) = line.partition(':')
+                    if key in ret:
+                        ret[key] = int(value)
+
+            break
+
+        except (OSError, ValueError):
+            continue
+
+    return ret
+
+
+def read_rss():
+    """
+    Current resident set size in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, IndexError):
+        # Peak RSS, better than nothing (kB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def read_uss():
+    """
+    Unique set size in bytes: private pages of the process, not shared
+    with others (ie. forked workers). None if not available.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as fh:
+            return sum(
+                int(line.split()[1]) * 1024
+                for line in fh
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')))
+
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Usage:
+    """
+    Measure resources used by a block of code running in the current thread.
+
+    CPU time is per-thread, RSS is process-wide, IO is per-thread if the
+    kernel provides /proc/thread-self.
+    """
+    def __enter__(self):
+        self._cpu = time.thread_time()
+        self._rss = read_rss()
+        self._io = read_io()
+        self.stats = None
+        return self
+
+    def __exit__(self, *exc):
+        io = read_io()
+        self.stats = {
+            'cpu': time.thread_time() - self._cpu,
+            'rss_delta': read_rss() - self._rss,
+            'read_bytes': io['read_bytes'] - self._io['read_bytes'],
+            'write_bytes': io['write_bytes'] - self._io['write_bytes'],
+        }
+
+
+def percentile(values, p):
+    """
+    Percentile p (0-100) of values using linear interpolation.
+    """
+    if not values:
+        return None
+
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = math.floor(k), math.ceil(k)
+
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def append_ring(ring, item, size):
+    """
+    Append item to list ring keeping only the last size items.
+    """
+    ring = list(ring or [])
+    ring.append(item)
+    return ring[-size:]
+
+
+def summarize(records):
+    """
+    Aggregate run records (dicts with duration, cpu, outcome...) of a task.
+
+    Durations are computed over runs which actually executed (not skipped
+    nor cached).
+    """
+    executed = [x for x in records
+                if x['outcome'] not in ('skipped', 'cached')]
+    durations = [x['duration'] for x in executed]
+
+    return {
+        'runs': len(records),
+        'errors': len([x for x in executed if x['outcome'] != 'ok']),
+        'skipped': len(records) - len(executed),
+        'p50': percentile(durations, 50),
+        'p95': percentile(durations, 95),
+        'cpu': sum(x.get('cpu') or 0 for x in records),
+        'last': records[-1] if records else None,
+    }
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import heapq
+import itertools
+import threading
+import time
+
+
+def next_run(deadline, interval, now):
+    """
+    Next deadline after now for a job scheduled every interval seconds.
+
+    Returns (next_deadline, missed). Runs missed while the process was not
+    running (or the machine was suspended) are coalesced into the current
+    one, missed is the number of them dropped.
+    """
+    if now < deadline:
+        return deadline, 0
+
+    missed = int((now - deadline) // interval)
+    return deadline + (missed + 1) * interval, missed
+
+
+class Scheduler:
+    """
+    Min-heap of next run times.
+
+    Deadlines are wall clock (time.time()) timestamps so time spent in
+    suspend counts. Removed or rescheduled entries are dropped lazily when
+    they reach the top of the heap.
+    """
+    MIN_INTERVAL = 60
+    MAX_SLEEP = 300
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._wakeup = threading.Event()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def add(self, name, interval, deadline=None):
+        """
+        Schedule name every interval seconds, first run at deadline (now if
+        not given).
+        """
+        interval = max(interval or 0, self.MIN_INTERVAL)
+        if deadline is None:
+            deadline = self.clock()
+
+        if name in self._entries:
+            self.remove(name)
+
+        entry = [deadline, next(self._counter), name, interval]
+        self._entries[name] = entry
+        heapq.heappush(self._heap, entry)
+        self._wakeup.set()
+
+    def postpone(self, name, deadline):
+        """
+        Move next run of name to deadline, keeping its interval.
+        """
+        self.add(name, self._entries[name][3], deadline=deadline)
+
+    def remove(self, name):
+        entry = self._entries.pop(name)
+        entry[2] = None
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+        self._wakeup.set()
+
+    def _top(self):
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+
+        return self._heap[0] if self._heap else None
+
+    def next_deadline(self):
+        top = self._top()
+        return top[0] if top else None
+
+    def pop_due(self, now=None):
+        """
+        Get the list of (name, missed) due at now and reschedule them.
+        """
+        if now is None:
+            now = self.clock()
+
+        ret = []
+        while True:
+            top = self._top()
+            if top is None or top[0] > now:
+                break
+
+            (deadline, dummy, name, interval) = heapq.heappop(self._heap)
+            deadline, missed = next_run(deadline, interval, now)
+            ret.append((name, missed))
+
+            entry = [deadline, next(self._counter), name, interval]
+            self._entries[name] = entry
+            heapq.heappush(self._heap, entry)
+
+        return ret
+
+    def wait(self):
+        """
+        Sleep until the next deadline or until wakeup() is called.
+
+        Sleep is capped to MAX_SLEEP: monotonic sleeps don't advance while
+        the machine is suspended, this bounds how late we notice a resume.
+        """
+        deadline = self.next_deadline()
+        timeout = self.MAX_SLEEP
+        if deadline is not None:
+            timeout = max(0, min(timeout, deadline - self.clock()))
+
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def wakeup(self):
+        self._wakeup.set()
@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import asyncio
+import concurrent.futures
+import functools
+import io
+import itertools
+import re
+import signal
+import sys
+import threading
+import traceback
+import urllib.parse
+
+
+from housekeeper.lib import hkasync
+
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+KEEPALIVE_TIMEOUT = 75
+CHUNK_SIZE = 64 * 1024
+
+# RFC 7230 tokens (methods, header names), request targets in origin
+# ('/path?query'), absolute ('http://host/path') or asterisk ('*') form
+# and chunk sizes
+_TOKEN = re.compile(r"[!#$%&'*+\-.^_`|~0-9A-Za-z]+")
+_TARGET = re.compile(r'(?:/|https?://)[\x21-\x7e]*|\*')
+_CHUNK_SIZE = re.compile(rb'([0-9A-Fa-f]{1,8})[ \t]*(?:;[^\r\n]*)?\r\n')
+
+
+class BadRequest(Exception):
+    def __init__(self, status, detail=''):
+        super().__init__(status, detail)
+        self.status = status
+        self.detail = detail
+
+
+class FileWrapper:
+    """
+    wsgi.file_wrapper, lets the server send files with sendfile.
+    """
+    def __init__(self, filelike, block_size=CHUNK_SIZE):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.filelike.read(self.block_size), b'')
+
+    def close(self):
+        close = getattr(self.filelike, 'close', None)
+        if close:
+            close()
+
+
+class Deferred:
+    """
+    WSGI body of a response still being computed on the event loop (eg.
+    by an async applet). Apps only return it if environ['hkserver.defer']
+    is set, the server then awaits it on the loop instead of holding a
+    pool thread.
+
+    awaitable resolves to (status, headers, body), status and headers
+    override the ones given to start_response.
+    """
+    def __init__(self, awaitable):
+        self.awaitable = awaitable
+
+    def __iter__(self):
+        raise RuntimeError('Deferred response outside of hkserver')
+
+    async def resolve(self, headers):
+        """
+        Wait for the response, returns (status, headers, body).
+        """
+        (status, update, body) = await self.awaitable
+
+        names = {k.lower() for (k, dummy) in update}
+        headers = [(k, v) for (k, v) in headers if k.lower() not in names]
+        return (status, headers + update, body)
+
+
+def parse_head(data):
+    """
+    Parse request line and headers.
+
+    Returns (method, target, version, headers), header names are
+    lowercased. Targets in absolute form are returned in origin form.
+    """
+    lines = data.decode('latin-1').split('\r\n')
+    try:
+        (method, target, version) = lines[0].split(' ')
+    except ValueError:
+        raise BadRequest('400 Bad Request', 'Malformed request line')
+
+    if not _TOKEN.fullmatch(method):
+        raise BadRequest('400 Bad Request', 'Malformed method')
+
+    if not _TARGET.fullmatch(target):
+        raise BadRequest('400 Bad Request', 'Malformed request target')
+
+    if version not in ('HTTP/1.0', 'HTTP/1.1'):
+        raise BadRequest('505 HTTP Version Not Supported')
+
+    if not target.startswith(('/', '*')):
+        parts = urllib.parse.urlsplit(target)
+        target = (parts.path or '/') + (
+            '?' + parts.query if parts.query else '')
+
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+
+        (name, sep, value) = line.partition(':')
+        if not sep or not _TOKEN.fullmatch(name):
+            raise BadRequest('400 Bad Request', 'Malformed header')
+
+        headers.append((name.lower(), value.strip()))
+
+    return (method, target, version, headers)
+
+
+def get_header(headers, name, default=None):
+    for (k, v) in headers:
+        if k == name:
+            return v
+
+    return default
+
+
+def wants_keepalive(version, headers):
+    conn = get_header(headers, 'connection', '').lower()
+    if version == 'HTTP/1.0':
+        return conn == 'keep-alive'
+
+    return conn != 'close'
+
+
+def make_environ(method, target, version, headers, body, sockname, peername):
+    (path, dummy, query) = target.partition('?')
+
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': urllib.parse.unquote_to_bytes(path).decode('latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': str(sockname[0]),
+        'SERVER_PORT': str(sockname[1]),
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': str(peername[0]) if peername else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': FileWrapper,
+        'hkserver.defer': True,
+    }
+
+    for (name, value) in headers:
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+
+    return environ
+
+
+def call_app(app, environ):
+    """
+    Call WSGI app, returns (status, headers, body).
+
+    Blocks (and so runs in a worker thread): the app does all of its work
+    here, the body is only iterated if it's a stream.
+    """
+    response = []
+    written = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response:
+            raise exc_info[1].with_traceback(exc_info[2])
+
+        response[:] = [status, headers]
+        return written.append
+
+    body = app(environ, start_response)
+
+    # start_response may be delayed until the first chunk
+    if not response:
+        it = iter(body)
+        first = next(it, b'')
+        body = itertools.chain([first], it)
+
+    if written:
+        body = itertools.chain(written, body)
+
+    return (response[0], response[1], body)
+
+
+class Server:
+    """
+    asyncio HTTP/1.1 server for a WSGI app.
+
+    Connections (keep-alive included) are handled by the shared event
+    loop of hkasync, requests are passed to the app in a thread pool. So
+    idle and waiting clients only cost a coroutine and blocking
+    applets don't block each other. Async applets return a Deferred
+    response, awaited on the loop once the app returns its pool thread.
+
+    Why not uvicorn or hypercorn behind a WSGI-to-ASGI adapter: the app
+    is a falcon 1.x WSGI app, an adapter runs it in its own thread pool
+    on the server's loop, so Deferred responses couldn't be awaited on
+    the hkasync loop where applets run their coroutines, and it adds two
+    dependencies for the API of a desktop daemon. In exchange this
+    server only covers what the API needs: HTTP/1.1 with keep-alive and
+    pipelining (requests on a connection are answered in order), chunked
+    or sized request bodies and no TLS, upgrades or 100-continue. It's
+    meant to listen on localhost or behind a reverse proxy.
+    """
+    def __init__(self, app, host='127.0.0.1', port=8000, threads=32,
+                 logger=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.logger = logger
+
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='hk-http')
+        self.server = None
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle, self.host, self.port, limit=MAX_HEADER_SIZE)
+
+    async def stop(self):
+        self.server.close()
+        try:
+            # Newer Pythons wait for open (keep-alive) connections too
+            await asyncio.wait_for(self.server.wait_closed(), 5)
+        except asyncio.TimeoutError:
+            pass
+
+    def serve_forever(self):
+        loop = hkasync.get_loop()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+
+        stopped = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stopped.set())
+
+        try:
+            while not stopped.wait(1):
+                pass
+
+        finally:
+            asyncio.run_coroutine_threadsafe(self.stop(), loop).result()
+            self.pool.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+
+                except asyncio.LimitOverrunError:
+                    await self.send_error(
+                        writer, '431 Request Header Fields Too Large')
+                    break
+
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                        ConnectionError):
+                    break
+
+                try:
+                    (method, target, version, headers) = parse_head(head)
+                    body = await self.read_body(reader, headers)
+
+                    # App gets the decoded body
+                    if get_header(headers, 'transfer-encoding'):
+                        headers = [
+                            (k, v) for (k, v) in headers
+                            if k != 'transfer-encoding'
+                        ] + [('content-length', str(len(body)))]
+
+                except BadRequest as e:
+                    await self.send_error(writer, e.status, e.detail)
+                    break
+
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                environ = make_environ(
+                    method, target, version, headers, body,
+                    writer.get_extra_info('sockname') or ('', 0),
+                    writer.get_extra_info('peername'))
+
+                keepalive = await self.respond(
+                    writer, environ,
+                    keepalive=wants_keepalive(version, headers))
+                if not keepalive:
+                    break
+
+        finally:
+            writer.close()
+
+    async def read_body(self, reader, headers):
+        """
+        Read request body, chunked (Transfer-Encoding) or of
+        Content-Length bytes.
+        """
+        encoding = ', '.join(v for (k, v) in headers
+                             if k == 'transfer-encoding')
+        if encoding:
+            # Both framings in one request is a smuggling attempt
+            # (RFC 7230 3.3.3)
+            if get_header(headers, 'content-length') is not None:
+                raise BadRequest('400 Bad Request',
+                                 'Content-Length with Transfer-Encoding')
+
+            if encoding.lower() != 'chunked':
+                raise BadRequest('501 Not Implemented',
+                                 'Unsupported Transfer-Encoding')
+
+            return await self.read_chunked(reader)
+
+        try:
+            length = int(get_header(headers, 'content-length', 0))
+        except ValueError:
+            raise BadRequest('400 Bad Request', 'Invalid Content-Length')
+
+        if length < 0:
+            raise BadRequest('400 Bad Request', 'Invalid Content-Length')
+
+        if length > MAX_BODY_SIZE:
+            raise BadRequest('413 Payload Too Large')
+
+        if not length:
+            return b''
+
+        return await reader.readexactly(length)
+
+    async def read_chunked(self, reader):
+        async def readline():
+            try:
+                return await reader.readuntil(b'\r\n')
+            except asyncio.LimitOverrunError:
+                raise BadRequest('400 Bad Request', 'Malformed chunk')
+
+        body = bytearray()
+        while True:
+            m = _CHUNK_SIZE.fullmatch(await readline())
+            if not m:
+                raise BadRequest('400 Bad Request', 'Malformed chunk')
+
+            size = int(m.group(1), 16)
+            if not size:
+                break
+
+            if len(body) + size > MAX_BODY_SIZE:
+                raise BadRequest('413 Payload Too Large')
+
+            body += await reader.readexactly(size)
+            if await reader.readexactly(2) != b'\r\n':
+                raise BadRequest('400 Bad Request', 'Malformed chunk')
+
+        # Trailer fields are ignored
+        trailers = 0
+        while True:
+            line = await readline()
+            if line == b'\r\n':
+                break
+
+            trailers += len(line)
+            if trailers > MAX_HEADER_SIZE:
+                raise BadRequest('431 Request Header Fields Too Large')
+
+        return bytes(body)
+
+    async def send_error(self, writer, status, detail=''):
+        body = (detail or status).encode('utf-8')
+        writer.write(
+            'HTTP/1.1 {}\r\n'
+            'Content-Type: text/plain; charset=utf-8\r\n'
+            'Content-Length: {}\r\n'
+            'Connection: close\r\n'
+            '\r\n'.format(status, len(body)).encode('latin-1') + body)
+
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def respond(self, writer, environ, keepalive):
+        """
+        Run the app and write its response, returns if connection can be
+        kept alive.
+        """
+        loop = asyncio.get_running_loop()
+
+        try:
+            (status, headers, body) = await loop.run_in_executor(
+                self.pool, call_app, self.app, environ)
+            if isinstance(body, Deferred):
+                (status, headers, body) = await body.resolve(headers)
+
+        except Exception:
+            if self.logger:
+                self.logger.error(traceback.format_exc())
+
+            await self.send_error(writer, '500 Internal Server Error')
+            return False
+
+        try:
+            return await self.write_response(
+                writer, environ, status, headers, body, keepalive)
+
+        except ConnectionError:
+            return False
+
+        except Exception:
+            # Headers are already sent, all we can do is drop connection
+            if self.logger:
+                self.logger.error(traceback.format_exc())
+
+            return False
+
+        finally:
+            close = getattr(body, 'close', None)
+            if close:
+                await loop.run_in_executor(self.pool, close)
+
+    async def write_response(self, writer, environ, status, headers, body,
+                             keepalive):
+        loop = asyncio.get_running_loop()
+
+        names = {k.lower() for (k, v) in headers}
+        length = None
+        for (k, v) in headers:
+            if k.lower() == 'content-length':
+                length = int(v)
+
+        has_body = (environ['REQUEST_METHOD'] != 'HEAD' and
+                    not status.startswith(('1', '204', '304')))
+
+        # Responses of unknown size are chunked (or end with the connection
+        # on HTTP/1.0)
+        chunked = False
+        if has_body and length is None:
+            if environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+                chunked = True
+                headers = headers + [('Transfer-Encoding', 'chunked')]
+            else:
+                keepalive = False
+
+        if 'connection' not in names:
+            headers = headers + [
+                ('Connection', 'keep-alive' if keepalive else 'close')]
+
+        head = 'HTTP/1.1 {}\r\n'.format(status)
+        head += ''.join('{}: {}\r\n'.format(k, v) for (k, v) in headers)
+        writer.write((head + '\r\n').encode('latin-1'))
+
+        if not has_body:
+            await writer.drain()
+            return keepalive
+
+        if isinstance(body, FileWrapper) and length is not None:
+            await writer.drain()
+            await loop.sendfile(writer.transport, body.filelike,
+                                offset=body.filelike.tell(), count=length)
+            return keepalive
+
+        if isinstance(body, (list, tuple)):
+            for chunk in body:
+                self._write_chunk(writer, chunk, chunked)
+
+        else:
+            it = iter(body)
+            read = functools.partial(next, it, None)
+            while True:
+                chunk = await loop.run_in_executor(self.pool, read)
+                if chunk is None:
+                    break
+
+                self._write_chunk(writer, chunk, chunked)
+                await writer.drain()
+
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+
+        await writer.drain()
+        return keepalive
+
+    @staticmethod
+    def _write_chunk(writer, chunk, chunked):
+        if not chunk:
+            return
+
+        if chunked:
+            writer.write('{:x}\r\n'.format(len(chunk)).encode('latin-1'))
+            writer.write(chunk)
+            writer.write(b'\r\n')
+
+        else:
+            writer.write(chunk)
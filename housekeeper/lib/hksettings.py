@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+_MISSING = object()
+
+_BOOL_STRINGS = {
+    'true': True, 'yes': True, 'on': True, '1': True,
+    'false': False, 'no': False, 'off': False, '0': False, '': False,
+}
+
+
+def coerce(value, type_):
+    # Blank keys (ie. «username:») are None, not «'None'» nor an error
+    if type_ is None or value is None:
+        return value
+
+    if isinstance(type_, type) and isinstance(value, type_):
+        return value
+
+    if type_ is bool and isinstance(value, str):
+        try:
+            return _BOOL_STRINGS[value.strip().lower()]
+        except KeyError as e:
+            raise ValueError(value) from e
+
+    if type_ is list and isinstance(value, (str, bytes)):
+        return [value]
+
+    return type_(value)
+
+
+def key_in_namespace(key, namespace):
+    return (
+        not namespace or
+        key == namespace or
+        key.startswith(namespace + '.') or
+        namespace.startswith(key + '.')
+    )
+
+
+class SettingsView:
+    """
+    View over the settings under some namespace.
+
+    Keys are resolved and coerced using schema (a mapping of keys to types
+    or callables) only once. Cached values are dropped, and subscribers
+    notified, when the underlying store changes something under namespace.
+    """
+    def __init__(self, settings, namespace, schema=None):
+        self.settings = settings
+        self.namespace = namespace.strip('.')
+        self.schema = dict(schema or {})
+
+        self._cache = {}
+        self._subscribers = []
+
+    def _fullkey(self, key):
+        if not self.namespace:
+            return key
+
+        return self.namespace + '.' + key
+
+    def get(self, key, *args, **kwargs):
+        try:
+            value = self._cache[key]
+
+        except KeyError:
+            value = self.settings.get(self._fullkey(key), _MISSING)
+            if value is not _MISSING:
+                value = coerce(value, self.schema.get(key))
+
+            self._cache[key] = value
+
+        if value is not _MISSING:
+            return value
+
+        # Misses are cached too, the store is only asked again to raise its
+        # own error
+        if args:
+            return args[0]
+
+        if 'default' in kwargs:
+            return kwargs['default']
+
+        return self.settings.get(self._fullkey(key))
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def subscribe(self, fn):
+        self._subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        self._subscribers.remove(fn)
+
+    def invalidate(self):
+        self._cache = {}
+
+    def notify(self, key):
+        if not key_in_namespace(key, self.namespace):
+            return
+
+        self.invalidate()
+        for fn in self._subscribers:
+            fn(self, key)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+
+_MISSING = object()
+_DELETED = object()
+_NOTSET = object()
+
+
+def flatten(d, prefix=''):
+    ret = {}
+    for (k, v) in d.items():
+        k = prefix + str(k)
+        if isinstance(v, dict) and v:
+            ret.update(flatten(v, prefix=k + '.'))
+        else:
+            ret[k] = v
+
+    return ret
+
+
+def unflatten(d):
+    ret = {}
+    for (k, v) in d.items():
+        parts = k.split('.')
+        node = ret
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = v
+
+    return ret
+
+
+class StateStore:
+    """
+    Key-value state backed by SQLite in WAL mode.
+
+    Every key is a row, so updating a key doesn't rewrite the whole state.
+    Inside a batch() writes are buffered in memory (and visible to readers
+    of this object) and committed in a single transaction at the end.
+    Connections are re-opened after fork.
+    """
+    def __init__(self, path, timeout=30, logger=None):
+        self.path = path
+        self.timeout = timeout
+        self.logger = logger
+
+        self._pid = None
+        self._check_fork()
+
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+
+        # Connection, lock and pending writes belong to parent process
+        # (which will commit them), start from scratch
+        self._pid = os.getpid()
+        self._conn = None
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._batch_depth = 0
+
+    @property
+    def conn(self):
+        self._check_fork()
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS state ('
+                '   key TEXT PRIMARY KEY,'
+                '   value TEXT NOT NULL'
+                ')')
+
+        return self._conn
+
+    def close(self):
+        self._check_fork()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+
+            self._conn = None
+
+    def get(self, key, default=_NOTSET):
+        self._check_fork()
+        with self._lock:
+            value = self._pending.get(key, _MISSING)
+            if value is _MISSING:
+                row = self.conn.execute(
+                    'SELECT value FROM state WHERE key = ?',
+                    (key,)).fetchone()
+                value = row[0] if row else _DELETED
+
+        if value is _DELETED:
+            if default is _NOTSET:
+                raise KeyError(key)
+
+            return default
+
+        return json.loads(value)
+
+    def get_prefix(self, prefix, unflatten_=False):
+        """
+        Get all keys starting with prefix as a dict with prefix stripped.
+        """
+        escaped = (prefix.replace('\\', '\\\\')
+                         .replace('%', '\\%')
+                         .replace('_', '\\_'))
+
+        self._check_fork()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, value FROM state WHERE key LIKE ? ESCAPE '\\'",
+                (escaped + '%',)).fetchall()
+
+            ret = dict(rows)
+            for (k, v) in self._pending.items():
+                if not k.startswith(prefix):
+                    continue
+
+                if v is _DELETED:
+                    ret.pop(k, None)
+                else:
+                    ret[k] = v
+
+        ret = {k[len(prefix):]: json.loads(v) for (k, v) in ret.items()}
+        return unflatten(ret) if unflatten_ else ret
+
+    def set(self, key, value, sync=False):
+        self.set_many({key: value}, sync=sync)
+
+    def delete(self, key, sync=False):
+        self.set_many({key: _DELETED}, sync=sync)
+
+    def set_many(self, mapping, sync=False):
+        """
+        Set keys from mapping.
+
+        With sync changes are committed right now, even inside a batch()
+        (pending changes of the batch are committed too). Values are
+        encoded right away, ones JSON can't encode raise TypeError or
+        ValueError here and nothing from mapping is set.
+        """
+        encoded = {k: v if v is _DELETED else json.dumps(v)
+                   for (k, v) in mapping.items()}
+
+        self._check_fork()
+        with self._lock:
+            self._pending.update(encoded)
+            if sync or not self._batch_depth:
+                self._flush()
+
+    @contextlib.contextmanager
+    def batch(self):
+        self._check_fork()
+        with self._lock:
+            self._batch_depth += 1
+
+        try:
+            yield self
+
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._flush()
+
+    def _flush(self):
+        # Called with self._lock held. Pending writes (already encoded)
+        # are kept until they are committed, a flush failed on a database
+        # error (ie. locked) is retried by the next one
+        if not self._pending:
+            return
+
+        updates = [(k, v) for (k, v) in self._pending.items()
+                   if v is not _DELETED]
+        deletes = [(k,) for (k, v) in self._pending.items()
+                   if v is _DELETED]
+
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                updates)
+            conn.executemany('DELETE FROM state WHERE key = ?', deletes)
+            conn.execute('COMMIT')
+
+        except BaseException as e:
+            conn.execute('ROLLBACK')
+            if not isinstance(e, sqlite3.Error):
+                self._pending = {}
+
+            raise
+
+        self._pending = {}
+
+    def migrate_json(self, json_path):
+        """
+        Import state from a legacy JSON state file.
+
+        The JSON file is renamed so migration happens only once.
+        Returns True if something was migrated.
+        """
+        try:
+            with open(json_path) as fh:
+                data = json.load(fh)
+
+        except FileNotFoundError:
+            return False
+
+        except ValueError as e:
+            if self.logger:
+                msg = ("State file «{path}» is corrupt, ignoring it "
+                       "(kept as {path}.migrated): {e}")
+                msg = msg.format(path=json_path, e=e)
+                self.logger.warning(msg)
+
+            data = {}
+
+        with self.batch():
+            for (k, v) in flatten(data or {}).items():
+                if self.get(k, _MISSING) is _MISSING:
+                    self.set(k, v)
+
+        os.rename(json_path, json_path + '.migrated')
+        return True
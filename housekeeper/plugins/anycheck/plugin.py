@@ -44,8 +44,12 @@ class Task(pluginlib.Task):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        u = self.settings.get('anycheck.username', None)
-        p = self.settings.get('anycheck.password', None)
+        config = self.settings.view('anycheck', {
+            'username': str,
+            'password': str
+        })
+        u = config.get('username', None)
+        p = config.get('password', None)
 
         if not u or not p:
             msg = "Please check username/password in your configuration"
@@ -2,7 +2,8 @@ from housekeeper import pluginlib
 from housekeeper.lib import hkfilesystem, hkdatetime
 
 
-def archive(source, delta, destination=None, dry_run=False):
+def archive(source, delta, destination=None, dry_run=False,
+            resume_from=None, checkpoint=None):
     source = hkfilesystem.pathname_normalize(source)
 
     if destination is None:
@@ -17,7 +18,9 @@ def archive(source, delta, destination=None, dry_run=False):
         destination,
         diff=delta,
         filter_func=is_archivable_filter,
-        dry_run=dry_run)
+        dry_run=dry_run,
+        resume_from=resume_from,
+        checkpoint=checkpoint)
 
     if dry_run:
         for (op, *args) in ret:
@@ -49,7 +52,8 @@ class ArchiveCommand(pluginlib.Applet):
         pluginlib.Parameter('source', abbr='f', required=True),
         pluginlib.Parameter('destination', abbr='t', required=False),
         pluginlib.Parameter('delta', abbr='d', required=True),
-        pluginlib.Parameter('dry-run', abbr='n', action='store_true', required=False)
+        pluginlib.Parameter('dry-run', abbr='n', action='store_true',
+                            required=False)
     )
 
     def main(self, source, delta, destination=None, dry_run=False):
@@ -63,13 +67,32 @@ class ArchiveCommand(pluginlib.Applet):
 class CronTask(pluginlib.Task):
     __extension_name__ = 'archive'
     INTERVAL = '1H'
+    PRIORITY = 'batch'
+    HEAVY = True
 
     def execute(self, core):
-        for params in core.settings.get('archive', []):
-            archive(**params)
+        # Cursor: {'source': ..., 'dir': last processed dir} of the
+        # archive being processed when last run was interrupted
+        cursor = self.cursor or {}
+        archives = core.settings.get('archive', [])
+
+        sources = [x.get('source') for x in archives]
+        try:
+            start = sources.index(cursor.get('source'))
+        except ValueError:
+            start, cursor = 0, {}
+
+        for params in archives[start:]:
+            def _checkpoint(dirpath, source=params.get('source')):
+                self.checkpoint({'source': source, 'dir': dirpath})
+
+            archive(**params,
+                    resume_from=cursor.get('dir'),
+                    checkpoint=_checkpoint)
+            cursor = {}
 
 
 __housekeeper_extensions__ = [
     ArchiveCommand,
     CronTask
-]
\ No newline at end of file
+]
@@ -33,6 +33,9 @@ from appkit import store
 __ME__ = 'background-changer'
 
 SETTINGS_NS = __ME__
+SETTINGS_SCHEMA = {
+    'directories': list
+}
 DIRECTORIES_KEY = __ME__ + ".directories"
 
 
@@ -112,7 +115,8 @@ class Task(pluginlib.Task):
         logger = app.logger.getChild(__ME__)
 
         try:
-            dirs = app.settings.get(DIRECTORIES_KEY)
+            dirs = app.settings.view(SETTINGS_NS, SETTINGS_SCHEMA).get(
+                'directories')
 
         except store.KeyNotFoundError as e:
             msg = "Plugin not configured, check {key} value"
@@ -145,13 +149,14 @@ class Command(pluginlib.Command):
     def __init__(self, settings, *args, **kwargs):
         super().__init__(settings, *args, **kwargs)
         self.settings = settings
+        self.config = settings.view(SETTINGS_NS, SETTINGS_SCHEMA)
 
     def execute(self, app, arguments):
         logger = app.logger.getChild(__ME__)
 
         try:
             dirs = (arguments.dirs or
-                    self.settings.get(__ME__ + '.directories', []))
+                    self.config.get('directories', []))
 
         except store.KeyNotFoundError as e:
             msg = "Plugin not configured, check {key} value"
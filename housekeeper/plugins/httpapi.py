@@ -20,9 +20,16 @@
 
 from housekeeper import core
 from housekeeper import kit
+from housekeeper.lib import (
+    hkhttp,
+    hkrunstats,
+    hkserver
+)
 
 
+import gc
 import multiprocessing
+import os
 
 
 import gunicorn.app.base
@@ -44,6 +51,31 @@ class StandaloneApplication(gunicorn.app.base.BaseApplication):
         return self.application
 
 
+def _freeze_heap(server):
+    # Everything built by the master (core, settings, extensions) is moved
+    # out of the collector's reach: workers won't write into (and so copy)
+    # those pages when collecting
+    gc.collect()
+    gc.freeze()
+
+    msg = "Preloaded: {rss:.1f} MiB resident, {n} objects frozen"
+    msg = msg.format(rss=hkrunstats.read_rss() / 1024 / 1024,
+                     n=gc.get_freeze_count())
+    server.log.info(msg)
+
+
+def _report_worker_memory(worker):
+    uss = hkrunstats.read_uss()
+    if uss is None:
+        return
+
+    msg = "Worker {pid}: {uss:.1f} MiB unique of {rss:.1f} MiB resident"
+    msg = msg.format(pid=worker.pid,
+                     uss=uss / 1024 / 1024,
+                     rss=hkrunstats.read_rss() / 1024 / 1024)
+    worker.log.info(msg)
+
+
 class APIServerCommand(kit.Command):
     __extension_name__ = 'httpapi'
     HELP = 'Start HTTP API server'
@@ -51,13 +83,43 @@ class APIServerCommand(kit.Command):
         kit.Parameter('bind', default='127.0.0.1:8000'),
         kit.Parameter('static-folder', default=None),
         kit.Parameter('reload', default=False, action='store_true'),
-        kit.Parameter('workers', default=None)
+        kit.Parameter('workers', default=None),
+        kit.Parameter('watch-config', default='2'),
+        kit.Parameter('server', default='gunicorn',
+                      choices=['gunicorn', 'async']),
+        kit.Parameter('threads', default='32'),
+        kit.Parameter('preload', default=False, action='store_true'),
     )
 
     def execute(self, hk_app, arguments):
+        api_server = core.APIServer(
+            hk_app,
+            static_folder=arguments.static_folder,
+            watch_config=float(arguments.watch_config or 0)
+        )
+
+        if arguments.server == 'async':
+            self.run_async(hk_app, api_server, arguments)
+        else:
+            self.run_gunicorn(hk_app, api_server, arguments)
+
+    def run_async(self, hk_app, api_server, arguments):
+        if arguments.reload or arguments.workers:
+            hk_app.logger.warning("--reload and --workers are ignored by "
+                                  "the async server")
+
+        (host, dummy, port) = arguments.bind.rpartition(':')
+        server = hkserver.Server(
+            api_server,
+            host=host or '127.0.0.1',
+            port=int(port),
+            threads=int(arguments.threads),
+            logger=hk_app.logger.getChild('httpapi'))
+        server.serve_forever()
+
+    def run_gunicorn(self, hk_app, api_server, arguments):
         bind = arguments.bind
         reload = bool(arguments.reload)
-        static_folder = arguments.static_folder
         if arguments.workers:
             workers = int(arguments.workers)
         else:
@@ -73,14 +135,46 @@ class APIServerCommand(kit.Command):
             'workers': workers
         }
 
-        api_server = core.APIServer(
-            hk_app,
-            static_folder=static_folder
-        )
+        # APIServer is already built here, in the master. Preload only
+        # freezes the master's heap (gc.freeze) before forking workers and
+        # reports their memory, nothing is re-initialized in them
+        if arguments.preload:
+            options.update({
+                'preload_app': True,
+                'when_ready': _freeze_heap,
+                'post_worker_init': _report_worker_memory,
+            })
+
         server = StandaloneApplication(api_server, options)
         server.run()
 
 
+class CompressStaticCommand(kit.Command):
+    __extension_name__ = 'compress-static'
+    HELP = 'Write .gz/.br sidecars of static files for the API server'
+    PARAMETERS = (
+        kit.Parameter('static-folder', required=True),
+        kit.Parameter('force', default=False, action='store_true'),
+    )
+
+    def execute(self, hk_app, arguments):
+        if hkhttp.brotli is None:
+            hk_app.logger.warning("brotli module not available, only gzip "
+                                  "sidecars will be written")
+
+        for (dirpath, dirnames, filenames) in os.walk(arguments.static_folder):
+            for filename in filenames:
+                if not filename.endswith(hkhttp.COMPRESSIBLE):
+                    continue
+
+                written = hkhttp.compress_file(
+                    os.path.join(dirpath, filename),
+                    force=arguments.force)
+                for x in written:
+                    print(x)
+
+
 __housekeeper_extensions__ = [
-    APIServerCommand
+    APIServerCommand,
+    CompressStaticCommand
 ]
@@ -55,6 +55,18 @@ class MusicPlay(pluginlib.Applet):
         }
 
 
+class MusicSearch(pluginlib.Applet):
+    PARAMETERS = (
+        pluginlib.Parameter('query', abbr='q', type=str, required=True),
+    )
+    METHODS = ['POST']
+
+    def main(self, query):
+        # Generator: results are streamed to API clients
+        return ({'id': x.id, 'name': x.name}
+                for x in self.root.appbridge.search(query))
+
+
 class MusicStop(pluginlib.Applet):
     METHODS = ['POST']
 
@@ -76,15 +88,20 @@ class Music(pluginlib.Applet):
     CHILDREN = (
         ('play', MusicPlay),
         ('pause', MusicPause),
+        ('search', MusicSearch),
         ('stop', MusicStop),
     )
 
     METHODS = ['GET']
 
+    # State comes from a D-Bus round trip and the UI polls it, POSTs to
+    # children invalidate it
+    CACHE_TTL = 2
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        bridge = self.srvs.settings.get(self.SETTINGS_NS + 'bridge')
+        bridge = self.config.get('bridge')
         self.appbridge = self.srvs.extension_manager.get_extension(
             pluginlib.AppBridge, bridge)
 
@@ -96,11 +113,19 @@ class Music(pluginlib.Applet):
         if ret is None:
             return
 
-        if not isinstance(ret, dict):
+        # State is a dict, search results a list of them
+        if isinstance(ret, dict):
+            ret = [ret]
+
+        if not isinstance(ret, list):
             raise TypeError(ret)
 
-        for (k, v) in ret.items():
-            print("'{}':\t'{}'".format(k, v))
+        for (idx, item) in enumerate(ret):
+            if idx:
+                print()
+
+            for (k, v) in item.items():
+                print("'{}':\t'{}'".format(k, v))
 
 
 class MusicApplet(Music):
@@ -20,25 +20,35 @@
 
 from housekeeper import pluginlib
 from housekeeper import tools
+from housekeeper.lib import hkfingerprint
 from housekeeper.plugins.sync import sync
 
 
 class Task(pluginlib.Task):
     __extension_name__ = 'sync'
     INTERVAL = '0'
+    PRIORITY = 'batch'
+    HEAVY = True
+    SETTINGS_NS = 'plugins.sync'
+    SETTINGS_SCHEMA = {
+        'exclude': list
+    }
 
     def __init__(self, settings):
         super().__init__(settings)
+        self.config = settings.view(self.SETTINGS_NS, self.SETTINGS_SCHEMA)
 
         # Parse options
         self.api = sync.SyncAPI(
-            exclude=settings.get('plugins.sync.exclude', default=[])
+            exclude=self.config.get('exclude', default=[])
         )
 
     def get_syncs(self):
         syncs = self.settings.get('syncs', default=[])
 
         for (id_, opts) in tools.walk_collection(syncs):
+            # Don't modify settings, syncs may be read more than once
+            opts = dict(opts)
             genname = opts.pop('generator')
             genopts = {}
 
@@ -56,6 +66,27 @@ class Task(pluginlib.Task):
 
             yield sync.SyncOperation(generator=gen, **opts)
 
-    def execute(self, app):
+    def inputs(self, core):
+        ret = [
+            hkfingerprint.Settings('syncs'),
+            hkfingerprint.Settings(self.SETTINGS_NS),
+        ]
+        # rsync compares both sides, the destination may be changed (or
+        # replaced by another mount) behind our back
         for op in self.get_syncs():
-            self.api.sync(op)
+            ret.extend(op.generator.inputs())
+            ret.append(hkfingerprint.Tree(op.source))
+            ret.append(hkfingerprint.Tree(op.destination))
+
+        return ret
+
+    def execute(self, app):
+        # Cursor is the number of operations done by an interrupted run
+        done = self.cursor or 0
+
+        for (idx, op) in enumerate(self.get_syncs()):
+            if idx < done:
+                continue
+
+            self.api.sync(op, priority=app.cron.task_priority(self))
+            self.checkpoint(idx + 1)
@@ -24,7 +24,11 @@ import tempfile
 from os import path
 
 from appkit import utils as kitutils
-from housekeeper.lib import hkfilesystem
+from housekeeper.lib import (
+    hkfilesystem,
+    hkfingerprint,
+    hkpriority
+)
 
 _registry = {}
 
@@ -36,7 +40,7 @@ class SyncAPI:
     def archive(self, operation):
         pass
 
-    def sync(self, operation):
+    def sync(self, operation, priority='normal'):
         items = operation.generator.scan()
 
         # Strip items not under root
@@ -48,7 +52,7 @@ class SyncAPI:
         with os.fdopen(fd, mode='w') as fh:
             fh.write("\n".join(items) + "\n")
 
-        args = [
+        args = hkpriority.command_prefix(priority) + [
             '/usr/bin/rsync',
             '--delete',
             '--delete-after',
@@ -156,6 +160,9 @@ class Filesystem:
 
         self.directory = tools.pathname_ensure_slash(directory)
 
+    def inputs(self):
+        return [hkfingerprint.Dir(self.directory)]
+
     def scan(self):
         for (dirpath, dirs, files) in os.walk(self.directory):
             yield from (dirpath + '/' + x for x in dirs)
@@ -178,6 +185,9 @@ class Banshee:
         self.playlist = playlist
         self.database = database
 
+    def inputs(self):
+        return [hkfingerprint.File(self.database)]
+
     def scan(self):
         conn = sqlite3.connect(self.database)
         cur = conn.cursor()
@@ -233,6 +243,9 @@ class Shotwell:
         self.tags = tags
         self.score = score
 
+    def inputs(self):
+        return [hkfingerprint.File(self.database)]
+
     def scan(self):
         conn = sqlite3.connect(self.database)
         cur = conn.cursor()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+
+from housekeeper import kit
+from housekeeper.lib import (
+    hkexecutor,
+    hkfingerprint,
+    hkstate
+)
+
+
+class FakeCore:
+    def __init__(self):
+        self.logger = logging.getLogger('housekeeper-test')
+        self.settings = kit.YAMLStore()
+
+
+class FakeTask:
+    def __init__(self, name, depends=()):
+        self.__extension_name__ = name
+        self.DEPENDS = depends
+
+
+def make_manager(tmpdir):
+    # Skip CronManager.__init__, it needs the full appkit machinery
+    manager = kit.CronManager.__new__(kit.CronManager)
+    manager.core = FakeCore()
+    manager._state = hkstate.StateStore(
+        os.path.join(tmpdir, 'state.sqlite'))
+    manager._state_lock = threading.Lock()
+    return manager
+
+
+class DependsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.manager = make_manager(self.tmpdir)
+        self.tasks = {
+            'a': FakeTask('a'),
+            'b': FakeTask('b', depends=('a',)),
+            'c': FakeTask('c', depends=('b', 'missing')),
+        }
+
+    def tearDown(self):
+        self.manager.state.close()
+        shutil.rmtree(self.tmpdir)
+
+    def finish(self, name, now, ok=True):
+        self.manager.state.set('cron.lastrun.' + name, now)
+        if ok:
+            self.manager.state.set('cron.lastok.' + name, now)
+
+    def hold(self, *names):
+        (due, held) = self.manager.hold_dependants(
+            {name: self.tasks[name] for name in names}, self.tasks)
+        return (sorted(due), held)
+
+    def test_same_batch(self):
+        self.assertEqual(self.hold('a', 'b', 'c'), (['a', 'b', 'c'], {}))
+
+    def test_never_ran(self):
+        self.assertEqual(self.hold('b'), ([], {'b': ['a']}))
+
+    def test_two_ticks(self):
+        self.finish('a', 100)
+        self.finish('b', 110)
+        self.finish('c', 120)
+
+        # Tick 1: b's schedule drifted ahead of a's, it must wait for a
+        # and hold c too
+        self.assertEqual(self.hold('b', 'c'),
+                         ([], {'b': ['a'], 'c': ['b']}))
+
+        # Tick 2: a ran in between, b is released and c runs after it
+        self.finish('a', 130)
+        self.assertEqual(self.hold('b', 'c'), (['b', 'c'], {}))
+
+        # Next time c alone is due it waits for b again
+        self.finish('b', 135)
+        self.finish('c', 140)
+        self.assertEqual(self.hold('c'), ([], {'c': ['b']}))
+
+    def test_failed_prerequisite(self):
+        self.finish('a', 100)
+        self.finish('b', 110)
+        self.finish('a', 130, ok=False)
+        self.assertEqual(self.hold('b'), ([], {'b': ['a']}))
+
+
+class MemoizedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.manager = make_manager(self.tmpdir)
+        self.manager.execute_resumable = lambda task, timeout=None: task()
+
+        self.path = os.path.join(self.tmpdir, 'output')
+
+        # Task writing to its own input, like a sync to its destination
+        def task():
+            with open(self.path, 'a') as fh:
+                fh.write('x')
+
+        task.__extension_name__ = 'task'
+        task.inputs = lambda core: [hkfingerprint.File(self.path)]
+        self.task = task
+
+    def tearDown(self):
+        self.manager.state.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_fingerprint_after_run(self):
+        self.manager.execute_memoized(self.task)
+        with self.assertRaises(hkexecutor.Cached):
+            self.manager.execute_memoized(self.task)
+
+        with open(self.path, 'a') as fh:
+            fh.write('y')
+
+        self.manager.execute_memoized(self.task)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+
+from housekeeper import daemon
+
+
+class FakeCore:
+    logger = logging.getLogger('test-daemon')
+
+    def can_handle_argv(self, argv):
+        return argv[0] != 'reject'
+
+    def settings_changed(self):
+        return False
+
+    def execute_from_command_line(self):
+        if sys.argv[1] == 'fail':
+            sys.exit(3)
+
+        os.write(1, ' '.join(sys.argv[1:]).encode('utf-8'))
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'hk.sock')
+        self.outfile = os.path.join(self.tmpdir, 'out')
+
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                daemon.Daemon(FakeCore(), path=self.path).serve()
+            finally:
+                os._exit(0)
+
+        for dummy in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        os.kill(self.pid, signal.SIGKILL)
+        os.waitpid(self.pid, 0)
+        shutil.rmtree(self.tmpdir)
+
+    def run_client(self, argv):
+        # Redirect stdout into a file, client passes fd 1 to the daemon
+        saved = os.dup(1)
+        fd = os.open(self.outfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.dup2(fd, 1)
+        os.close(fd)
+        try:
+            ret = daemon.run_client(argv, path=self.path)
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+
+        with open(self.outfile) as fh:
+            return ret, fh.read()
+
+    def test_forward(self):
+        self.assertEqual(
+            self.run_client(['foo', '--bar']),
+            (0, 'foo --bar')
+        )
+
+    def test_exit_code(self):
+        self.assertEqual(
+            self.run_client(['fail']),
+            (3, '')
+        )
+
+    def test_rejected(self):
+        self.assertEqual(
+            self.run_client(['reject']),
+            (None, '')
+        )
+
+    def test_insecure_dir(self):
+        os.chmod(self.tmpdir, 0o755)
+        try:
+            self.assertEqual(daemon.run_client(['foo'], path=self.path),
+                             None)
+        finally:
+            os.chmod(self.tmpdir, 0o700)
+
+    def test_serve_refuses_insecure_dir(self):
+        rundir = os.path.join(self.tmpdir, 'shared')
+        os.mkdir(rundir, 0o777)
+        os.chmod(rundir, 0o777)
+
+        d = daemon.Daemon(FakeCore(), path=os.path.join(rundir, 'hk.sock'))
+        with self.assertRaises(RuntimeError):
+            d.serve()
+
+    def test_socket_mode(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_no_runtime_dir(self):
+        saved = os.environ.pop('XDG_RUNTIME_DIR', None)
+        try:
+            self.assertEqual(daemon.socket_path(), None)
+            self.assertEqual(daemon.run_client(['foo']), None)
+        finally:
+            if saved is not None:
+                os.environ['XDG_RUNTIME_DIR'] = saved
+
+    def test_no_daemon(self):
+        self.assertEqual(
+            daemon.run_client(['foo'], path=self.path + '.missing'),
+            None
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
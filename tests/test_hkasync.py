@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import asyncio
+import threading
+import time
+
+
+from housekeeper.lib import hkasync
+
+
+class ResolveTest(unittest.TestCase):
+    def test_plain_value(self):
+        self.assertEqual(hkasync.resolve(1), 1)
+
+    def test_coroutine(self):
+        async def main(x):
+            await asyncio.sleep(0)
+            return x * 2
+
+        self.assertEqual(hkasync.resolve(main(2)), 4)
+
+    def test_overlap(self):
+        async def main():
+            await asyncio.sleep(0.3)
+
+        ths = [threading.Thread(target=hkasync.resolve, args=(main(),))
+               for x in range(5)]
+
+        t0 = time.monotonic()
+        for th in ths:
+            th.start()
+        for th in ths:
+            th.join()
+
+        self.assertLess(time.monotonic() - t0, 1)
+
+    def test_timeout(self):
+        cancelled = threading.Event()
+
+        async def main():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(TimeoutError):
+            hkasync.resolve(main(), timeout=0.1)
+
+        self.assertTrue(cancelled.wait(1))
+
+    def test_offload(self):
+        async def main():
+            return await hkasync.offload(threading.get_ident)
+
+        self.assertNotEqual(hkasync.resolve(main()), threading.get_ident())
+
+
+if __name__ == '__main__':
+    unittest.main()
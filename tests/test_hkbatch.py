@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import concurrent.futures
+import threading
+import time
+
+
+from housekeeper.lib import hkbatch
+from housekeeper.lib.hkcache import TTLCache
+
+
+class Endpoint:
+    """
+    Mimics APIEndpoint.handle: cached GET, POST invalidates.
+    """
+    METHODS = ['GET', 'POST']
+
+    def __init__(self):
+        self.value = 0
+        self.cache = TTLCache(60)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        return ('200 OK', {'result': self.value})
+
+    def handle(self, method, params=None):
+        if method not in self.METHODS:
+            return ('405 Method Not Allowed', None)
+
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        try:
+            time.sleep(0.01)
+            if method == 'GET':
+                return self.cache.get_or_compute('GET', self.get)
+
+            if params is None:
+                return ('406 Not Acceptable', None)
+
+            self.value = params['value']
+            self.cache.invalidate()
+            return ('200 OK', {'result': None})
+
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class Failing:
+    def handle(self, method, params=None):
+        raise ValueError('boom')
+
+
+class Streaming:
+    def handle(self, method, params=None):
+        return ('200 OK', {'result': (x for x in range(3))})
+
+
+class Waiting:
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    def handle(self, method, params=None):
+        self.barrier.wait(timeout=5)
+        return ('200 OK', {'result': True})
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self.music = Endpoint()
+        self.endpoints = {
+            'music': self.music,
+            'music/play': self.music,
+            'failing': Failing(),
+            'stream': Streaming(),
+        }
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def run_batch(self, calls, **kwargs):
+        return hkbatch.run(calls, self.endpoints.get, self.pool, **kwargs)
+
+    def test_order_and_status(self):
+        results = self.run_batch([
+            {'path': '/stream/'},
+            {'path': 'missing'},
+            {'path': 'failing'},
+            {'path': 'music', 'method': 'delete'},
+            {'path': 'music'},
+        ])
+        self.assertEqual(results, [
+            {'status': 200, 'result': [0, 1, 2]},
+            {'status': 404},
+            {'status': 500, 'error': 'boom'},
+            {'status': 405},
+            {'status': 200, 'result': 0},
+        ])
+
+    def test_bad_calls(self):
+        results = self.run_batch([
+            'music',
+            {'method': 'GET'},
+            {'path': 'music', 'params': [1]},
+            {'path': 'music', 'params': {'value': 1}},
+            {'path': 'music/play', 'method': 'POST'},
+        ])
+        self.assertEqual([x['status'] for x in results],
+                         [400, 400, 400, 400, 406])
+        self.assertEqual(results[3]['error'], "GET calls don't take params")
+
+    def test_same_root_sequential(self):
+        calls = [{'path': 'music'}, {'path': 'music/play'}] * 4
+        self.run_batch(calls)
+        self.assertEqual(self.music.max_active, 1)
+
+    def test_roots_concurrent(self):
+        # Both calls must be running at once to pass the barrier
+        barrier = threading.Barrier(2)
+        self.endpoints['a'] = Waiting(barrier)
+        self.endpoints['b'] = Waiting(barrier)
+
+        results = self.run_batch([{'path': 'a'}, {'path': 'b'}])
+        self.assertEqual([x['status'] for x in results], [200, 200])
+
+    def test_post_invalidates_cache(self):
+        results = self.run_batch([
+            {'path': 'music'},
+            {'path': 'music/play', 'method': 'POST',
+             'params': {'value': 2}},
+            {'path': 'music'},
+        ])
+        self.assertEqual([x.get('result') for x in results], [0, None, 2])
+
+    def test_max_calls(self):
+        self.assertEqual(len(self.run_batch([{'path': 'music'}] * 3,
+                                            max_calls=3)), 3)
+
+        with self.assertRaises(hkbatch.InvalidBatch):
+            self.run_batch([{'path': 'music'}] * 4, max_calls=3)
+
+        with self.assertRaises(hkbatch.InvalidBatch):
+            self.run_batch({'path': 'music'})
+
+        with self.assertRaises(hkbatch.InvalidBatch):
+            self.run_batch([{'path': 'music'}] * (hkbatch.MAX_CALLS + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
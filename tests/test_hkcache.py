@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import asyncio
+
+
+from housekeeper.lib.hkcache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(10, clock=self.clock)
+
+    def test_expire(self):
+        self.cache.put('a', 1)
+        self.clock.now = 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.now = 10
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertEqual(self.cache.stats(),
+                         {'ttl': 10, 'size': 0, 'hits': 1, 'misses': 1})
+
+    def test_get_or_compute(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.cache.get_or_compute('a', fn), 1)
+        self.assertEqual(self.cache.get_or_compute('a', fn), 1)
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get_or_compute('a', fn), 2)
+
+    def test_not_cacheable(self):
+        self.cache.get_or_compute('a', lambda: None,
+                                  cacheable=lambda x: x is not None)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_invalidated_while_computing(self):
+        def fn():
+            self.cache.invalidate()
+            return 'stale'
+
+        self.assertEqual(self.cache.get_or_compute('a', fn), 'stale')
+        self.assertEqual(self.cache.get('a'), None)
+
+    def test_get_or_compute_async(self):
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0)
+            return len(calls)
+
+        def run():
+            return asyncio.run(self.cache.get_or_compute_async('a', fn))
+
+        self.assertEqual(run(), 1)
+        self.assertEqual(run(), 1)
+        self.cache.invalidate()
+        self.assertEqual(run(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
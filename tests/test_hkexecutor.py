@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import os
+import sys
+import threading
+import time
+
+
+from housekeeper.lib.hkexecutor import (
+    Job,
+    Outcome,
+    TaskExecutor
+)
+
+
+def _fail():
+    raise ValueError('boom')
+
+
+def _exit():
+    sys.exit(3)
+
+
+def _interrupt():
+    raise KeyboardInterrupt()
+
+
+def _sleep(secs):
+    time.sleep(secs)
+
+
+class TaskExecutorTest(unittest.TestCase):
+    def outcomes(self, results):
+        return {x.name: x.outcome for x in results}
+
+    def test_error_isolation(self):
+        results = TaskExecutor().run([
+            Job('ok', lambda: None),
+            Job('fail', _fail),
+        ])
+
+        self.assertEqual(
+            self.outcomes(results),
+            {'ok': Outcome.OK, 'fail': Outcome.ERROR})
+        error = [x.error for x in results if x.name == 'fail'][0]
+        self.assertIn('boom', error)
+
+    def test_base_exceptions(self):
+        for mode in TaskExecutor.MODES:
+            results = TaskExecutor(mode=mode).run([
+                Job('ok', lambda: None),
+                Job('exit', _exit, timeout=10),
+                Job('interrupt', _interrupt, timeout=10),
+            ])
+
+            self.assertEqual(
+                self.outcomes(results),
+                {'ok': Outcome.OK, 'exit': Outcome.ERROR,
+                 'interrupt': Outcome.ERROR})
+            error = [x.error for x in results if x.name == 'exit'][0]
+            self.assertEqual(error, 'SystemExit: 3')
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(2, timeout=5)
+        results = TaskExecutor(max_workers=2).run([
+            Job('a', barrier.wait),
+            Job('b', barrier.wait),
+        ])
+
+        self.assertEqual(
+            self.outcomes(results),
+            {'a': Outcome.OK, 'b': Outcome.OK})
+
+    def test_thread_timeout(self):
+        t0 = time.time()
+        results = TaskExecutor().run([
+            Job('slow', _sleep, args=(2,), timeout=0.2),
+            Job('fast', lambda: None),
+        ])
+
+        self.assertLess(time.time() - t0, 1.5)
+        self.assertEqual(
+            self.outcomes(results),
+            {'slow': Outcome.TIMEOUT, 'fast': Outcome.OK})
+
+    def test_process_timeout(self):
+        t0 = time.time()
+        results = TaskExecutor(mode='process').run([
+            Job('slow', _sleep, args=(10,), timeout=0.2),
+            Job('fail', _fail),
+            Job('pid', os.getpid),
+        ])
+
+        self.assertLess(time.time() - t0, 5)
+        self.assertEqual(
+            self.outcomes(results),
+            {'slow': Outcome.TIMEOUT, 'fail': Outcome.ERROR,
+             'pid': Outcome.OK})
+
+    def test_concurrency_limit(self):
+        executor = TaskExecutor()
+        event = threading.Event()
+
+        first = executor.submit(Job('x', event.wait, args=(5,)))
+        second = executor.submit(Job('x', lambda: None))
+        self.assertEqual(second.result().outcome, Outcome.SKIPPED)
+
+        event.set()
+        self.assertEqual(first.result().outcome, Outcome.OK)
+
+    def test_graph(self):
+        order = []
+        results = TaskExecutor(max_workers=4).run_graph([
+            Job('archive', order.append, args=('archive',)),
+            Job('sync', order.append, args=('sync',)),
+            Job('podcast', order.append, args=('podcast',)),
+            Job('other', order.append, args=('other',)),
+        ], {
+            'sync': ['archive'],
+            'podcast': ['sync', 'missing'],
+        })
+
+        self.assertEqual(
+            self.outcomes(results),
+            {'archive': Outcome.OK, 'sync': Outcome.OK,
+             'podcast': Outcome.OK, 'other': Outcome.OK})
+        self.assertLess(order.index('archive'), order.index('sync'))
+        self.assertLess(order.index('sync'), order.index('podcast'))
+
+    def test_graph_failed_dependency(self):
+        results = list(TaskExecutor().run_graph([
+            Job('archive', _fail),
+            Job('sync', lambda: None),
+            Job('podcast', lambda: None),
+            Job('other', lambda: None),
+        ], {
+            'sync': ['archive'],
+            'podcast': ['sync'],
+        }))
+
+        self.assertEqual(
+            self.outcomes(results),
+            {'archive': Outcome.ERROR, 'sync': Outcome.SKIPPED,
+             'podcast': Outcome.SKIPPED, 'other': Outcome.OK})
+
+    def test_graph_cycle(self):
+        results = list(TaskExecutor().run_graph([
+            Job('archive', lambda: None),
+            Job('sync', lambda: None),
+            Job('podcast', lambda: None),
+            Job('other', lambda: None),
+        ], {
+            'archive': ['sync'],
+            'sync': ['archive'],
+            'podcast': ['sync'],
+        }))
+
+        self.assertEqual(
+            self.outcomes(results),
+            {'archive': Outcome.ERROR, 'sync': Outcome.ERROR,
+             'podcast': Outcome.SKIPPED, 'other': Outcome.OK})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import os
+import shutil
+import tempfile
+
+
+from housekeeper.lib.hkfilesystem import resumable_walk
+
+
+class ResumableWalkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for x in ['b/c', 'a/y/z', 'a/x', 'c']:
+            os.makedirs(os.path.join(self.tmpdir, x))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def walk(self, resume_from=None):
+        return [os.path.relpath(dirpath, self.tmpdir)
+                for (dirpath, dummy, dummy2)
+                in resumable_walk(self.tmpdir, resume_from=resume_from)]
+
+    def test_sorted(self):
+        self.assertEqual(
+            self.walk(),
+            ['.', 'a', 'a/x', 'a/y', 'a/y/z', 'b', 'b/c', 'c'])
+
+    def test_resume(self):
+        full = self.walk()
+        for (idx, cursor) in enumerate(full):
+            self.assertEqual(self.walk(resume_from=cursor), full[idx + 1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import os
+import shutil
+import tempfile
+
+
+from housekeeper.lib.hkfingerprint import (
+    Dir,
+    File,
+    Input,
+    Settings,
+    Tree,
+    fingerprint
+)
+
+
+class Unknown(Input):
+    def value(self, settings):
+        return None
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = {'syncs': [{'source': '/a'}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def fingerprint(self, *inputs):
+        return fingerprint(inputs, self.settings)
+
+    def test_file(self):
+        path = os.path.join(self.tmpdir, 'db')
+        missing = self.fingerprint(File(path))
+
+        with open(path, 'w') as fh:
+            fh.write('x')
+
+        fp = self.fingerprint(File(path))
+        self.assertNotEqual(fp, missing)
+        self.assertEqual(fp, self.fingerprint(File(path)))
+
+        with open(path, 'a') as fh:
+            fh.write('y')
+
+        self.assertNotEqual(fp, self.fingerprint(File(path)))
+
+    def test_dir(self):
+        fp = self.fingerprint(Dir(self.tmpdir))
+        self.assertEqual(fp, self.fingerprint(Dir(self.tmpdir)))
+
+        os.mkdir(os.path.join(self.tmpdir, 'sub'))
+        self.assertNotEqual(fp, self.fingerprint(Dir(self.tmpdir)))
+
+    def test_tree(self):
+        sub = os.path.join(self.tmpdir, 'sub')
+        os.mkdir(sub)
+        path = os.path.join(sub, 'file')
+        with open(path, 'w') as fh:
+            fh.write('x')
+
+        fp = self.fingerprint(Tree(self.tmpdir))
+        self.assertEqual(fp, self.fingerprint(Tree(self.tmpdir)))
+
+        # Rewritten file, same directory mtimes
+        st = os.stat(sub)
+        with open(path, 'w') as fh:
+            fh.write('yz')
+        os.utime(sub, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertNotEqual(fp, self.fingerprint(Tree(self.tmpdir)))
+
+    def test_tree_root_identity(self):
+        root = os.path.join(self.tmpdir, 'root')
+        os.mkdir(root)
+        st = os.stat(root)
+        fp = self.fingerprint(Tree(root))
+
+        # Same (empty) contents and mtime, different directory
+        os.rename(root, os.path.join(self.tmpdir, 'old'))
+        os.mkdir(root)
+        os.utime(root, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertNotEqual(fp, self.fingerprint(Tree(root)))
+        self.assertNotEqual(
+            fp, self.fingerprint(Tree(os.path.join(self.tmpdir, 'x'))))
+
+    def test_settings(self):
+        fp = self.fingerprint(Settings('syncs'))
+        self.settings['syncs'][0]['source'] = '/b'
+        self.assertNotEqual(fp, self.fingerprint(Settings('syncs')))
+
+        self.assertIsNotNone(self.fingerprint(Settings('missing')))
+
+    def test_unknown(self):
+        self.assertIsNone(self.fingerprint(Settings('syncs'), Unknown('x')))
+
+
+if __name__ == '__main__':
+    unittest.main()
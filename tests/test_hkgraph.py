@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+from housekeeper.lib.hkgraph import (
+    CycleError,
+    Graph
+)
+
+
+class GraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph({
+            'archive': [],
+            'sync': ['archive'],
+            'podcast': ['sync', 'unknown'],
+            'other': None,
+        })
+
+    def test_toposort(self):
+        self.assertEqual(
+            self.graph.toposort(),
+            ['archive', 'other', 'sync', 'podcast'])
+
+    def test_cycle(self):
+        graph = Graph({'a': ['b'], 'b': ['a'], 'c': ['a'], 'd': []})
+        self.assertEqual(graph.cycles(), ['a', 'b'])
+        with self.assertRaises(CycleError):
+            graph.toposort()
+
+    def test_drop_cycles(self):
+        graph = Graph({'a': ['b'], 'b': ['a'], 'c': ['a'], 'd': []})
+        self.assertEqual(graph.drop_cycles(), (['a', 'b'], ['c']))
+        self.assertEqual(graph.ready(), ['d'])
+
+    def test_ready(self):
+        self.assertEqual(self.graph.ready(), ['archive', 'other'])
+        self.assertEqual(self.graph.ready(), [])
+
+        self.graph.done('archive')
+        self.assertEqual(self.graph.ready(), ['sync'])
+
+    def test_failed(self):
+        self.graph.ready()
+        self.assertEqual(self.graph.done('archive', ok=False),
+                         ['podcast', 'sync'])
+        self.assertEqual(self.graph.ready(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
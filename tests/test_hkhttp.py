@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import gzip
+import os
+import shutil
+import tempfile
+
+
+from housekeeper.lib import hkhttp
+
+
+class ConditionalTest(unittest.TestCase):
+    def test_if_none_match(self):
+        self.assertTrue(hkhttp.not_modified('"a"', 0, if_none_match='"a"'))
+        self.assertTrue(hkhttp.not_modified('"a"', 0,
+                                            if_none_match='"b", W/"a"'))
+        self.assertFalse(hkhttp.not_modified('"a"', 0, if_none_match='"b"'))
+
+    def test_if_modified_since(self):
+        date = hkhttp.http_date(1000)
+        self.assertTrue(hkhttp.not_modified('"a"', 1000.5,
+                                            if_modified_since=date))
+        self.assertFalse(hkhttp.not_modified('"a"', 1001,
+                                             if_modified_since=date))
+        self.assertFalse(hkhttp.not_modified('"a"', 0,
+                                             if_modified_since='garbage'))
+
+    def test_etag_precedence(self):
+        self.assertFalse(hkhttp.not_modified(
+            '"a"', 1000,
+            if_none_match='"b"',
+            if_modified_since=hkhttp.http_date(2000)))
+
+
+class RangeTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(hkhttp.parse_range('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(hkhttp.parse_range('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(hkhttp.parse_range('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(hkhttp.parse_range('bytes=95-200', 100), [(95, 99)])
+        self.assertEqual(hkhttp.parse_range('bytes=0-1, 5-6', 100),
+                         [(0, 1), (5, 6)])
+
+    def test_ignored(self):
+        self.assertIsNone(hkhttp.parse_range(None, 100))
+        self.assertIsNone(hkhttp.parse_range('items=0-1', 100))
+        self.assertIsNone(hkhttp.parse_range('bytes=5-1', 100))
+        self.assertIsNone(hkhttp.parse_range('bytes=a-b', 100))
+
+    def test_not_satisfiable(self):
+        with self.assertRaises(hkhttp.RangeNotSatisfiable):
+            hkhttp.parse_range('bytes=100-', 100)
+
+
+class MultipartTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'file')
+        with open(self.filename, 'wb') as fh:
+            fh.write(bytes(range(100)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_body(self):
+        body = hkhttp.Multipart(self.filename, [(0, 1), (98, 99)],
+                                'audio/mpeg', 100)
+        buff = b''.join(body)
+
+        self.assertEqual(len(buff), len(body))
+        self.assertIn(b'Content-Range: bytes 0-1/100\r\n\r\n\x00\x01', buff)
+        self.assertIn(b'Content-Range: bytes 98-99/100\r\n\r\nbc', buff)
+        self.assertTrue(buff.endswith(
+            '--{}--\r\n'.format(body.boundary).encode('ascii')))
+
+
+class SidecarTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'main.1a2b3c4d.js')
+        with open(self.filename, 'w') as fh:
+            fh.write('console.log("hi");' * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(
+            hkhttp.accepted_encodings('gzip, deflate;q=0.5, br;q=0'),
+            {'gzip', 'deflate'})
+        self.assertEqual(hkhttp.accepted_encodings(None), set())
+
+    def test_is_hashed(self):
+        self.assertTrue(hkhttp.is_hashed(self.filename))
+        self.assertTrue(hkhttp.is_hashed('/static/js/0.5f6e7d8c.chunk.js'))
+        self.assertFalse(hkhttp.is_hashed('/static/index.html'))
+
+    def test_compress_and_select(self):
+        st = os.stat(self.filename)
+        self.assertEqual(
+            hkhttp.select_sidecar(self.filename, st, 'gzip'),
+            (self.filename, st, None))
+
+        written = hkhttp.compress_file(self.filename)
+        self.assertIn(self.filename + '.gz', written)
+        self.assertEqual(hkhttp.compress_file(self.filename), [])
+
+        with gzip.open(self.filename + '.gz') as fh, \
+                open(self.filename, 'rb') as orig:
+            self.assertEqual(fh.read(), orig.read())
+
+        (path, dummy, encoding) = hkhttp.select_sidecar(
+            self.filename, st, 'gzip, deflate')
+        self.assertEqual((path, encoding), (self.filename + '.gz', 'gzip'))
+
+        # Outdated sidecar is ignored
+        os.utime(self.filename + '.gz', ns=(0, 0))
+        self.assertEqual(
+            hkhttp.select_sidecar(self.filename, st, 'gzip')[2],
+            None)
+
+    def test_sidecar_outside_root(self):
+        root = os.path.join(self.tmpdir, 'root')
+        os.mkdir(root)
+        filename = os.path.join(root, 'index.html')
+        with open(filename, 'w') as fh:
+            fh.write('<html></html>')
+
+        secret = os.path.join(self.tmpdir, 'secret')
+        with open(secret, 'w') as fh:
+            fh.write('secret')
+        os.symlink(secret, filename + '.gz')
+
+        st = os.stat(filename)
+        self.assertEqual(
+            hkhttp.select_sidecar(filename, st, 'gzip')[2], 'gzip')
+        self.assertEqual(
+            hkhttp.select_sidecar(filename, st, 'gzip', root=root),
+            (filename, st, None))
+
+    def test_same_file(self):
+        st = os.stat(self.filename)
+        self.assertTrue(hkhttp.same_file(st, os.stat(self.filename)))
+
+        with open(self.filename, 'a') as fh:
+            fh.write('x')
+        self.assertFalse(hkhttp.same_file(st, os.stat(self.filename)))
+
+    def test_is_contained(self):
+        root = os.path.join(self.tmpdir, 'root')
+        os.mkdir(root)
+        os.mkdir(root + '2')
+
+        self.assertTrue(hkhttp.is_contained(root, root))
+        self.assertTrue(hkhttp.is_contained(root + '/a/b', root))
+        self.assertFalse(hkhttp.is_contained(root + '/../x', root))
+        self.assertFalse(hkhttp.is_contained(root + '2/x', root))
+
+
+class FileCacheTest(unittest.TestCase):
+    def test_lru(self):
+        cache = hkhttp.FileCache(max_size=10, max_file_size=6)
+
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        self.assertEqual(cache.get('a'), b'aaaa')
+
+        cache.put('c', b'cccc')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), b'aaaa')
+        self.assertEqual(cache.size, 8)
+
+        cache.put('d', b'too large')
+        self.assertEqual(cache.get('d'), None)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
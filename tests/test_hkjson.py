@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import json
+
+
+from housekeeper.lib import hkjson
+
+
+class EncoderTest(unittest.TestCase):
+    def test_fallback(self):
+        (name, dumps) = hkjson.get_encoder()
+        self.assertIn(name, hkjson.ENCODERS)
+        self.assertEqual(json.loads(dumps({'a': [1, 'ñ']}).decode('utf-8')),
+                         {'a': [1, 'ñ']})
+
+    def test_stdlib(self):
+        (name, dumps) = hkjson.get_encoder('json')
+        self.assertEqual(dumps([1]), b'[1]')
+
+
+class IterencodeTest(unittest.TestCase):
+    def setUp(self):
+        self.dumps = hkjson.get_encoder('json')[1]
+
+    def encode(self, obj):
+        return b''.join(hkjson.iterencode(obj, self.dumps))
+
+    def test_plain(self):
+        self.assertFalse(hkjson.has_stream({'result': [1, 2]}))
+        self.assertEqual(json.loads(self.encode({'result': [1, 2]})),
+                         {'result': [1, 2]})
+
+    def test_generator(self):
+        result = {'result': ({'id': x} for x in range(3)), 'n': 3}
+        self.assertTrue(hkjson.has_stream(result))
+
+        chunks = list(hkjson.iterencode(result, self.dumps))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(
+            json.loads(b''.join(chunks)),
+            {'result': [{'id': 0}, {'id': 1}, {'id': 2}], 'n': 3})
+
+    def test_empty_generator(self):
+        self.assertEqual(json.loads(self.encode(iter([]))), [])
+
+    def test_nested(self):
+        obj = {'a': {'b': iter([1, 2])}}
+        self.assertEqual(json.loads(self.encode(obj)), {'a': {'b': [1, 2]}})
+
+    def test_ndjson(self):
+        buff = b''.join(hkjson.iterencode_ndjson(iter([{'a': 1}, 2]),
+                                                 self.dumps))
+        self.assertEqual(buff, b'{"a": 1}\n2\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
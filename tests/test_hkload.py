@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import os
+import shutil
+import tempfile
+
+
+from housekeeper.lib import hkload
+
+
+class LoadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, path, buff):
+        path = os.path.join(self.tmpdir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fh:
+            fh.write(buff)
+
+    def test_io_pressure(self):
+        self.write('io', 'some avg10=12.50 avg60=1.00 avg300=0.19 total=5\n'
+                         'full avg10=3.00 avg60=0.00 avg300=0.19 total=5\n')
+        self.assertEqual(hkload.io_pressure(os.path.join(self.tmpdir, 'io')),
+                         12.5)
+        self.assertIsNone(hkload.io_pressure(self.tmpdir + '/missing'))
+
+    def test_on_battery(self):
+        self.assertFalse(hkload.on_battery(self.tmpdir))
+
+        self.write('BAT0/type', 'Battery\n')
+        self.write('AC/type', 'Mains\n')
+        self.write('AC/online', '0\n')
+        self.assertTrue(hkload.on_battery(self.tmpdir))
+
+        self.write('AC/online', '1\n')
+        self.assertFalse(hkload.on_battery(self.tmpdir))
+
+    def test_on_battery_status(self):
+        self.write('BAT0/type', 'Battery\n')
+        self.write('BAT0/status', 'Charging\n')
+        self.write('AC/type', 'Mains\n')
+        self.write('AC/online', '1\n')
+        self.assertFalse(hkload.on_battery(self.tmpdir))
+
+        # Underpowered charger
+        self.write('BAT0/status', 'Discharging\n')
+        self.assertTrue(hkload.on_battery(self.tmpdir))
+
+    def test_on_battery_usb(self):
+        self.write('BAT0/type', 'Battery\n')
+        self.write('BAT0/status', 'Not charging\n')
+        self.write('ucsi-source-psy-USBC000:001/type', 'USB\n')
+        self.write('ucsi-source-psy-USBC000:001/online', '0\n')
+        self.assertTrue(hkload.on_battery(self.tmpdir))
+
+        self.write('ucsi-source-psy-USBC000:001/online', '1\n')
+        self.assertFalse(hkload.on_battery(self.tmpdir))
+
+    def test_on_battery_device_scope(self):
+        # Desktop with a wireless mouse
+        self.write('hidpp_battery_0/type', 'Battery\n')
+        self.write('hidpp_battery_0/scope', 'Device\n')
+        self.write('hidpp_battery_0/status', 'Discharging\n')
+        self.assertFalse(hkload.on_battery(self.tmpdir))
+
+        self.write('BAT0/type', 'Battery\n')
+        self.write('BAT0/scope', 'System\n')
+        self.write('BAT0/status', 'Discharging\n')
+        self.assertTrue(hkload.on_battery(self.tmpdir))
+
+    def test_defer_reasons(self):
+        metrics = {'load': 3.5, 'io_pressure': 5.0, 'battery': True}
+
+        self.assertEqual(
+            hkload.defer_reasons(metrics, load=2, io_pressure=10),
+            ['load 3.50 > 2', 'on battery'])
+        self.assertEqual(
+            hkload.defer_reasons(metrics, load=4, battery=False),
+            [])
+        self.assertEqual(
+            hkload.defer_reasons({'load': None}, load=1),
+            [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import os
+import shutil
+import tempfile
+
+
+from housekeeper.lib.hklock import (
+    LockHeld,
+    PidLock
+)
+
+
+class PidLockTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'locks', 'task.lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_exclusive(self):
+        with PidLock(self.path) as lock:
+            self.assertTrue(lock.locked)
+            self.assertEqual(lock.read_pid(), os.getpid())
+
+            with self.assertRaises(LockHeld) as cm:
+                PidLock(self.path).acquire(blocking=False)
+
+            self.assertEqual(cm.exception.pid, os.getpid())
+
+        self.assertFalse(os.path.exists(self.path))
+        PidLock(self.path).acquire(blocking=False)
+
+    def test_wait_timeout(self):
+        with PidLock(self.path):
+            with self.assertRaises(LockHeld):
+                PidLock(self.path).acquire(timeout=0.2)
+
+    def test_stale(self):
+        # Lock inherited by a child still alive while its owner (as
+        # recorded in the lock file) is gone
+        lock = PidLock(self.path)
+        lock.acquire()
+
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        with open(self.path, 'w') as fh:
+            fh.write(str(pid))
+
+        other = PidLock(self.path)
+        other.acquire(blocking=False)
+        self.assertEqual(other.read_pid(), os.getpid())
+
+        other.release()
+        os.close(lock._fd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+
+from housekeeper.lib import hkpriority
+
+
+class PriorityTest(unittest.TestCase):
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            hkpriority.get('urgent')
+
+    def test_command_prefix(self):
+        if os.getpriority(os.PRIO_PROCESS, 0) != 0:
+            self.skipTest('Already niced')
+
+        self.assertEqual(hkpriority.command_prefix('normal'), [])
+        self.assertEqual(
+            hkpriority.command_prefix('batch'),
+            ['nice', '-n', '10', 'ionice', '-c', '2', '-n', '7'])
+        self.assertEqual(
+            hkpriority.command_prefix('idle'),
+            ['nice', '-n', '19', 'ionice', '-c', '3'])
+
+    def test_command_prefix_applied(self):
+        ret = {}
+
+        def _worker():
+            hkpriority.apply('batch')
+            ret['batch'] = hkpriority.command_prefix('batch')
+            ret['idle'] = hkpriority.command_prefix('idle')
+
+        if os.getpriority(os.PRIO_PROCESS, 0) > 10:
+            self.skipTest('Already niced')
+
+        th = threading.Thread(target=_worker)
+        th.start()
+        th.join()
+
+        # Don't stack on the thread's own priority
+        self.assertEqual(ret['batch'], [])
+        self.assertEqual(ret['idle'][:3], ['nice', '-n', '9'])
+
+    def test_remove_cgroup(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        group = os.path.join(tmpdir, 'hk-foo')
+        os.mkdir(group)
+
+        with mock.patch.object(hkpriority, '_cgroup_path',
+                               return_value=group):
+            self.assertTrue(hkpriority.remove_cgroup('foo'))
+            self.assertFalse(os.path.exists(group))
+            self.assertFalse(hkpriority.remove_cgroup('foo'))
+
+    def test_thread_nice(self):
+        ret = {}
+
+        def _worker():
+            hkpriority.apply('batch')
+            ret['nice'] = os.getpriority(os.PRIO_PROCESS,
+                                         threading.get_native_id())
+
+        before = os.getpriority(os.PRIO_PROCESS, 0)
+
+        th = threading.Thread(target=_worker)
+        th.start()
+        th.join()
+
+        self.assertEqual(ret['nice'], max(before, 10))
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, 0), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import json
+import sys
+
+
+from housekeeper.lib.hkprofile import StartupProfiler
+
+
+class PhaseTest(unittest.TestCase):
+    def test_disabled(self):
+        p = StartupProfiler(enabled=False)
+        with p.phase('x'):
+            pass
+
+        self.assertEqual(p.phases, [])
+
+    def test_nested_phases(self):
+        p = StartupProfiler()
+        with p.phase('outer'):
+            with p.phase('inner'):
+                pass
+
+        self.assertEqual(
+            [(x['name'], x['depth']) for x in p.phases],
+            [('outer', 0), ('inner', 1)]
+        )
+        self.assertGreaterEqual(
+            p.phases[0]['duration_ns'],
+            p.phases[1]['duration_ns']
+        )
+
+    def test_phases_sorted_by_duration(self):
+        p = StartupProfiler()
+        p.phases = [
+            {'name': 'a', 'depth': 0, 'start_ns': 0, 'duration_ns': 1},
+            {'name': 'b', 'depth': 0, 'start_ns': 1, 'duration_ns': 3},
+        ]
+
+        self.assertEqual(
+            [x['name'] for x in p.asdict()['phases']],
+            ['b', 'a']
+        )
+
+
+class ImportHookTest(unittest.TestCase):
+    def test_import_tree(self):
+        sys.modules.pop('colorsys', None)
+
+        p = StartupProfiler()
+        p.install_import_hook()
+        try:
+            import colorsys  # noqa
+            import json  # noqa, already imported
+        finally:
+            p.uninstall_import_hook()
+
+        self.assertEqual(
+            [x.name for x in p.imports.children],
+            ['colorsys']
+        )
+
+    def test_json_report(self):
+        p = StartupProfiler()
+        with p.phase('x'):
+            pass
+
+        report = json.loads(p.report(format='json'))
+        self.assertEqual(report['phases'][0]['name'], 'x')
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            StartupProfiler().report(format='xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
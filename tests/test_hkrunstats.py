@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+from housekeeper.lib.hkrunstats import (
+    Usage,
+    append_ring,
+    percentile,
+    read_rss,
+    read_uss,
+    summarize
+)
+
+
+class PercentileTest(unittest.TestCase):
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 95), 4.8)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile([], 50), None)
+
+
+class RingTest(unittest.TestCase):
+    def test_bounded(self):
+        ring = []
+        for x in range(5):
+            ring = append_ring(ring, x, 3)
+
+        self.assertEqual(ring, [2, 3, 4])
+
+
+class SummaryTest(unittest.TestCase):
+    def test_summarize(self):
+        records = [
+            {'duration': 1, 'cpu': 0.5, 'outcome': 'ok'},
+            {'duration': 3, 'cpu': 1, 'outcome': 'error'},
+            {'duration': 0, 'outcome': 'cached'},
+        ]
+
+        summary = summarize(records)
+        self.assertEqual(summary['runs'], 3)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['p50'], 2)
+        self.assertEqual(summary['cpu'], 1.5)
+        self.assertIs(summary['last'], records[-1])
+
+
+class UsageTest(unittest.TestCase):
+    def test_usage(self):
+        with Usage() as usage:
+            sum(range(100000))
+
+        self.assertEqual(
+            set(usage.stats),
+            {'cpu', 'rss_delta', 'read_bytes', 'write_bytes'})
+        self.assertGreater(usage.stats['cpu'], 0)
+
+    def test_uss(self):
+        uss = read_uss()
+        if uss is None:
+            self.skipTest('smaps_rollup not available')
+
+        self.assertGreater(uss, 0)
+        self.assertLessEqual(uss, read_rss())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+from housekeeper.lib.hkscheduler import (
+    Scheduler,
+    next_run
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class NextRunTest(unittest.TestCase):
+    def test_not_due(self):
+        self.assertEqual(next_run(100, 60, 50), (100, 0))
+
+    def test_coalesce(self):
+        # Suspended for ~5 intervals: run once, keep the original phase
+        self.assertEqual(next_run(100, 60, 410), (460, 5))
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sched = Scheduler(clock=self.clock)
+        self.sched.MIN_INTERVAL = 1
+
+    def test_order(self):
+        self.sched.add('b', 20, deadline=1020)
+        self.sched.add('a', 10, deadline=1010)
+        self.sched.add('c', 30)
+
+        self.assertEqual(self.sched.next_deadline(), 1000)
+        self.assertEqual(self.sched.pop_due(), [('c', 0)])
+        self.assertEqual(self.sched.next_deadline(), 1010)
+
+        self.clock.now = 1015
+        self.assertEqual(self.sched.pop_due(), [('a', 0)])
+        self.assertEqual(self.sched.next_deadline(), 1020)
+
+        self.clock.now = 1025
+        self.assertEqual(self.sched.pop_due(), [('b', 0), ('a', 0)])
+        self.assertEqual(self.sched.next_deadline(), 1030)
+
+    def test_remove(self):
+        self.sched.add('a', 10)
+        self.sched.add('b', 10, deadline=1005)
+        self.sched.remove('a')
+
+        self.assertEqual(len(self.sched), 1)
+        self.assertEqual(self.sched.next_deadline(), 1005)
+
+    def test_readd(self):
+        self.sched.add('a', 10)
+        self.sched.add('a', 20, deadline=1005)
+
+        # Old entry is gone, not left stale in the heap
+        self.assertEqual(len(self.sched), 1)
+        self.assertEqual(self.sched.next_deadline(), 1005)
+        self.assertEqual(self.sched.pop_due(), [])
+
+        self.clock.now = 1005
+        self.assertEqual(self.sched.pop_due(), [('a', 0)])
+        self.assertEqual(self.sched.next_deadline(), 1025)
+
+    def test_postpone(self):
+        self.sched.add('a', 10)
+        self.sched.postpone('a', 1005)
+
+        self.assertEqual(len(self.sched), 1)
+        self.assertEqual(self.sched.pop_due(), [])
+
+        self.clock.now = 1005
+        self.assertEqual(self.sched.pop_due(), [('a', 0)])
+        self.assertEqual(self.sched.next_deadline(), 1015)
+
+    def test_min_interval(self):
+        self.sched.MIN_INTERVAL = 60
+        self.sched.add('a', 0)
+        self.sched.pop_due()
+        self.assertEqual(self.sched.next_deadline(), 1060)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import asyncio
+import http.client
+import json
+import os
+import socket
+import tempfile
+import time
+
+
+from housekeeper.lib import (
+    hkasync,
+    hkserver
+)
+
+
+def app(environ, start_response):
+    path = environ['PATH_INFO']
+
+    if path == '/echo':
+        body = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+        data = json.dumps({
+            'method': environ['REQUEST_METHOD'],
+            'query': environ['QUERY_STRING'],
+            'body': body.decode('utf-8'),
+            'accept': environ.get('HTTP_ACCEPT'),
+        }).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(data)))])
+        return [data]
+
+    if path == '/stream':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (str(x).encode('ascii') for x in range(5))
+
+    if path == '/file':
+        fh = open(environ['test.file'], 'rb')
+        fh.seek(2)
+        start_response('200 OK', [('Content-Length', '3')])
+        return environ['wsgi.file_wrapper'](fh)
+
+    if path == '/async':
+        async def main():
+            await asyncio.sleep(0)
+            return hkasync.running_in(hkasync.get_loop())
+
+        data = json.dumps(hkasync.resolve(main())).encode('utf-8')
+        start_response('200 OK', [('Content-Length', str(len(data)))])
+        return [data]
+
+    if path == '/deferred':
+        async def main():
+            await asyncio.sleep(float(environ['QUERY_STRING'] or 0))
+            return [('Content-Type', 'application/json')], [
+                json.dumps(hkasync.running_in(hkasync.get_loop()))
+                .encode('utf-8')]
+
+        async def respond():
+            (headers, body) = await main()
+            return ('201 Created', headers, body)
+
+        start_response('200 OK', [('Content-Type', 'text/plain'),
+                                  ('X-Test', 'kept')])
+        return hkserver.Deferred(respond())
+
+    raise ValueError(path)
+
+
+class ServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        fd, cls.filename = tempfile.mkstemp()
+        os.write(fd, b'0123456789')
+        os.close(fd)
+
+        def wrapped(environ, start_response):
+            environ['test.file'] = cls.filename
+            return app(environ, start_response)
+
+        cls.server = hkserver.Server(wrapped, port=0, threads=4)
+        asyncio.run_coroutine_threadsafe(
+            cls.server.start(), hkasync.get_loop()).result()
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(
+            cls.server.stop(), hkasync.get_loop()).result()
+        cls.server.pool.shutdown()
+        os.unlink(cls.filename)
+
+    def setUp(self):
+        self.conn = http.client.HTTPConnection(*self.server.address)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def request(self, *args, **kwargs):
+        self.conn.request(*args, **kwargs)
+        resp = self.conn.getresponse()
+        return (resp, resp.read())
+
+    def test_keepalive(self):
+        for x in range(3):
+            (resp, body) = self.request(
+                'POST', '/echo?x={}'.format(x), body=b'hi',
+                headers={'Accept': 'application/json'})
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(json.loads(body.decode('utf-8')), {
+                'method': 'POST', 'query': 'x={}'.format(x), 'body': 'hi',
+                'accept': 'application/json'})
+
+        # Same socket for all requests
+        self.assertFalse(resp.will_close)
+
+    def test_chunked(self):
+        (resp, body) = self.request('GET', '/stream')
+        self.assertEqual(resp.getheader('Transfer-Encoding'), 'chunked')
+        self.assertEqual(body, b'01234')
+
+    def test_file(self):
+        (resp, body) = self.request('GET', '/file')
+        self.assertEqual(body, b'234')
+
+        # Connection is still usable
+        (resp, body) = self.request('GET', '/stream')
+        self.assertEqual(body, b'01234')
+
+    def test_head(self):
+        (resp, body) = self.request('HEAD', '/file')
+        self.assertEqual(resp.getheader('Content-Length'), '3')
+        self.assertEqual(body, b'')
+
+    def test_async(self):
+        (resp, body) = self.request('GET', '/async')
+        self.assertEqual(body, b'true')
+
+    def test_deferred(self):
+        (resp, body) = self.request('GET', '/deferred')
+        self.assertEqual(resp.status, 201)
+        self.assertEqual(resp.getheader('Content-Type'), 'application/json')
+        self.assertEqual(resp.getheader('X-Test'), 'kept')
+        self.assertEqual(body, b'true')
+
+    def test_deferred_releases_thread(self):
+        # More slow deferred responses than pool threads (4), they don't
+        # hold them
+        conns = [http.client.HTTPConnection(*self.server.address)
+                 for x in range(5)]
+        for conn in conns:
+            conn.request('GET', '/deferred?0.5')
+
+        started = time.monotonic()
+        (resp, body) = self.request('GET', '/stream')
+        self.assertEqual(body, b'01234')
+        self.assertLess(time.monotonic() - started, 0.4)
+
+        for conn in conns:
+            self.assertEqual(conn.getresponse().read(), b'true')
+            conn.close()
+
+    def test_app_error(self):
+        (resp, body) = self.request('GET', '/missing')
+        self.assertEqual(resp.status, 500)
+        self.assertTrue(resp.will_close)
+
+    def test_chunked_request(self):
+        (resp, body) = self.request(
+            'POST', '/echo', body=iter([b'hel', b'lo']),
+            encode_chunked=True)
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8'))['body'], 'hello')
+
+        # Connection is still usable
+        (resp, body) = self.request('GET', '/stream')
+        self.assertEqual(body, b'01234')
+
+    def raw(self, data):
+        with socket.create_connection(self.server.address) as sock:
+            sock.sendall(data)
+            sock.shutdown(socket.SHUT_WR)
+            ret = b''
+            while True:
+                buff = sock.recv(4096)
+                if not buff:
+                    return ret
+
+                ret += buff
+
+    def test_pipelining(self):
+        resp = self.raw(
+            b'POST /echo?1 HTTP/1.1\r\nContent-Length: 1\r\n\r\na'
+            b'POST /echo?2 HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'1\r\nb\r\n0\r\nX-Trailer: x\r\n\r\n'
+            b'GET /stream HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+        self.assertEqual(resp.count(b'HTTP/1.1 200 OK'), 3)
+        self.assertLess(resp.index(b'"query": "1", "body": "a"'),
+                        resp.index(b'"query": "2", "body": "b"'))
+        self.assertTrue(resp.endswith(b'0\r\n\r\n'))
+
+    def test_malformed_requests(self):
+        for data in [
+                b'G(T / HTTP/1.1\r\n\r\n',
+                b'GET foo HTTP/1.1\r\n\r\n',
+                b'GET / HTTP/1.1\r\nBad Name: x\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n'
+                b'Content-Length: 3\r\n\r\n0\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'-1\r\nx\r\n0\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'1\r\nxy\r\n0\r\n\r\n']:
+            resp = self.raw(data)
+            self.assertTrue(resp.startswith(b'HTTP/1.1 400 '), data)
+
+        resp = self.raw(b'POST /echo HTTP/1.1\r\n'
+                        b'Transfer-Encoding: gzip\r\n\r\n')
+        self.assertTrue(resp.startswith(b'HTTP/1.1 501 '))
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_head(self):
+        self.assertEqual(
+            hkserver.parse_head(b'GET /a?b HTTP/1.1\r\nHost: x\r\n'
+                                b'X-Foo:  bar \r\n\r\n'),
+            ('GET', '/a?b', 'HTTP/1.1', [('host', 'x'), ('x-foo', 'bar')]))
+
+    def test_bad_requests(self):
+        with self.assertRaises(hkserver.BadRequest):
+            hkserver.parse_head(b'GET /\r\n\r\n')
+
+        with self.assertRaises(hkserver.BadRequest):
+            hkserver.parse_head(b'GET / HTTP/2\r\n\r\n')
+
+        with self.assertRaises(hkserver.BadRequest):
+            hkserver.parse_head(b'GET / HTTP/1.1\r\nfoo\r\n\r\n')
+
+        with self.assertRaises(hkserver.BadRequest):
+            hkserver.parse_head(b'GET /\x01 HTTP/1.1\r\n\r\n')
+
+    def test_absolute_target(self):
+        self.assertEqual(
+            hkserver.parse_head(b'GET http://x:1/a?b HTTP/1.1\r\n\r\n'),
+            ('GET', '/a?b', 'HTTP/1.1', []))
+
+    def test_keepalive(self):
+        self.assertTrue(hkserver.wants_keepalive('HTTP/1.1', []))
+        self.assertFalse(hkserver.wants_keepalive(
+            'HTTP/1.1', [('connection', 'close')]))
+        self.assertFalse(hkserver.wants_keepalive('HTTP/1.0', []))
+
+
+if __name__ == '__main__':
+    unittest.main()
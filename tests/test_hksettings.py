@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+from housekeeper.lib.hksettings import (
+    SettingsView,
+    coerce,
+    key_in_namespace
+)
+
+
+_NOTSET = object()
+
+
+class FakeStore:
+    def __init__(self, data):
+        self.data = data
+        self.lookups = 0
+
+    def get(self, key, default=_NOTSET):
+        self.lookups += 1
+        try:
+            return self.data[key]
+        except KeyError:
+            if default is _NOTSET:
+                raise
+            return default
+
+
+class CoerceTest(unittest.TestCase):
+    def test_bool_strings(self):
+        self.assertEqual(coerce('yes', bool), True)
+        self.assertEqual(coerce('Off', bool), False)
+
+        with self.assertRaises(ValueError):
+            coerce('maybe', bool)
+
+    def test_list_from_str(self):
+        self.assertEqual(coerce('~/Pictures', list), ['~/Pictures'])
+
+    def test_callable(self):
+        self.assertEqual(coerce('3', int), 3)
+
+    def test_none(self):
+        self.assertEqual(coerce(None, str), None)
+        self.assertEqual(coerce(None, list), None)
+        self.assertEqual(coerce(None, int), None)
+
+
+class NamespaceTest(unittest.TestCase):
+    def test_key_in_namespace(self):
+        self.assertTrue(key_in_namespace('plugin.music.bridge',
+                                         'plugin.music'))
+        self.assertTrue(key_in_namespace('plugin', 'plugin.music'))
+        self.assertFalse(key_in_namespace('plugin.musicx', 'plugin.music'))
+
+
+class SettingsViewTest(unittest.TestCase):
+    def setUp(self):
+        self.store = FakeStore({
+            'plugin.music.bridge': 'banshee',
+            'plugin.music.volume': '5',
+        })
+        self.view = SettingsView(self.store, 'plugin.music.',
+                                 schema={'volume': int})
+
+    def test_memoized(self):
+        self.assertEqual(self.view.get('bridge'), 'banshee')
+        self.assertEqual(self.view['bridge'], 'banshee')
+        self.assertEqual(self.store.lookups, 1)
+
+    def test_coerced(self):
+        self.assertEqual(self.view.get('volume'), 5)
+
+    def test_missing(self):
+        self.assertEqual(self.view.get('foo', 'x'), 'x')
+        with self.assertRaises(KeyError):
+            self.view.get('foo')
+
+    def test_missing_memoized(self):
+        self.assertEqual(self.view.get('foo', 'x'), 'x')
+        self.assertEqual(self.view.get('foo', default='y'), 'y')
+        self.assertEqual(self.store.lookups, 1)
+
+    def test_notify(self):
+        changes = []
+        self.view.subscribe(lambda view, key: changes.append(key))
+
+        self.view.get('bridge')
+        self.store.data['plugin.music.bridge'] = 'clementine'
+        self.view.notify('plugin.other.key')
+        self.assertEqual(self.view.get('bridge'), 'banshee')
+
+        self.view.notify('plugin.music.bridge')
+        self.assertEqual(self.view.get('bridge'), 'clementine')
+        self.assertEqual(changes, ['plugin.music.bridge'])
+
+
+class PluginSchemaTest(unittest.TestCase):
+    def test_anycheck_blank(self):
+        store = FakeStore({'anycheck.username': None,
+                           'anycheck.password': 'secret'})
+        view = SettingsView(store, 'anycheck',
+                            schema={'username': str, 'password': str})
+
+        self.assertEqual(view.get('username', None), None)
+        self.assertEqual(view.get('password', None), 'secret')
+
+    def test_backgroundchanger_blank(self):
+        store = FakeStore({'background-changer.directories': None})
+        view = SettingsView(store, 'background-changer',
+                            schema={'directories': list})
+
+        self.assertEqual(view.get('directories'), None)
+
+    def test_backgroundchanger_single(self):
+        store = FakeStore({'background-changer.directories': '~/Pictures'})
+        view = SettingsView(store, 'background-changer',
+                            schema={'directories': list})
+
+        self.assertEqual(view.get('directories'), ['~/Pictures'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+
+
+from housekeeper.lib.hkstate import StateStore
+
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'state.db')
+        self.state = StateStore(self.path)
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        self.state.set('a.b', {'x': [1, 2]})
+        self.assertEqual(self.state.get('a.b'), {'x': [1, 2]})
+        self.assertEqual(StateStore(self.path).get('a.b'), {'x': [1, 2]})
+
+    def test_missing(self):
+        self.assertEqual(self.state.get('foo', None), None)
+        with self.assertRaises(KeyError):
+            self.state.get('foo')
+
+    def test_delete(self):
+        self.state.set('a', 1)
+        self.state.delete('a')
+        self.assertEqual(self.state.get('a', None), None)
+
+    def test_batch(self):
+        other = StateStore(self.path)
+
+        with self.state.batch():
+            self.state.set('a', 1)
+            self.state.delete('b')
+            self.assertEqual(self.state.get('a'), 1)
+            self.assertEqual(other.get('a', None), None)
+
+        self.assertEqual(other.get('a'), 1)
+
+    def test_sync_in_batch(self):
+        other = StateStore(self.path)
+
+        with self.state.batch():
+            self.state.set('a', 1, sync=True)
+            self.assertEqual(other.get('a'), 1)
+
+    def test_failed_flush_keeps_writes(self):
+        state = StateStore(self.path, timeout=0.1)
+        state.get('a', None)  # Create database
+
+        locker = sqlite3.connect(self.path, isolation_level=None)
+        locker.execute('BEGIN EXCLUSIVE')
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                state.set('a', 1)
+
+            self.assertEqual(state.get('a'), 1)
+
+        finally:
+            locker.execute('ROLLBACK')
+            locker.close()
+
+        state.set('b', 2)
+        self.assertEqual(StateStore(self.path).get('a'), 1)
+        self.assertEqual(StateStore(self.path).get('b'), 2)
+
+    def test_unencodable_value(self):
+        with self.state.batch():
+            with self.assertRaises(TypeError):
+                self.state.set_many({'a': 1, 'b': object()})
+
+            self.state.set('c', 3)
+
+        self.assertEqual(self.state.get('a', None), None)
+        self.assertEqual(StateStore(self.path).get('c'), 3)
+
+    def test_get_prefix(self):
+        self.state.set_many({
+            'cron.taskstate.foo.x': 1,
+            'cron.taskstate.foo.y.z': 2,
+            'cron.taskstate.foo_bar.x': 3,
+        })
+
+        with self.state.batch():
+            self.state.set('cron.taskstate.foo.w', 4)
+
+            self.assertEqual(
+                self.state.get_prefix('cron.taskstate.foo.'),
+                {'x': 1, 'y.z': 2, 'w': 4}
+            )
+            self.assertEqual(
+                self.state.get_prefix('cron.taskstate.foo.',
+                                      unflatten_=True),
+                {'x': 1, 'y': {'z': 2}, 'w': 4}
+            )
+
+    def test_migrate_json(self):
+        json_path = os.path.join(self.tmpdir, 'state.json')
+        with open(json_path, 'w') as fh:
+            json.dump({'cron': {'taskstate': {'foo': {'x': 1}}}}, fh)
+
+        self.assertTrue(self.state.migrate_json(json_path))
+        self.assertFalse(os.path.exists(json_path))
+        self.assertEqual(self.state.get('cron.taskstate.foo.x'), 1)
+        self.assertFalse(self.state.migrate_json(json_path))
+
+    def test_migrate_corrupt_json(self):
+        json_path = os.path.join(self.tmpdir, 'state.json')
+        with open(json_path, 'w') as fh:
+            fh.write('{garbage')
+
+        state = StateStore(self.path, logger=logging.getLogger('test'))
+        with self.assertLogs('test', level='WARNING'):
+            self.assertTrue(state.migrate_json(json_path))
+
+        self.assertTrue(os.path.exists(json_path + '.migrated'))
+
+
+if __name__ == '__main__':
+    unittest.main()
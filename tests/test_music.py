@@ -22,16 +22,55 @@ import unittest
 from housekeeper import core
 
 
+import argparse
+import collections
+import contextlib
+import io
+
+
+from housekeeper.plugins import music
+
+
 class TestApp(core.Core):
     pass
 
 class FooTest(unittest.TestCase):
     def test_x(self):
         app = TestApp({
-            'plugin.mpris2.enabled': True
+            'plugin.mpris2.enabled': True,
             'plugin.httpapi.enabled': True
         })
 
 
+Item = collections.namedtuple('Item', ['id', 'name'])
+
+
+class FakeBridge:
+    def search(self, query):
+        return [Item('1', query + ' one'), Item('2', query + ' two')]
+
+
+class MusicCommandTest(unittest.TestCase):
+    def setUp(self):
+        # Skip Applet.__init__, it needs the full appkit machinery
+        self.music = music.MusicApplet.__new__(music.MusicApplet)
+        self.music.appbridge = FakeBridge()
+        self.music._parent = None
+
+        search = music.MusicSearch.__new__(music.MusicSearch)
+        search._parent = self.music
+        search.children = {}
+        self.music.children = {'search': search}
+
+    def test_search(self):
+        arguments = argparse.Namespace(child='search', query='x')
+        buff = io.StringIO()
+        with contextlib.redirect_stdout(buff):
+            self.music.execute(None, arguments)
+
+        self.assertIn("'name':\t'x one'", buff.getvalue())
+        self.assertIn("'name':\t'x two'", buff.getvalue())
+
+
 if __name__ == '__main__':
     unittest.main()
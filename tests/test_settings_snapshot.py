@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2015 Luis López <luis@cuarentaydos.com>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+
+import unittest
+
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+
+from housekeeper import kit
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.configfile = os.path.join(self.tmpdir, 'housekeeper.yml')
+        self.snapshot_dir = os.path.join(self.tmpdir, 'snapshots')
+        self.snapshot_file = os.path.join(
+            self.snapshot_dir,
+            hashlib.sha1(os.path.realpath(self.configfile).encode('utf-8'))
+            .hexdigest())
+
+        self.write_config('a: {b: 1}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_config(self, buff, mtime=None):
+        with open(self.configfile, 'w') as fh:
+            fh.write(buff)
+
+        if mtime:
+            os.utime(self.configfile, (mtime, mtime))
+
+    def load(self):
+        store = kit.YAMLStore()
+        store.load_file(self.configfile, snapshot_dir=self.snapshot_dir)
+        return store
+
+    def test_snapshot_written(self):
+        self.assertEqual(self.load().get('a.b'), 1)
+        self.assertTrue(os.path.exists(self.snapshot_file))
+        self.assertEqual(self.load().get('a.b'), 1)
+
+    def test_stale(self):
+        self.load()
+        self.write_config('a: {b: 2}\n', mtime=1000000000)
+        self.assertEqual(self.load().get('a.b'), 2)
+
+    def test_touched_reuses_data(self):
+        self.load()
+        with open(self.snapshot_file, 'rb') as fh:
+            snapshot = pickle.load(fh)
+
+        # Same contents, different mtime: data comes from the snapshot
+        snapshot['data'] = {'a.b': 'from-snapshot'}
+        with open(self.snapshot_file, 'wb') as fh:
+            pickle.dump(snapshot, fh)
+
+        os.utime(self.configfile, (1000000000, 1000000000))
+        self.assertEqual(self.load().get('a.b'), 'from-snapshot')
+
+    def assertMiss(self, buff):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with open(self.snapshot_file, 'wb') as fh:
+            fh.write(buff)
+
+        self.assertEqual(self.load().get('a.b'), 1)
+
+        # Snapshot is rewritten
+        with open(self.snapshot_file, 'rb') as fh:
+            self.assertEqual(pickle.load(fh)['data'], {'a.b': 1})
+
+    def test_corrupt(self):
+        self.load()
+        with open(self.snapshot_file, 'rb') as fh:
+            buff = fh.read()
+
+        self.assertMiss(buff[:len(buff) // 2])
+        self.assertMiss(b'garbage')
+
+    def test_foreign(self):
+        self.assertMiss(pickle.dumps(['not', 'a', 'snapshot']))
+        self.assertMiss(pickle.dumps({'version': 1}))
+
+    def test_missing_digest(self):
+        st = os.stat(self.configfile)
+        self.assertMiss(pickle.dumps({
+            'version': kit.YAMLStore.SNAPSHOT_VERSION,
+            'mtime': st.st_mtime_ns,
+            'size': st.st_size,
+            'data': {'a.b': 'bogus'}
+        }))
+
+    def test_other_version(self):
+        st = os.stat(self.configfile)
+        self.assertMiss(pickle.dumps({
+            'version': -1,
+            'mtime': st.st_mtime_ns,
+            'size': st.st_size,
+            'digest': '',
+            'data': {'a.b': 'bogus'}
+        }))
+
+
+if __name__ == '__main__':
+    unittest.main()
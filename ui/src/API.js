@@ -56,6 +56,16 @@ class API {
             });
         });
     }
+
+    // calls: [{path, method, params}], resolves to a list (in the same
+    // order) of {status, result} or {status, error}
+    batch(calls) {
+        return this.post('_/batch', calls.map((call) => ({
+            path: call.path,
+            method: call.method || 'GET',
+            params: call.params || {}
+        })));
+    }
 }
 
 export default API;